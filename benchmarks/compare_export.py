@@ -0,0 +1,82 @@
+"""Benchmark of the figure export of `ragulate compare`.
+
+Writes the figures of synthetic chart data for a number of datasets, once
+serially and once on a process pool, and prints how long each took:
+
+    python benchmarks/compare_export.py --datasets 10 --output histogram-grid
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from ragulate.analysis import Analysis
+
+FEEDBACKS = ["answer_correctness", "answer_relevance", "context_relevance"]
+
+
+def make_charts(
+    datasets: int, recipes: int, records: int
+) -> Dict[str, Tuple[pd.DataFrame, List[str]]]:
+    rng = np.random.default_rng(seed=0)
+    charts: Dict[str, Tuple[pd.DataFrame, List[str]]] = {}
+    for d in range(datasets):
+        dataset = f"dataset_{d}"
+        df = pd.DataFrame(
+            {
+                "record_id": [f"record_{i}" for i in range(records * recipes)],
+                "recipe": np.repeat([f"recipe_{r}" for r in range(recipes)], records),
+                "dataset": dataset,
+                "latency": rng.gamma(2.0, 2.0, size=records * recipes),
+                **{f: rng.random(records * recipes) for f in FEEDBACKS},
+            }
+        )
+        charts[dataset] = (df, list(FEEDBACKS))
+    return charts
+
+
+def time_export(
+    charts: Dict[str, Tuple[pd.DataFrame, List[str]]], output: str, workers: int
+) -> float:
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            start = time.perf_counter()
+            Analysis().export_figures(charts=charts, output=output, max_workers=workers)
+            return time.perf_counter() - start
+        finally:
+            os.chdir(cwd)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--datasets", type=int, default=10)
+    parser.add_argument("--recipes", type=int, default=4)
+    parser.add_argument("--records", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--output", type=str, default="box-plots")
+    args = parser.parse_args()
+
+    charts = make_charts(
+        datasets=args.datasets, recipes=args.recipes, records=args.records
+    )
+    serial = time_export(charts, output=args.output, workers=1)
+    parallel = time_export(charts, output=args.output, workers=args.workers)
+    print(f"{args.output} for {args.datasets} datasets:")
+    print(f"  serial:             {serial:.2f}s")
+    print(f"  {args.workers} workers:          {parallel:.2f}s")
+    print(f"  speedup:            {serial / parallel:.1f}x")
+    if (os.cpu_count() or 1) <= 1:
+        print("  (one CPU, so both runs were serial)")
+
+
+if __name__ == "__main__":
+    main()
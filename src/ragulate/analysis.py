@@ -1,7 +1,12 @@
 from __future__ import annotations
 
-from typing import Any, Dict, Set
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Set, Tuple
 
+import matplotlib
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
@@ -9,40 +14,82 @@ import plotly.graph_objects as go
 import seaborn as sns
 from plotly.io import write_image
 
-from ragulate.data import get_chart_data, get_datasets_and_metadata
+from ragulate.data import (
+    bin_chart_data,
+    get_chart_data,
+    get_datasets_and_metadata,
+    get_paired_data,
+)
+from ragulate.latency_report import (
+    latency_quality_tradeoffs,
+    latency_report,
+    stage_latency_report,
+)
+from ragulate.significance import confidence_intervals, paired_tests
+
+FIGURE_OUTPUTS = ["box-plots", "histogram-grid"]
+
+OUTPUTS = [*FIGURE_OUTPUTS, "significance", "latency-report"]
+
+DEFAULT_EXPORT_WORKERS = 4
+
+
+def recipe_colors(count: int) -> list[str]:
+    """Colors for `count` recipes, the same in every chart."""
+    # generate an array of rainbow colors by fixing the saturation and lightness of
+    # the HSL representation of color and marching around the hue.
+    return ["hsl(" + str(h) + ",50%" + ",50%)" for h in np.linspace(0, 360, count + 1)]
 
 
 class Analysis:
     """Analysis class."""
 
+    def statistics_table(self, df: pd.DataFrame, feedbacks: list[str]) -> pd.DataFrame:
+        """Statistics table, with a row per recipe, dataset and metric."""
+        recipes = df["recipe"].unique()
+        datasets = df["dataset"].unique()
+
+        # one pass over all the values, grouped by recipe, dataset and metric
+        values = df.melt(
+            id_vars=["recipe", "dataset"],
+            value_vars=feedbacks,
+            var_name="metric",
+            value_name="value",
+        )
+        grouped = values.groupby(["recipe", "dataset", "metric"])["value"]
+        stats = grouped.agg(high="max", low="min", median="median", mean="mean")
+        quartiles = (
+            grouped.quantile([0.25, 0.75]).unstack().reindex(columns=[0.25, 0.75])
+        )
+        stats["1st_quartile"] = quartiles[0.25]
+        stats["3rd_quartile"] = quartiles[0.75]
+
+        # recipes without records for a dataset get empty statistics
+        index = pd.MultiIndex.from_product(
+            [recipes, datasets, feedbacks], names=["recipe", "dataset", "metric"]
+        )
+        return stats.reindex(index).reset_index()
+
     def calculate_statistics(
         self, df: pd.DataFrame, feedbacks: list[str]
     ) -> dict[str, Any]:
         """Calculate statistics."""
         stats: dict[str, Any] = {}
-        for recipe in df["recipe"].unique():
-            stats[recipe] = {}
-            for feedback in feedbacks:
-                stats[recipe][feedback] = {}
-                for dataset in df["dataset"].unique():
-                    data = df[(df["recipe"] == recipe) & (df["dataset"] == dataset)][
-                        feedback
-                    ]
-                    stats[recipe][feedback][dataset] = {
-                        "high": data.max(),
-                        "low": data.min(),
-                        "median": data.median(),
-                        "mean": data.mean(),
-                        "1st_quartile": data.quantile(0.25),
-                        "3rd_quartile": data.quantile(0.75),
-                    }
+        for row in self.statistics_table(df, feedbacks).to_dict("records"):
+            recipe = stats.setdefault(row.pop("recipe"), {})
+            feedback = recipe.setdefault(row.pop("metric"), {})
+            feedback[row.pop("dataset")] = row
         return stats
 
     def box_plots_by_dataset(
         self, df: pd.DataFrame, feedbacks: list[str]
     ) -> Dict[str, go.Figure]:
         """Output box plots by dataset."""
-        stats = self.calculate_statistics(df, feedbacks)
+        stats = (
+            self.statistics_table(df, feedbacks)
+            .set_index(["recipe", "dataset", "metric"])
+            .sort_index()
+        )
         recipes = sorted(df["recipe"].unique(), key=lambda x: x.lower())
         datasets = sorted(df["dataset"].unique(), key=lambda x: x.lower())
         feedbacks = sorted(feedbacks)
@@ -52,12 +99,7 @@ class Analysis:
         for feedback in feedbacks:
             longest_feedback = max(longest_feedback, len(feedback))
 
-        # generate an array of rainbow colors by fixing the saturation and lightness of
-        # the HSL representation of color and marching around the hue.
-        c = [
-            "hsl(" + str(h) + ",50%" + ",50%)"
-            for h in np.linspace(0, 360, len(recipes) + 1)
-        ]
+        c = recipe_colors(len(recipes))
 
         height = max((len(feedbacks) * len(recipes) * 20) + 150, 450)
 
@@ -66,22 +108,13 @@ class Analysis:
         for dataset in datasets:
             fig = go.Figure()
             for test_index, recipe in enumerate(recipes):
-                y = []
-                x = []
-                q1 = []
-                median = []
-                q3 = []
-                low = []
-                high = []
-                for feedback in feedbacks:
-                    stat = stats[recipe][feedback][dataset]
-                    y.append(feedback)
-                    x.append(stat["mean"])
-                    q1.append(stat["1st_quartile"])
-                    median.append(stat["median"])
-                    q3.append(stat["3rd_quartile"])
-                    low.append(stat["low"])
-                    high.append(stat["high"])
+                stat = stats.loc[(recipe, dataset)].reindex(feedbacks)
+                y = feedbacks
+                q1 = stat["1st_quartile"].tolist()
+                median = stat["median"].tolist()
+                q3 = stat["3rd_quartile"].tolist()
+                low = stat["low"].tolist()
+                high = stat["high"].tolist()
 
                 fig.add_trace(
                     go.Box(
@@ -141,62 +174,38 @@ class Analysis:
         self, df: pd.DataFrame, feedbacks: list[str]
     ) -> Dict[str, sns.FacetGrid]:
         """Output histograms by dataset."""
-        # Append "latency" to the feedbacks list
-        feedbacks.append("latency")
-
-        # Get unique datasets
-        datasets = df["dataset"].unique()
+        # only the counts of each bin are drawn, not the values themselves
+        binned = bin_chart_data(df=df, feedbacks=feedbacks)
 
         figures: Dict[str, sns.FacetGrid] = {}
 
-        for dataset in datasets:
+        for dataset in binned["dataset"].unique():
             # Filter DataFrame for the current dataset
-            df_filtered = df[df["dataset"] == dataset]
-
-            # Melt the DataFrame to long format
-            df_melted = pd.melt(
-                df_filtered,
-                id_vars=["record_id", "recipe", "dataset"],
-                value_vars=feedbacks,
-                var_name="metric",
-                value_name="value",
-            )
+            df_filtered = binned[binned["dataset"] == dataset]
 
             # Set the theme for the plot
             sns.set_theme(style="darkgrid")
 
-            # Custom function to set bin ranges and filter invalid values
-            def custom_hist(data: dict[str, Any], **kws: Any) -> None:
-                feedback = data["metric"].iloc[0]
-                data = data[
-                    np.isfinite(data["value"])
-                ]  # Remove NaN and infinite values
-                data = data[data["value"] >= 0]  # Ensure no negative values
-                if feedback == "latency":
-                    bins = np.concatenate(
-                        [
-                            np.linspace(
-                                0,
-                                15,
-                            ),
-                            [np.inf],
-                        ]
-                    )  # 46 bins from 0 to 15 seconds, plus one for >15 seconds
-                    sns.histplot(data, x="value", bins=bins, stat="percent", **kws)
-                else:
-                    bin_range = (0, 1)
-                    sns.histplot(
-                        data,
-                        x="value",
-                        stat="percent",
-                        bins=10,
-                        binrange=bin_range,
-                        **kws,
-                    )
+            # Custom function to draw the pre-binned percentages
+            def draw_bins(data: pd.DataFrame, **kws: Any) -> None:
+                start = data["bin_start"].to_numpy()
+                end = data["bin_end"].to_numpy(copy=True)
+                # the open ended last latency bin is drawn as wide as the others
+                open_ended = ~np.isfinite(end)
+                end[open_ended] = start[open_ended] + (end[0] - start[0])
+                plt.gca().bar(
+                    start,
+                    data["percent"],
+                    width=end - start,
+                    align="edge",
+                    alpha=0.75,
+                    edgecolor="white",
+                    **kws,
+                )
 
             # Create the FacetGrid
             g = sns.FacetGrid(
-                df_melted,
+                df_filtered,
                 col="metric",
                 row="recipe",
                 margin_titles=True,
@@ -208,8 +217,8 @@ class Analysis:
 
             g.set_titles(row_template="{row_name}", col_template="{col_name}")
 
-            # Map the custom histogram function to the FacetGrid
-            g.map_dataframe(custom_hist)
+            # Map the custom drawing function to the FacetGrid
+            g.map_dataframe(draw_bins)
 
             for ax, feedback in zip(
                 g.axes.flat, g.col_names * len(g.row_names), strict=False
@@ -244,20 +253,193 @@ class Analysis:
             # Close the plot to avoid displaying it
             plt.close()
 
-    def compare(self, recipes: list[str], output: str = "box-plots") -> None:
-        """Compare results from 2 (or more) recipes."""
+    def load_chart_data(
+        self, recipes: list[str]
+    ) -> Dict[str, Tuple[pd.DataFrame, list[str]]]:
+        """Load the chart data of each dataset the recipes were run on."""
         unique_datasets: Set[str] = set()
         for recipe in recipes:
             datasets = get_datasets_and_metadata(recipe=recipe).keys()
             unique_datasets = unique_datasets.union(datasets)
 
-        for dataset in unique_datasets:
-            df, feedbacks = get_chart_data(
+        # each recipe's rows for a dataset are read once, from its snapshot
+        return {
+            dataset: get_chart_data(
                 recipes=recipes, dataset=dataset, metadata_filter={}
             )
-            if output == "box-plots":
-                self.output_box_plots_by_dataset(df=df, feedbacks=feedbacks)
-            elif output == "histogram-grid":
-                self.output_histograms_by_dataset(df=df, feedbacks=feedbacks)
-            else:
-                raise ValueError(f"Invalid output type: {output}")
+            for dataset in sorted(unique_datasets)
+        }
+
+    def export_figures(
+        self,
+        charts: Dict[str, Tuple[pd.DataFrame, list[str]]],
+        output: str,
+        max_workers: int = DEFAULT_EXPORT_WORKERS,
+    ) -> None:
+        """Write the figures of each dataset, on a pool of processes.
+
+        With one worker, or one CPU, the figures are written in this process.
+        """
+        if output not in FIGURE_OUTPUTS:
+            raise ValueError(f"Invalid output type: {output}")
+
+        workers = min(max_workers, len(charts), os.cpu_count() or 1)
+        if workers <= 1:
+            for df, feedbacks in charts.values():
+                _export_figures(output, df, feedbacks)
+            return
+
+        # each worker keeps its own kaleido process, for all the figures it writes.
+        # Workers are spawned rather than forked: this process may be running
+        # threads (kaleido's, or a thread pool's) whose locks a fork would copy
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_export_worker,
+        ) as executor:
+            futures = [
+                executor.submit(_export_figures, output, df, feedbacks)
+                for df, feedbacks in charts.values()
+            ]
+            for future in futures:
+                future.result()
+
+    def significance_by_dataset(
+        self,
+        recipes: list[str],
+        dataset: str,
+        df: pd.DataFrame,
+        feedbacks: list[str],
+        metadata_filter: Dict[str, Any] | None = None,
+    ) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """Confidence intervals of each recipe, and paired tests between them."""
+        intervals = confidence_intervals(
+            df=df, metrics=feedbacks + ["total_tokens", "latency"]
+        )
+        paired_df, metrics = get_paired_data(
+            recipes=recipes, dataset=dataset, metadata_filter=metadata_filter or {}
+        )
+        tests = paired_tests(df=paired_df, recipes=recipes, metrics=metrics)
+        tests.insert(0, "dataset", dataset)
+        return intervals, tests
+
+    def output_significance_by_dataset(
+        self, recipes: list[str], charts: Dict[str, Tuple[pd.DataFrame, list[str]]]
+    ) -> None:
+        for dataset, (df, feedbacks) in charts.items():
+            intervals, tests = self.significance_by_dataset(
+                recipes=recipes, dataset=dataset, df=df, feedbacks=feedbacks
+            )
+            intervals.to_csv(f"./{dataset}_confidence_intervals.csv", index=False)
+            tests.to_csv(f"./{dataset}_paired_tests.csv", index=False)
+
+    def latency_report_by_dataset(
+        self, df: pd.DataFrame, feedbacks: list[str]
+    ) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+        """Latency and throughput of each recipe, per stage, and vs quality."""
+        return (
+            latency_report(df),
+            stage_latency_report(df),
+            latency_quality_tradeoffs(df, feedbacks),
+        )
+
+    def stage_latency_by_dataset(self, df: pd.DataFrame) -> Dict[str, go.Figure]:
+        """Bar charts of the p50 (and p95) latency of each stage, by dataset."""
+        report = stage_latency_report(df)
+        recipes = sorted(report["recipe"].unique(), key=lambda x: x.lower())
+        c = recipe_colors(len(recipes))
+
+        figures: Dict[str, go.Figure] = {}
+        for dataset, stages in report.groupby("dataset"):
+            fig = go.Figure()
+            for recipe_index, recipe in enumerate(recipes):
+                stage = stages[stages["recipe"] == recipe]
+                fig.add_trace(
+                    go.Bar(
+                        y=stage["stage"],
+                        x=stage["latency_p50"],
+                        error_x={
+                            "type": "data",
+                            "symmetric": False,
+                            "array": stage["latency_p95"] - stage["latency_p50"],
+                            "arrayminus": [0] * len(stage),
+                        },
+                        orientation="h",
+                        name=recipe,
+                        marker_color=c[recipe_index],
+                    )
+                )
+            fig.update_layout(
+                barmode="group",
+                height=max(len(recipes) * 80 + 150, 350),
+                width=900,
+                title={
+                    "text": f"{dataset} (p50, with p95 whiskers)",
+                    "x": 0.03,
+                    "y": 0.03,
+                    "xanchor": "left",
+                    "yanchor": "bottom",
+                },
+                yaxis_title="stage",
+                xaxis_title="seconds",
+                legend={
+                    "orientation": "h",
+                    "yanchor": "bottom",
+                    "y": 1.02,
+                    "xanchor": "right",
+                    "x": 1,
+                },
+            )
+            figures[str(dataset)] = fig
+        return figures
+
+    def output_latency_report(
+        self, charts: Dict[str, Tuple[pd.DataFrame, list[str]]]
+    ) -> None:
+        report: Dict[str, Any] = {}
+        for dataset, (df, feedbacks) in charts.items():
+            latency, stages, tradeoffs = self.latency_report_by_dataset(
+                df=df, feedbacks=feedbacks
+            )
+            latency.to_csv(f"./{dataset}_latency_report.csv", index=False)
+            stages.to_csv(f"./{dataset}_stage_latency.csv", index=False)
+            tradeoffs.to_csv(f"./{dataset}_latency_quality.csv", index=False)
+            report[dataset] = {
+                "latency": json.loads(latency.to_json(orient="records")),
+                "stages": json.loads(stages.to_json(orient="records")),
+                "latency_quality": json.loads(tradeoffs.to_json(orient="records")),
+            }
+
+        with open("./latency_report.json", "w") as f:
+            json.dump(report, f, indent=2)
+
+    def compare(
+        self,
+        recipes: list[str],
+        output: str = "box-plots",
+        max_workers: int = DEFAULT_EXPORT_WORKERS,
+    ) -> None:
+        """Compare results from 2 (or more) recipes."""
+        if output not in OUTPUTS:
+            raise ValueError(f"Invalid output type: {output}")
+
+        charts = self.load_chart_data(recipes=recipes)
+        if output in FIGURE_OUTPUTS:
+            self.export_figures(charts=charts, output=output, max_workers=max_workers)
+        elif output == "significance":
+            self.output_significance_by_dataset(recipes=recipes, charts=charts)
+        elif output == "latency-report":
+            self.output_latency_report(charts=charts)
+
+
+def _init_export_worker() -> None:
+    # figures are only written to files, so no gui backend is needed
+    matplotlib.use("Agg")
+
+
+def _export_figures(output: str, df: pd.DataFrame, feedbacks: list[str]) -> None:
+    analysis = Analysis()
+    if output == "box-plots":
+        analysis.output_box_plots_by_dataset(df=df, feedbacks=feedbacks)
+    elif output == "histogram-grid":
+        analysis.output_histograms_by_dataset(df=df, feedbacks=feedbacks)
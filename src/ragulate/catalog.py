@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+from ragulate.data import get_all_recipes, get_datasets_and_metadata
+from ragulate.logging_config import logger
+from ragulate.snapshots import database_signature
+
+CATALOG_PATH = os.path.join(".ragulate", "catalog.json")
+
+DEFAULT_MAX_WORKERS = 8
+
+# dataset -> metadata of the recipe app for it
+RecipeDatasets = dict[str, dict[str, Any]]
+
+_lock = threading.Lock()
+
+
+class RecipeCatalog:
+    """Index of the datasets (and their metadata) in each recipe database.
+
+    The index is a json file with one entry per recipe, holding its datasets
+    and the signature (inode, size and mtime of the database and its WAL) they
+    were read at. `refresh` only opens the databases that are new or changed
+    since, on a thread pool, so listing hundreds of recipes on a slow share
+    costs one stat per database when nothing changed.
+    """
+
+    path: str
+    max_workers: int
+
+    def __init__(
+        self, path: str = CATALOG_PATH, max_workers: int = DEFAULT_MAX_WORKERS
+    ):
+        self.path = path
+        self.max_workers = max_workers
+
+    def _read_index(self) -> dict[str, dict[str, Any]]:
+        try:
+            with open(self.path) as f:
+                index: dict[str, dict[str, Any]] = json.load(f)
+                return index
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError):
+            logger.warning(f"Ignoring unreadable catalog {self.path}")
+            return {}
+
+    def _write_index(self, index: dict[str, dict[str, Any]]) -> None:
+        directory = os.path.dirname(self.path) or "."
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".catalog")
+            with os.fdopen(fd, "w") as f:
+                json.dump(index, f, indent=2, sort_keys=True)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            # for example a read only working directory, so the databases are
+            # read again on the next refresh
+            logger.warning(f"Could not write catalog {self.path}: {e}")
+
+    def _signature(self, recipe: str) -> list[Any]:
+        # as it is stored in json, so it can be compared with the index
+        database, wal = database_signature(recipe)
+        return [list(database), None if wal is None else list(wal)]
+
+    def _read_recipe(self, recipe: str) -> dict[str, Any] | None:
+        try:
+            # read through the read only connections: listing never writes
+            signature = self._signature(recipe)
+            datasets = get_datasets_and_metadata(recipe=recipe)
+        except sqlite3.Error as e:
+            # for example, TruLens hasn't created its tables yet
+            logger.warning(f"Could not read the datasets of recipe {recipe}: {e}")
+            return None
+        return {"signature": signature, "datasets": datasets}
+
+    def refresh(self) -> dict[str, RecipeDatasets]:
+        """Returns the datasets of each recipe, reading only changed databases"""
+        with _lock:
+            index = self._read_index()
+            recipes = get_all_recipes()
+
+            stale: list[str] = []
+            for recipe in recipes:
+                entry = index.get(recipe)
+                try:
+                    signature = self._signature(recipe)
+                except sqlite3.OperationalError:
+                    continue
+                if entry is None or entry.get("signature") != signature:
+                    stale.append(recipe)
+
+            updated = {
+                recipe: entry for recipe, entry in index.items() if recipe in recipes
+            }
+            if len(stale) > 0:
+                workers = max(1, min(self.max_workers, len(stale)))
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    for recipe, entry in zip(
+                        stale, executor.map(self._read_recipe, stale), strict=True
+                    ):
+                        if entry is None:
+                            updated.pop(recipe, None)
+                        else:
+                            updated[recipe] = entry
+                logger.debug(f"Refreshed the catalog entries of {stale}")
+
+            if updated != index:
+                self._write_index(updated)
+            return {
+                recipe: updated[recipe]["datasets"]
+                for recipe in recipes
+                if recipe in updated
+            }
+
+
+def get_recipe_catalog() -> dict[str, RecipeDatasets]:
+    """Returns the datasets of each recipe in the working directory"""
+    return RecipeCatalog().refresh()
@@ -28,6 +28,8 @@ def main() -> None:
     cli_commands.setup_compare(subparsers=subparsers)
     cli_commands.setup_run(subparsers=subparsers)
     cli_commands.setup_debug(subparsers=subparsers)
+    cli_commands.setup_registry(subparsers=subparsers)
+    cli_commands.setup_schema(subparsers=subparsers)
 
     # Parse the command-line arguments
     args = parser.parse_args()
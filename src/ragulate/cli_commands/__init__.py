@@ -3,7 +3,9 @@ from .debug import setup_debug
 from .download import setup_download
 from .ingest import setup_ingest
 from .query import setup_query
+from .registry import setup_registry
 from .run import setup_run
+from .schema import setup_schema
 
 __all__ = [
     "setup_compare",
@@ -11,5 +13,7 @@ __all__ = [
     "setup_download",
     "setup_ingest",
     "setup_query",
+    "setup_registry",
     "setup_run",
+    "setup_schema",
 ]
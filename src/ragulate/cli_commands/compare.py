@@ -24,15 +24,28 @@ def setup_compare(subparsers) -> None:  # type: ignore[no-untyped-def]
         "-o",
         "--output",
         type=str,
-        help="The output method. Either box-plots (default) or histogram-grid",
+        help=(
+            "The output method. Either box-plots (default), histogram-grid, "
+            "significance (confidence intervals and paired tests, as csv files) "
+            "or latency-report (latency percentiles and throughput, as csv and "
+            "json files)"
+        ),
         default="box-plots",
     )
+    compare_parser.add_argument(
+        "-p",
+        "--parallel",
+        type=int,
+        help="The maximum number of datasets to write figures for at once, default 4",
+        default=4,
+    )
     compare_parser.set_defaults(func=lambda args: call_compare(**vars(args)))
 
 
 def call_compare(
     recipe: list[str],
     output: str = "box-plots",
+    parallel: int = 4,
     **_: Any,
 ) -> None:
     """Compare results from 2 (or more) recipes."""
@@ -40,4 +53,4 @@ def call_compare(
 
     recipes = [remove_sqlite_extension(r) for r in recipe]
 
-    analysis.compare(recipes=recipes, output=output)
+    analysis.compare(recipes=recipes, output=output, max_workers=parallel)
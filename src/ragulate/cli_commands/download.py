@@ -1,16 +1,20 @@
+import argparse
+import sys
 from typing import Any
 
-from ragulate.datasets import get_dataset
+from ragulate.datasets import dataset_parameters, download_datasets, get_dataset
+from ragulate.utils import convert_vars_to_ingredients
 
 
 def setup_download(subparsers) -> None:  # type: ignore[no-untyped-def]
     """Setup the download command."""
-    download_parser = subparsers.add_parser("download", help="Download a dataset")
+    download_parser = subparsers.add_parser("download", help="Download datasets")
     download_parser.add_argument(
         "dataset_name",
         type=str,
+        nargs="+",
         help=(
-            "The name of the dataset you want to download, "
+            "The names of the datasets you want to download, "
             "such as `PaulGrahamEssayDataset`."
         ),
     )
@@ -18,13 +22,61 @@ def setup_download(subparsers) -> None:  # type: ignore[no-untyped-def]
         "-k",
         "--kind",
         type=str,
-        help="The kind of dataset to download. Currently only `llama` is supported",
+        help="The kind of the datasets to download, such as `llama`, `crag` or "
+        "`synthetic`",
         required=True,
     )
-    download_parser.set_defaults(func=lambda args: call_download(**vars(args)))
+    download_parser.add_argument(
+        "--var-name",
+        type=str,
+        help="The name of a dataset parameter, such as `num_queries` for synthetic "
+        "datasets. This should be paired with a `--var-value` argument and can be "
+        "passed multiple times.",
+        action="append",
+        default=[],
+    )
+    download_parser.add_argument(
+        "--var-value",
+        type=str,
+        help="The value of a dataset parameter. This should be paired with a "
+        "`--var-name` argument and can be passed multiple times.",
+        action="append",
+        default=[],
+    )
+    download_parser.add_argument(
+        "-p",
+        "--parallel",
+        type=int,
+        help="The maximum number of datasets to download at once, default 4",
+        default=4,
+    )
+    download_parser.set_defaults(
+        func=lambda args: call_download(**vars(args), parser=download_parser)
+    )
 
 
-def call_download(dataset_name: str, kind: str, **_: Any) -> None:
-    """Download a dataset."""
-    dataset = get_dataset(name=dataset_name, kind=kind)
-    dataset.download_dataset()
+def call_download(
+    dataset_name: list[str],
+    kind: str,
+    parallel: int,
+    var_name: list[str],
+    var_value: list[str],
+    parser: argparse.ArgumentParser,
+    **_: Any,
+) -> None:
+    """Download datasets concurrently."""
+    params = convert_vars_to_ingredients(var_names=var_name, var_values=var_value)
+    accepted = dataset_parameters(kind)
+    unknown = sorted(set(params) - set(accepted))
+    if len(unknown) > 0:
+        if len(accepted) == 0:
+            parser.error(f"{kind} datasets don't take `--var-name` parameters")
+        parser.error(
+            f"{kind} datasets don't take {', '.join(unknown)}, "
+            f"only {', '.join(accepted)}"
+        )
+    datasets = [get_dataset(name=name, kind=kind, **params) for name in dataset_name]
+    # each failure is logged (with its traceback) by download_datasets
+    failures = download_datasets(datasets=datasets, max_workers=parallel)
+    if len(failures) > 0:
+        sys.exit(1)
@@ -0,0 +1,28 @@
+from typing import Any
+
+from ragulate.datasets import DatasetRegistry
+from ragulate.logging_config import logger
+
+
+def setup_registry(subparsers) -> None:  # type: ignore[no-untyped-def]
+    """Setup the rebuild-registry command."""
+    registry_parser = subparsers.add_parser(
+        "rebuild-registry",
+        help="Rebuild the registry of downloaded datasets",
+    )
+    registry_parser.add_argument(
+        "--root",
+        type=str,
+        help="The directory datasets are stored in, default `datasets`",
+        default="datasets",
+    )
+    registry_parser.set_defaults(func=lambda args: call_registry(**vars(args)))
+
+
+def call_registry(root: str, **_: Any) -> None:
+    """Rebuild the dataset registry, including datasets copied in by hand."""
+    registry = DatasetRegistry(root_storage_path=root)
+    entries = registry.rebuild()
+    for name, entry in entries.items():
+        logger.info(f"Registered {entry.kind} dataset {name} at {entry.path}")
+    logger.info(f"Wrote {len(entries)} datasets to {registry.manifest_path}")
@@ -4,6 +4,7 @@ from typing import Any
 
 from ragulate.analysis import Analysis
 from ragulate.config import ConfigParser
+from ragulate.datasets import download_datasets
 from ragulate.logging_config import logger
 from ragulate.pipelines import IngestPipeline, QueryPipeline
 
@@ -21,10 +22,17 @@ def setup_run(subparsers) -> None:  # type: ignore[no-untyped-def]
             "experiment."
         ),
     )
+    run_parser.add_argument(
+        "-p",
+        "--parallel",
+        type=int,
+        help="The maximum number of datasets to download at once, default 4",
+        default=4,
+    )
     run_parser.set_defaults(func=lambda args: call_run(**vars(args)))
 
 
-def call_run(config_file: str, **_: Any) -> None:
+def call_run(config_file: str, parallel: int = 4, **_: Any) -> None:
     """Run an experiment from a config file."""
     config_parser = ConfigParser.from_file(file_path=config_file)
     config = config_parser.get_config()
@@ -32,8 +40,11 @@ def call_run(config_file: str, **_: Any) -> None:
     ingest_pipelines: list[IngestPipeline] = []
     query_pipelines: list[QueryPipeline] = []
 
-    for dataset in config.datasets.values():
-        dataset.download_dataset()
+    failures = download_datasets(
+        datasets=list(config.datasets.values()), max_workers=parallel
+    )
+    if len(failures) > 0:
+        raise ValueError(f"Could not download datasets: {sorted(failures)}")
 
     for name, recipe in config.recipes.items():
         if recipe.ingest is not None:
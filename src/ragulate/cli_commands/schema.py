@@ -0,0 +1,34 @@
+from typing import Any
+
+from ragulate.data import get_all_recipes
+from ragulate.logging_config import logger
+from ragulate.schema import ensure_schema
+
+
+def setup_schema(subparsers) -> None:  # type: ignore[no-untyped-def]
+    """Setup the update-schema command."""
+    schema_parser = subparsers.add_parser(
+        "update-schema",
+        help="Add the ragulate tables and indexes to recipe databases",
+    )
+    schema_parser.add_argument(
+        "recipes",
+        type=str,
+        nargs="*",
+        help="The recipes to update, default all the recipes in the current directory",
+    )
+    schema_parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Check the schema of each recipe again, and rebuild it if incomplete",
+    )
+    schema_parser.set_defaults(func=lambda args: call_schema(**vars(args)))
+
+
+def call_schema(recipes: list[str], force: bool, **_: Any) -> None:
+    """Create the ragulate schema in recipe databases written by older versions."""
+    for recipe in recipes or get_all_recipes():
+        if ensure_schema(recipe=recipe, force=force):
+            logger.info(f"Recipe {recipe} is up to date")
+        else:
+            logger.warning(f"Could not update the schema of recipe {recipe}")
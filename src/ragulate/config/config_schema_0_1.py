@@ -4,7 +4,7 @@ from typing import Any
 
 from typing_extensions import override
 
-from ragulate.datasets import BaseDataset, find_dataset, get_dataset
+from ragulate.datasets import DATASET_KINDS, BaseDataset, find_dataset, get_dataset
 
 from .base_config_schema import BaseConfigSchema
 from .objects import Config, Recipe, Step
@@ -67,7 +67,7 @@ class ConfigSchema0Dot1(BaseConfigSchema):
             },
         }
 
-        datasets_kinds = ["llama"]
+        datasets_kinds = list(DATASET_KINDS)
 
         dataset_list = {
             "type": "list",
@@ -79,6 +79,11 @@ class ConfigSchema0Dot1(BaseConfigSchema):
                         "schema": {
                             "name": {"type": "string"},
                             "kind": {"type": "string", "allowed": datasets_kinds},
+                            # parameters of `local` datasets
+                            "path": {"type": "string"},
+                            "query_column": {"type": "string"},
+                            "answer_column": {"type": "string"},
+                            "metadata_columns": {"type": ["string", "list"]},
                         },
                     }
                 },
@@ -238,8 +243,13 @@ class ConfigSchema0Dot1(BaseConfigSchema):
                     raise ValueError(
                         "datasets must be specified with `name` and `kind`"
                     )
+                params = {
+                    key: value
+                    for key, value in doc_dataset.items()
+                    if key not in ("name", "kind")
+                }
                 datasets[doc_dataset_name] = get_dataset(
-                    name=doc_dataset_name, kind=doc_dataset_kind
+                    name=doc_dataset_name, kind=doc_dataset_kind, **params
                 )
 
         return Config(recipes=recipes, datasets=datasets)
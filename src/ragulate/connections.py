@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Generator
+
+from ragulate.schema import recipe_database_path
+
+# memory map up to 256MB of each database, and cache up to 16MB of pages
+DEFAULT_MMAP_SIZE = 256 * 1024 * 1024
+DEFAULT_CACHE_SIZE_KB = 16 * 1024
+# compiled statements kept per connection, keyed by their sql text
+DEFAULT_CACHED_STATEMENTS = 256
+
+FileIdentity = tuple[int, int]
+
+
+class ReadConnectionPool:
+    """Pool of read only connections to recipe databases.
+
+    Connections are kept open between calls, so their parsed schema, page cache
+    and compiled statements survive across UI reruns. A connection is only used
+    by one thread at a time: each call checks one out, and returns it when
+    done. Connections to a database file that has since been replaced are
+    closed instead of being reused.
+
+    Nothing is ever written through the pool, not even the ragulate schema
+    (see `ensure_schema`), so a recipe being run can be read at any time.
+    """
+
+    max_idle: int
+    mmap_size: int
+    cache_size_kb: int
+    cached_statements: int
+
+    def __init__(
+        self,
+        max_idle: int = 4,
+        mmap_size: int = DEFAULT_MMAP_SIZE,
+        cache_size_kb: int = DEFAULT_CACHE_SIZE_KB,
+        cached_statements: int = DEFAULT_CACHED_STATEMENTS,
+    ):
+        self.max_idle = max_idle
+        self.mmap_size = mmap_size
+        self.cache_size_kb = cache_size_kb
+        self.cached_statements = cached_statements
+        self._lock = threading.Lock()
+        self._idle: dict[str, list[tuple[FileIdentity, sqlite3.Connection]]] = {}
+
+    def _connect(self, database_path: str) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            f"file:{database_path}?mode=ro",
+            uri=True,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+        )
+        conn.execute("PRAGMA query_only = ON")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        conn.execute(f"PRAGMA cache_size = -{int(self.cache_size_kb)}")
+        return conn
+
+    def _checkout(
+        self, database_path: str, identity: FileIdentity
+    ) -> sqlite3.Connection | None:
+        stale: list[sqlite3.Connection] = []
+        found: sqlite3.Connection | None = None
+        with self._lock:
+            idle = self._idle.get(database_path, [])
+            while len(idle) > 0:
+                conn_identity, conn = idle.pop()
+                if conn_identity == identity:
+                    found = conn
+                    break
+                stale.append(conn)
+        for conn in stale:
+            conn.close()
+        return found
+
+    def _checkin(
+        self, database_path: str, identity: FileIdentity, conn: sqlite3.Connection
+    ) -> None:
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            idle = self._idle.setdefault(database_path, [])
+            if len(idle) < self.max_idle:
+                idle.append((identity, conn))
+                return
+        conn.close()
+
+    @contextmanager
+    def connection(self, recipe: str) -> Generator[sqlite3.Connection, None, None]:
+        """Checks out a read only connection to a recipe database"""
+        database_path = os.path.abspath(recipe_database_path(recipe))
+        try:
+            stat = os.stat(database_path)
+        except FileNotFoundError:
+            raise sqlite3.OperationalError(
+                f"unable to open database file: {database_path}"
+            ) from None
+        identity = (stat.st_dev, stat.st_ino)
+
+        conn = self._checkout(database_path, identity)
+        if conn is None:
+            conn = self._connect(database_path)
+
+        healthy = False
+        try:
+            yield conn
+            healthy = True
+        finally:
+            if healthy:
+                self._checkin(database_path, identity, conn)
+            else:
+                conn.close()
+
+    def close(self) -> None:
+        """Closes all idle connections"""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for _, conn in connections:
+                conn.close()
+
+
+_pool = ReadConnectionPool()
+
+
+def get_connection_pool() -> ReadConnectionPool:
+    """Returns the read connection pool shared by the data layer"""
+    return _pool
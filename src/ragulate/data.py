@@ -3,14 +3,65 @@ import json
 import os
 import sqlite3
 import sys
-from collections import defaultdict
+import threading
+from collections import OrderedDict, defaultdict
 from contextlib import contextmanager
-from typing import Any, Dict, Generator, List, Set, Tuple
+from typing import Any, Dict, Generator, List, Sequence, Set, Tuple
 
+import numpy as np
 import pandas as pd
-from pandas import Index
 
-from ragulate.datasets import find_dataset
+from ragulate.connections import get_connection_pool
+from ragulate.datasets import (
+    DatasetRegistry,
+    GoldenSet,
+    decode_json_string,
+    find_dataset,
+)
+from ragulate.recipe_session import RecipeSession
+from ragulate.record_details import RecordDetailCache
+from ragulate.schema import (
+    RECORD_METADATA_TABLE,
+    RECORD_STAGES_TABLE,
+    has_record_metadata,
+    has_record_stages,
+)
+from ragulate.snapshots import (
+    STAGE_COLUMNS,
+    database_signature,
+    filter_by_metadata,
+    load_snapshot,
+)
+
+# 10 bins over the [0, 1] range of the feedback scores
+SCORE_BINS = np.linspace(0, 1, 11)
+# 49 bins from 0 to 15 seconds, plus one for more than 15 seconds
+LATENCY_BINS = np.concatenate([np.linspace(0, 15), [np.inf]])
+
+# compare frames (sorted and searched, without outputs) kept in memory, so
+# paging through one only slices it
+MEMORY_COMPARE_FRAMES = 8
+
+_compare_frames_lock = threading.Lock()
+_compare_frames: OrderedDict[Tuple[Any, ...], Tuple[pd.DataFrame, List[str]]] = (
+    OrderedDict()
+)
+
+# ground truths of datasets kept in memory, so pages don't load the datasets
+MEMORY_GOLDEN_SETS = 4
+
+_golden_sets_lock = threading.Lock()
+_golden_sets: OrderedDict[Tuple[str, str, str | None], GoldenSet] = OrderedDict()
+
+HISTOGRAM_COLUMNS = [
+    "dataset",
+    "recipe",
+    "metric",
+    "bin_start",
+    "bin_end",
+    "count",
+    "percent",
+]
 
 
 def get_all_recipes() -> List[str]:
@@ -24,23 +75,24 @@ def print_err(any: Any) -> None:
     print(any, file=sys.stderr)
 
 
-def get_conn(recipe: str) -> sqlite3.Connection:
-    # Connect to the database in read-only mode using URI
-    return sqlite3.connect(f"file:{recipe}.sqlite?mode=ro", uri=True)
+@contextmanager
+def get_conn(recipe: str) -> Generator[sqlite3.Connection, None, None]:
+    # Check out a pooled read-only connection, returned to the pool when done
+    with get_connection_pool().connection(recipe=recipe) as conn:
+        yield conn
 
 
 @contextmanager
-def query_database(recipe: str, query: str) -> Generator[sqlite3.Cursor, None, None]:
-    # Connect to the database in read-only mode using URI
-    conn = get_conn(recipe=recipe)
-
-    try:
+def query_database(
+    recipe: str, query: str, params: Sequence[Any] = ()
+) -> Generator[sqlite3.Cursor, None, None]:
+    with get_conn(recipe=recipe) as conn:
         cursor = conn.cursor()
-        cursor.execute(query)
-        yield cursor
-    finally:
-        # Ensure the connection is closed when the generator is done
-        conn.close()
+        try:
+            cursor.execute(query, params)
+            yield cursor
+        finally:
+            cursor.close()
 
 
 def get_datasets_and_metadata(recipe: str) -> Dict[str, Dict[str, Any]]:
@@ -61,17 +113,47 @@ def get_datasets_and_metadata(recipe: str) -> Dict[str, Dict[str, Any]]:
 
 
 def get_metadata_options_for_recipe(recipe: str, dataset: str) -> Dict[str, List[Any]]:
-    query = f"""
+    unique_values = defaultdict(set)
+    with get_conn(recipe=recipe) as conn:
+        if not has_record_metadata(conn):
+            return _scan_metadata_options(conn=conn, dataset=dataset)
+
+        # read the distinct values from the metadata index
+        query = f"""
+            SELECT DISTINCT
+                key, value, type
+            FROM
+                {RECORD_METADATA_TABLE}
+            WHERE
+                app_id = ?
+        """
+        for key, value, value_type in conn.execute(query, [dataset]):
+            if value_type in ("true", "false"):
+                value = value_type == "true"
+            unique_values[key].add(value)
+
+    # Convert sets to lists
+    return {str(key): list(values) for key, values in unique_values.items()}
+
+
+def _scan_metadata_options(
+    conn: sqlite3.Connection, dataset: str
+) -> Dict[str, List[Any]]:
+    # Fallback for databases without the metadata table (the ragulate schema
+    # wasn't created in them), which decodes the metadata of every record
+    query = """
         SELECT
             json_extract(record_json, '$.meta') as metadata
         FROM
             trulens_records
         WHERE
-            app_id = "{dataset}"
+            app_id = ?
     """
     unique_values = defaultdict(set)
     standard_types = (int, float, str, bool)
-    with query_database(recipe=recipe, query=query) as cursor:
+    cursor = conn.cursor()
+    try:
+        cursor.execute(query, [dataset])
         while True:
             rows = cursor.fetchmany(100)  # Fetch 100 rows at a time
             if not rows:
@@ -81,101 +163,30 @@ def get_metadata_options_for_recipe(recipe: str, dataset: str) -> Dict[str, List
                 for key, value in metadata.items():
                     if isinstance(value, standard_types):
                         unique_values[key].add(value)
+    finally:
+        cursor.close()
 
     # Convert sets to lists
     return {str(key): list(values) for key, values in unique_values.items()}
 
 
 def decode_utf8(text: str) -> str:
-    return (
-        text.encode("utf-8")
-        .decode("unicode_escape")
-        .removeprefix('"')
-        .removesuffix('"')
-    )
-
-
-def get_data_for_recipe(
-    recipe: str,
-    dataset: str,
-    metadata_filter: Dict[str, Any] = {},
-    include_in_and_out: bool = False,
-) -> Tuple[pd.DataFrame, List[str]]:
-    conn = get_conn(recipe=recipe)
-
-    try:
-        feedbacks = []
-        feedbacks_query = f"""
-            SELECT DISTINCT
-                json_extract(feedback_json, '$.supplied_name') as name
-            FROM
-                trulens_feedback_defs
-            """
-        cursor = conn.cursor()
-        cursor.execute(feedbacks_query)
-        for row in cursor.fetchall():
-            feedbacks.append(row[0])
-
-        cursor.close()
-
-        selects = [
-            "r.record_id",
-            "json_extract(r.record_json, '$.meta') AS metadata",
-            "json_extract(r.cost_json, '$.n_tokens') AS total_tokens",
-            "(julianday(json_extract(r.perf_json, '$.end_time')) - julianday(json_extract(r.perf_json, '$.start_time'))) * 86400 AS latency",
-        ]
-
-        if include_in_and_out:
-            selects.extend(["r.input", "r.output"])
-
-        joins = []
-        for i, feedback in enumerate(feedbacks):
-            selects.append(f"f{i}.result AS {feedback}")
-            joins.append(
-                f"LEFT JOIN trulens_feedbacks f{i} ON r.record_id = f{i}.record_id AND f{i}.status = 'done' AND f{i}.name = '{feedback}'"
-            )
-
-        wheres = [f"r.app_id = '{dataset}'"]
-
-        for key, value in metadata_filter.items():
-            wheres.append(f"json_extract(r.record_json, '$.meta.{key}') = '{value}'")
-
-        chart_data_query = f"""
-            SELECT
-                {',\n                '.join(selects)}
-            FROM
-                trulens_records r
-                {'\n                '.join(joins)}
-            WHERE
-                {'\n                AND '.join(wheres)}
-            """
-
-        df = pd.read_sql_query(sql=chart_data_query, con=conn)
-
-        if include_in_and_out:
-            df["input"] = df["input"].apply(decode_utf8)
-            df["output"] = df["output"].apply(decode_utf8)
-
-        return df, feedbacks
-    finally:
-        conn.close()
+    return decode_json_string(text)
 
 
 def get_details_for_record(recipe: str, record_id: str) -> Dict[str, Any]:
-    conn = get_conn(recipe=recipe)
-
-    try:
-        contexts_query = f"""
+    with get_conn(recipe=recipe) as conn:
+        contexts_query = """
             SELECT
                 json_extract(record_json, '$.calls') AS calls
             FROM
                 trulens_records
             WHERE
-                record_id = '{record_id}'
+                record_id = ?
             """
 
         cursor = conn.cursor()
-        cursor.execute(contexts_query)
+        cursor.execute(contexts_query, [record_id])
         context_calls = cursor.fetchone()
 
         contexts: List[Any] = []
@@ -191,7 +202,7 @@ def get_details_for_record(recipe: str, record_id: str) -> Dict[str, Any]:
                     break
         cursor.close
 
-        calls_query = f"""
+        calls_query = """
             SELECT
                 json_extract(value, '$.meta.reason') as reason,
                 json_extract(value, '$.meta.reasons') as reasons,
@@ -202,10 +213,10 @@ def get_details_for_record(recipe: str, record_id: str) -> Dict[str, Any]:
                 trulens_feedbacks,
                 json_each(calls_json, '$.calls')
             WHERE
-                record_id = '{record_id}'
+                record_id = ?
             """
         cursor = conn.cursor()
-        cursor.execute(calls_query)
+        cursor.execute(calls_query, [record_id])
 
         calls: Dict[str, List[Dict[str, Any]]] = {}
 
@@ -226,13 +237,26 @@ def get_details_for_record(recipe: str, record_id: str) -> Dict[str, Any]:
                 }
             )
 
+        # seconds spent in each stage of the chain, if the timings are indexed
+        stages: Dict[str, float] = {}
+        if has_record_stages(conn):
+            cursor = conn.cursor()
+            cursor.execute(
+                f"SELECT stage, seconds FROM {RECORD_STAGES_TABLE} WHERE record_id = ?",
+                [record_id],
+            )
+            stages = dict(cursor.fetchall())
+            cursor.close()
+
         return {
             "contexts": contexts,
             "calls": calls,
+            "stages": stages,
         }
 
-    finally:
-        conn.close()
+
+# details of recently selected (or prefetched) records
+_detail_cache = RecordDetailCache(load=get_details_for_record)
 
 
 DataFrameList = List[pd.DataFrame]
@@ -282,69 +306,171 @@ def find_common_strings(list_of_lists: List[List[str]]) -> List[str]:
     return list(common_strings)
 
 
-def get_compare_data(
-    recipes: List[str], dataset: str, metadata_filter: Dict[str, Any]
-) -> Tuple[pd.DataFrame, List[str]]:
-    df_list: List[pd.DataFrame] = []
-    feedbacks_list: List[List[str]] = []
+def get_golden_set(dataset: str, root_storage_path: str = "datasets") -> GoldenSet:
+    """Returns the ground truth answers of a dataset, indexed by query
 
-    for recipe in recipes:
-        df, feedbacks = get_data_for_recipe(
-            recipe=recipe,
-            dataset=dataset,
-            metadata_filter=metadata_filter,
-            include_in_and_out=True,
-        )
-        df_list.append(df)
-        feedbacks_list.append(feedbacks)
+    The index is kept in memory, and only built again when the dataset's
+    checksum in the registry changes (it is re-downloaded).
+    """
+    entry = DatasetRegistry(root_storage_path=root_storage_path).get(dataset)
+    key = (
+        os.path.abspath(root_storage_path),
+        dataset,
+        None if entry is None else entry.checksum,
+    )
+    with _golden_sets_lock:
+        golden_set = _golden_sets.get(key)
+        if golden_set is not None:
+            _golden_sets.move_to_end(key)
+            return golden_set
+
+    golden_set = find_dataset(
+        name=dataset, root_storage_path=root_storage_path
+    ).get_golden_set_index()
+
+    with _golden_sets_lock:
+        _golden_sets[key] = golden_set
+        _golden_sets.move_to_end(key)
+        while len(_golden_sets) > MEMORY_GOLDEN_SETS:
+            _golden_sets.popitem(last=False)
+    return golden_set
+
+
+def _order_compare_columns(
+    df: pd.DataFrame, recipes: List[str], dataset: str
+) -> pd.DataFrame:
+    golden_set = get_golden_set(dataset=dataset)
+    df["ground_truth"] = df["input"].map(golden_set.get, na_action="ignore")
 
-    feedbacks = find_common_strings(feedbacks_list)
+    # Reorder the columns
+    output_columns = [f"output_{recipe}" for recipe in recipes]
+    remaining_columns = sorted(
+        [
+            col
+            for col in df.columns
+            if col not in ["input", "ground_truth"] + output_columns
+        ]
+    )
 
-    for i, (df, recipe) in enumerate(zip(df_list, recipes)):
-        if i > 0:
-            df.drop(columns=["metadata"], inplace=True)
+    return df[["input", "ground_truth"] + output_columns + remaining_columns]
 
-        df.columns = Index(
-            [
-                f"{col}_{recipe}" if col not in ["input", "metadata"] else col
-                for col in df.columns
-            ]
-        )
 
-    combined_df = df_list[0]
-    for df in df_list[1:]:
-        combined_df = combined_df.merge(df, on="input", how="outer")
+def get_paired_data(
+    recipes: List[str], dataset: str, metadata_filter: Dict[str, Any]
+) -> Tuple[pd.DataFrame, List[str]]:
+    """Returns the compare data without any text, and the compared metrics
 
-    ground_truths: Dict[str, str] = {}
-    for query_response in find_dataset(name=dataset).get_golden_set():
-        ground_truths[query_response["query"]] = query_response["response"]
+    There is a row per query, with the `<metric>_<recipe>` columns of
+    `get_compare_page`, for pairing up the results of recipes.
+    """
+    with RecipeSession(
+        recipes=recipes, dataset=dataset, metadata_filter=metadata_filter
+    ) as session:
+        metrics = session.common_feedbacks() + ["total_tokens", "latency"]
+        return session.compare_frame(columns_to_diff=metrics), metrics
 
-    combined_df["ground_truth"] = combined_df["input"].map(ground_truths)
 
-    columns_to_diff = feedbacks + ["total_tokens", "latency"]
+def get_outputs(recipe: str, record_ids: List[str]) -> Dict[str, str | None]:
+    """Returns the (decoded) outputs of some records of a recipe, by record id"""
+    if len(record_ids) == 0:
+        return {}
+    query = """
+        SELECT
+            record_id, output
+        FROM
+            trulens_records
+        WHERE
+            record_id IN (SELECT value FROM json_each(?))
+        """
+    with query_database(
+        recipe=recipe, query=query, params=[json.dumps(record_ids)]
+    ) as cursor:
+        return {
+            record_id: None if output is None else decode_utf8(output)
+            for record_id, output in cursor.fetchall()
+        }
 
-    # If there are exactly two dataframes, calculate the differences
-    if len(df_list) == 2:
-        for col in columns_to_diff:
-            combined_df[f"{col}__diff"] = (
-                combined_df[f"{col}_{recipes[0]}"] - combined_df[f"{col}_{recipes[1]}"]
-            )
 
-    # Reorder the columns
-    output_columns = [f"output_{recipe}" for recipe in recipes]
-    remaining_columns = sorted(
-        [
-            col
-            for col in combined_df.columns
-            if col not in ["input", "ground_truth"] + output_columns
-        ]
+def _get_compare_frame(
+    recipes: List[str],
+    dataset: str,
+    metadata_filter: Dict[str, Any],
+    search: str | None,
+    sort_by: str | None,
+    ascending: bool,
+) -> Tuple[pd.DataFrame, List[str]]:
+    # the recipes are only staged again when their databases changed
+    key = (
+        tuple(recipes),
+        dataset,
+        json.dumps(metadata_filter, sort_keys=True, default=str),
+        tuple(database_signature(recipe) for recipe in recipes),
+        search or None,
+        sort_by,
+        ascending,
     )
+    with _compare_frames_lock:
+        cached = _compare_frames.get(key)
+        if cached is not None:
+            _compare_frames.move_to_end(key)
+            return cached
+
+    with RecipeSession(
+        recipes=recipes, dataset=dataset, metadata_filter=metadata_filter
+    ) as session:
+        columns_to_diff = session.common_feedbacks() + ["total_tokens", "latency"]
+        frame = session.compare_frame(
+            columns_to_diff=columns_to_diff,
+            search=search,
+            sort_by=sort_by,
+            ascending=ascending,
+        )
 
-    combined_df = combined_df[
-        ["input", "ground_truth"] + output_columns + remaining_columns
-    ]
+    with _compare_frames_lock:
+        _compare_frames[key] = (frame, columns_to_diff)
+        _compare_frames.move_to_end(key)
+        while len(_compare_frames) > MEMORY_COMPARE_FRAMES:
+            _compare_frames.popitem(last=False)
+    return frame, columns_to_diff
 
-    return combined_df, columns_to_diff
+
+def get_compare_page(
+    recipes: List[str],
+    dataset: str,
+    metadata_filter: Dict[str, Any],
+    page: int,
+    page_size: int,
+    search: str | None = None,
+    sort_by: str | None = None,
+    ascending: bool = True,
+) -> Tuple[pd.DataFrame, List[str], int]:
+    """Returns one page of the compare data, the diffed columns and the row count
+
+    The recipes are joined, searched and sorted once for each search and sort
+    (and again when a recipe database changes), and pages are sliced from the
+    result. The outputs are only read from the recipe databases for the
+    records on the page.
+    """
+    frame, columns_to_diff = _get_compare_frame(
+        recipes=recipes,
+        dataset=dataset,
+        metadata_filter=metadata_filter,
+        search=search,
+        sort_by=sort_by,
+        ascending=ascending,
+    )
+    start = page * page_size
+    page_df = frame.iloc[start : start + page_size].reset_index(drop=True)
+    for recipe in recipes:
+        record_ids = page_df[f"record_id_{recipe}"]
+        outputs = get_outputs(recipe=recipe, record_ids=record_ids.dropna().tolist())
+        page_df[f"output_{recipe}"] = record_ids.map(outputs, na_action="ignore")
+
+    return (
+        _order_compare_columns(page_df, recipes, dataset),
+        columns_to_diff,
+        len(frame),
+    )
 
 
 def get_detail_data(
@@ -352,34 +478,88 @@ def get_detail_data(
 ) -> Dict[str, Dict[str, Any]]:
     results: Dict[str, Dict[str, Any]] = {}
     for record_id, recipe in zip(record_ids, recipes):
-        results[recipe] = get_details_for_record(record_id=record_id, recipe=recipe)
+        results[recipe] = _detail_cache.get(recipe=recipe, record_id=record_id)
     return results
 
 
+def prefetch_detail_data(record_ids: Dict[str, List[str]]) -> None:
+    """Loads the details of records in the background, by recipe"""
+    for recipe, ids in record_ids.items():
+        _detail_cache.prefetch(recipe=recipe, record_ids=ids)
+
+
 def get_chart_data(
     recipes: List[str], dataset: str, metadata_filter: Dict[str, Any]
 ) -> Tuple[pd.DataFrame, List[str]]:
-    df_all = pd.DataFrame()
-
+    df_list: List[pd.DataFrame] = []
     all_feedbacks: Set[str] = set()
 
     for recipe in recipes:
-        df, feedbacks = get_data_for_recipe(
-            recipe=recipe, dataset=dataset, metadata_filter=metadata_filter
+        df, feedbacks = load_snapshot(recipe=recipe, dataset=dataset)
+        df = filter_by_metadata(
+            df, recipe=recipe, dataset=dataset, metadata_filter=metadata_filter
         )
-        df["recipe"] = recipe
-        df["dataset"] = dataset
+        df = df[
+            [
+                "record_id",
+                "metadata",
+                "total_tokens",
+                "latency",
+                "completion_tokens",
+                "start_time",
+                *STAGE_COLUMNS,
+                *feedbacks,
+            ]
+        ]
 
         # set negative values to None
-        for feedback in feedbacks:
-            df.loc[df[feedback] < 0, feedback] = None
+        df = df.assign(**{f: df[f].mask(df[f] < 0) for f in feedbacks})
+        df["recipe"] = recipe
+        df["dataset"] = dataset
 
-        df_all = pd.concat([df_all, df], axis=0, ignore_index=True)
+        df_list.append(df)
         all_feedbacks = all_feedbacks.union(feedbacks)
 
-    reset_df = df_all.reset_index(drop=True)
+    if len(df_list) == 0:
+        return pd.DataFrame(), []
+
+    df_all = pd.concat(df_list, axis=0, ignore_index=True)
+
+    return df_all, sorted(list(all_feedbacks))
+
+
+def bin_chart_data(df: pd.DataFrame, feedbacks: List[str]) -> pd.DataFrame:
+    """Returns histogram counts of the feedbacks and latency of chart data
+
+    There is one row per dataset, recipe, metric and bin, with the share of
+    the recipe's (non negative) values in the bin as a percent. Feedbacks are
+    binned over `SCORE_BINS` and latency over `LATENCY_BINS`.
+    """
+    histograms: List[pd.DataFrame] = []
+    for (dataset, recipe), group in df.groupby(["dataset", "recipe"], sort=False):
+        for metric in [*feedbacks, "latency"]:
+            values = group[metric].to_numpy(dtype=float)
+            values = values[np.isfinite(values) & (values >= 0)]
+            bins = LATENCY_BINS if metric == "latency" else SCORE_BINS
+            counts, _ = np.histogram(values, bins=bins)
+            total = counts.sum()
+            histograms.append(
+                pd.DataFrame(
+                    {
+                        "dataset": dataset,
+                        "recipe": recipe,
+                        "metric": metric,
+                        "bin_start": bins[:-1],
+                        "bin_end": bins[1:],
+                        "count": counts,
+                        "percent": counts * 100 / total if total > 0 else 0.0,
+                    }
+                )
+            )
 
-    return reset_df, sorted(list(all_feedbacks))
+    if len(histograms) == 0:
+        return pd.DataFrame(columns=HISTOGRAM_COLUMNS)
+    return pd.concat(histograms, ignore_index=True)
 
 
 def get_metadata_options(recipes: List[str], dataset: str) -> Dict[str, Set[Any]]:
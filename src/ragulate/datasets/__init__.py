@@ -1,15 +1,39 @@
 from .base_dataset import BaseDataset, QueryItem
+from .cache import DatasetCache, detach_shared_files, get_shared_cache
 from .crag_dataset import CragDataset
+from .golden_set import GoldenSet, decode_json_string, normalize_query
 from .llama_dataset import LlamaDataset
+from .local_dataset import LocalDataset
+from .registry import DatasetRegistry, RegistryEntry
+from .synthetic_dataset import SyntheticDataset
 from .test_dataset import TestDataset
-from .utils import find_dataset, get_dataset
+from .utils import (
+    DATASET_KINDS,
+    dataset_parameters,
+    download_datasets,
+    find_dataset,
+    get_dataset,
+)
 
 __all__ = [
+    "DATASET_KINDS",
     "BaseDataset",
     "CragDataset",
+    "DatasetCache",
+    "DatasetRegistry",
+    "GoldenSet",
     "LlamaDataset",
+    "LocalDataset",
     "TestDataset",
     "QueryItem",
+    "RegistryEntry",
+    "SyntheticDataset",
+    "dataset_parameters",
+    "decode_json_string",
+    "detach_shared_files",
+    "download_datasets",
     "find_dataset",
     "get_dataset",
+    "get_shared_cache",
+    "normalize_query",
 ]
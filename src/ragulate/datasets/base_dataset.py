@@ -1,7 +1,9 @@
 import bz2
+import random
+import sys
 import tempfile
 from abc import ABC, abstractmethod
-from os import makedirs, path
+from os import makedirs, path, remove
 from pathlib import Path
 from typing import Any
 
@@ -9,33 +11,61 @@ import aiofiles
 import aiohttp
 from tqdm.asyncio import tqdm
 
+from .cache import get_shared_cache
+from .golden_set import GoldenSet
+from .registry import DatasetRegistry
+
 
 class QueryItem:
+    """A single query in a dataset, with its optional reference answer.
+
+    Items are slotted and their query strings (and metadata keys) are interned,
+    so large datasets don't pay for a per-instance dict or duplicate strings.
+    """
+
+    __slots__ = ("metadata", "query", "reference_answer")
+
     query: str
     metadata: dict[str, Any]
+    reference_answer: str | None
 
-    def __init__(self, query: str, metadata: dict[str, Any]):
-        self.query = query
-        self.metadata = metadata
+    def __init__(
+        self,
+        query: str,
+        metadata: dict[str, Any],
+        reference_answer: str | None = None,
+    ):
+        self.query = sys.intern(query)
+        self.metadata = {sys.intern(key): value for key, value in metadata.items()}
+        self.reference_answer = reference_answer
 
 
 class BaseDataset(ABC):
+    kind: str
     root_storage_path: str
     name: str
     _subsets: list[str] = []
     _query_items: list[QueryItem]
-    _golden_set: list[dict[str, str]]
+    _golden_set_index: GoldenSet | None
 
     def __init__(self, dataset_name: str, root_storage_path: str = "datasets"):
         self.name = dataset_name
         self.root_storage_path = root_storage_path
         self._query_items = []
-        self._golden_set = []
+        self._golden_set_index = None
 
     def storage_path(self) -> str:
         """Returns the path where dataset files should be stored"""
         return path.join(self.root_storage_path, self.sub_storage_path())
 
+    def dataset_path(self) -> str:
+        """Returns the path where this dataset's files are stored"""
+        return self.storage_path()
+
+    def register(self) -> None:
+        """Records this dataset in the registry manifest of its storage path"""
+        DatasetRegistry(root_storage_path=self.root_storage_path).register(self)
+
     def list_files_at_path(self, path: str) -> list[str]:
         """Lists all files at a path (excluding dot files)"""
         return [
@@ -65,20 +95,62 @@ class BaseDataset(ABC):
         """Gets a list of source file paths for for a dataset"""
 
     @abstractmethod
-    def _load_query_items_and_golden_set(self) -> None:
-        """Loads query_items and golden_set"""
+    def _load_query_items(self) -> None:
+        """Loads query_items, including their reference answers"""
 
     def get_query_items(self) -> list[QueryItem]:
         """Gets a list of query items for a dataset"""
         if len(self._query_items) == 0:
-            self._load_query_items_and_golden_set()
+            self._load_query_items()
         return self._query_items
 
-    def get_golden_set(self) -> list[dict[str, str]]:
-        """Gets the set of ground_truth answers for a dataset"""
-        if len(self._golden_set) == 0:
-            self._load_query_items_and_golden_set()
-        return self._golden_set
+    def sample_query_items(
+        self, sample_percent: float = 1.0, random_seed: int | None = None
+    ) -> list[QueryItem]:
+        """Gets a random sample of the query items for a dataset"""
+        if sample_percent <= 0 or sample_percent >= 1.0:
+            return self.get_query_items()
+
+        query_items = self.get_query_items()
+        indexes = self._sample_indexes(
+            count=len(query_items),
+            sample_percent=sample_percent,
+            random_seed=random_seed,
+        )
+        return [query_items[i] for i in indexes]
+
+    def _sample_indexes(
+        self, count: int, sample_percent: float, random_seed: int | None
+    ) -> list[int]:
+        """Picks the indexes of a random sample of `count` items"""
+        subset_size = int(sample_percent * count)
+        return random.Random(random_seed).sample(population=range(count), k=subset_size)
+
+    def get_golden_set(
+        self, query_items: list[QueryItem] | None = None
+    ) -> list[dict[str, str]]:
+        """Gets the set of ground_truth answers for a dataset
+
+        This is a view built from the query items (all of them, unless a subset
+        is passed), so the query strings are shared rather than stored twice.
+        """
+        if query_items is None:
+            query_items = self.get_query_items()
+        return [
+            {"query": item.query, "response": item.reference_answer}
+            for item in query_items
+            if item.reference_answer is not None
+        ]
+
+    def get_golden_set_index(self) -> GoldenSet:
+        """Gets the ground_truth answers for a dataset, indexed by query"""
+        if self._golden_set_index is None:
+            self._golden_set_index = GoldenSet(
+                (item.query, item.reference_answer)
+                for item in self.get_query_items()
+                if item.reference_answer is not None
+            )
+        return self._golden_set_index
 
     async def _download_file(
         self, session: aiohttp.ClientSession, url: str, temp_file_path: str
@@ -91,7 +163,7 @@ class BaseDataset(ABC):
                 total=file_size,
                 unit="B",
                 unit_scale=True,
-                desc=f'Downloading {url.split("/")[-1]}',
+                desc=f"Downloading {url.split('/')[-1]}",
             ) as progress_bar:
                 async with aiofiles.open(temp_file_path, "wb") as temp_file:
                     async for chunk in response.content.iter_chunked(chunk_size):
@@ -126,9 +198,20 @@ class BaseDataset(ABC):
             print(f"File {output_file_path} already exists. Skipping download.")
             return
 
+        cache = get_shared_cache()
+        if cache is not None and cache.fetch(url, output_file_path):
+            return
+
+        if path.lexists(output_file_path):
+            # may be linked into the shared cache, so replace rather than overwrite
+            remove(output_file_path)
+
         async with aiohttp.ClientSession() as session:
             with tempfile.NamedTemporaryFile(delete=False) as temp_file:
                 temp_file_path = temp_file.name
 
                 await self._download_file(session, url, temp_file_path)
                 await self._decompress_file(temp_file_path, output_file_path)
+
+        if cache is not None:
+            cache.store(url, output_file_path)
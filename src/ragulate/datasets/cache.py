@@ -0,0 +1,271 @@
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+from ..logging_config import logger
+from .registry import checksum_file
+
+if sys.platform != "win32":
+    import fcntl
+
+CACHE_ENV_VAR = "RAGULATE_SHARED_CACHE"
+
+_ENABLED_VALUES = ["1", "true", "yes", "on"]
+
+# ioctl that makes a file share the blocks of another (a reflink), on Linux
+_FICLONE = 0x40049409
+
+# how long to wait for the lock of the source index, before giving up
+INDEX_LOCK_TIMEOUT_SECONDS = 60.0
+
+
+def default_cache_root() -> str:
+    """Returns `$XDG_CACHE_HOME/ragulate`, defaulting to `~/.cache/ragulate`."""
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(cache_home, "ragulate")
+
+
+def get_shared_cache() -> DatasetCache | None:
+    """Returns the machine wide dataset cache, if it is enabled.
+
+    The cache is enabled by setting `RAGULATE_SHARED_CACHE`, either to a truthy
+    value to use the default location, or to the directory to use.
+    """
+    value = os.environ.get(CACHE_ENV_VAR, "").strip()
+    if value == "" or value.lower() in ["0", "false", "no", "off"]:
+        return None
+    if value.lower() in _ENABLED_VALUES:
+        return DatasetCache(root=default_cache_root())
+    return DatasetCache(root=os.path.expanduser(value))
+
+
+def _link(source: str, target: str) -> None:
+    """Links target to source, with a hardlink if possible, else a symlink."""
+    os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+    if os.path.lexists(target):
+        os.remove(target)
+    try:
+        os.link(source, target)
+    except OSError:
+        os.symlink(os.path.abspath(source), target)
+
+
+def _clone(source: str, target: str) -> None:
+    """Copies source to target, as a reflink where the filesystem supports it."""
+    if sys.platform == "win32":
+        shutil.copy2(source, target)
+        return
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+        except OSError:
+            shutil.copyfileobj(src, dst, length=1024 * 1024)
+    shutil.copystat(source, target)
+
+
+def _link_in_place(source: str, target: str) -> None:
+    """Replaces target with a link to source, so readers never see it missing."""
+    fd, temp_path = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(target)), prefix=".link"
+    )
+    os.close(fd)
+    os.remove(temp_path)
+    try:
+        try:
+            os.link(source, temp_path)
+        except OSError:
+            os.symlink(os.path.abspath(source), temp_path)
+        os.replace(temp_path, target)
+    except BaseException:
+        if os.path.lexists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def detach_shared_files(target_path: str, cache: DatasetCache | None = None) -> None:
+    """Removes files under target_path that are links into a shared cache.
+
+    Files fetched from (or stored in) the cache are links to its objects, so a
+    download that rewrote them in place would change the object for every
+    project. Removing them first makes the download write new files instead.
+    Other files, including the user's own hardlinks, are left alone.
+    """
+    if cache is None:
+        cache = get_shared_cache() or DatasetCache(root=default_cache_root())
+    cache.detach(target_path)
+
+
+class DatasetCache:
+    """Content addressed store for downloaded dataset files.
+
+    Files are stored once per machine at `<root>/objects/<sha256>`, and
+    `<root>/sources.json` maps each source (usually a url) to the files it
+    produced. Per-project `datasets` directories are then populated with links
+    into the store instead of fresh downloads.
+    """
+
+    root: str
+
+    def __init__(self, root: str):
+        self.root = root
+
+    @property
+    def index_path(self) -> str:
+        """Returns the path of the source index"""
+        return os.path.join(self.root, "sources.json")
+
+    def object_path(self, digest: str) -> str:
+        """Returns the path of a stored file by its content hash"""
+        return os.path.join(self.root, "objects", digest[:2], digest)
+
+    @contextmanager
+    def _index_lock(self) -> Iterator[None]:
+        """Holds the machine wide lock of the source index.
+
+        The index is shared by all the processes using the cache, so it is
+        locked with flock, or with an exclusively created lock file where flock
+        isn't available.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        lock_path = os.path.join(self.root, ".sources.lock")
+        if sys.platform != "win32":
+            with open(lock_path, "a") as lock_file:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+        else:
+            deadline = time.monotonic() + INDEX_LOCK_TIMEOUT_SECONDS
+            while True:
+                try:
+                    fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                    break
+                except FileExistsError:
+                    if time.monotonic() > deadline:
+                        raise TimeoutError(
+                            f"Timed out waiting for {lock_path}"
+                        ) from None
+                    time.sleep(0.05)
+            try:
+                yield
+            finally:
+                os.close(fd)
+                os.remove(lock_path)
+
+    def _read_index(self) -> dict[str, dict[str, str]]:
+        try:
+            with open(self.index_path) as f:
+                index: dict[str, dict[str, str]] = json.load(f)
+                return index
+        except FileNotFoundError:
+            return {}
+
+    def _write_index(self, index: dict[str, dict[str, str]]) -> None:
+        os.makedirs(self.root, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.root, prefix=".sources")
+        with os.fdopen(fd, "w") as f:
+            json.dump(index, f, indent=2, sort_keys=True)
+        os.replace(temp_path, self.index_path)
+
+    def _objects(self) -> tuple[str, set[tuple[int, int]]]:
+        """Returns the objects directory, and the (device, inode) of each object"""
+        objects_path = os.path.realpath(os.path.join(self.root, "objects"))
+        inodes: set[tuple[int, int]] = set()
+        for dir_path, _, file_names in os.walk(objects_path):
+            for file_name in file_names:
+                stat = os.stat(os.path.join(dir_path, file_name))
+                inodes.add((stat.st_dev, stat.st_ino))
+        return objects_path, inodes
+
+    def detach(self, target_path: str) -> None:
+        """Removes the files under target_path that link to stored objects."""
+        if os.path.isfile(target_path) or os.path.islink(target_path):
+            paths = [target_path]
+        else:
+            paths = [
+                os.path.join(dir_path, file_name)
+                for dir_path, _, file_names in os.walk(target_path)
+                for file_name in file_names
+            ]
+        objects_path, inodes = self._objects()
+        for file_path in paths:
+            if os.path.islink(file_path):
+                linked = os.path.realpath(file_path)
+                shared = os.path.dirname(os.path.dirname(linked)) == objects_path
+            else:
+                stat = os.stat(file_path)
+                shared = stat.st_nlink > 1 and (stat.st_dev, stat.st_ino) in inodes
+            if shared:
+                os.remove(file_path)
+
+    def fetch(self, source: str, target_path: str) -> bool:
+        """Populates target_path with the cached files for a source.
+
+        Returns False (and leaves target_path alone) if the source isn't cached.
+        """
+        files = self._read_index().get(source)
+        if files is None:
+            return False
+        if not all(os.path.isfile(self.object_path(d)) for d in files.values()):
+            return False
+
+        for relative_path, digest in files.items():
+            target = (
+                target_path
+                if relative_path == ""
+                else os.path.join(target_path, relative_path)
+            )
+            _link(self.object_path(digest), target)
+        logger.info(f"Linked {source} from shared cache {self.root}")
+        return True
+
+    def store(self, source: str, source_path: str) -> None:
+        """Adds the files downloaded from a source, and links them to the store.
+
+        `source_path` is a file or a directory of files.
+        """
+        if os.path.isfile(source_path):
+            paths = {"": source_path}
+        else:
+            paths = {}
+            for dir_path, _, file_names in os.walk(source_path):
+                for file_name in file_names:
+                    file_path = os.path.join(dir_path, file_name)
+                    paths[os.path.relpath(file_path, source_path)] = file_path
+
+        files: dict[str, str] = {}
+        for relative_path, file_path in paths.items():
+            digest = checksum_file(file_path)
+            object_path = self.object_path(digest)
+            if not os.path.exists(object_path):
+                os.makedirs(os.path.dirname(object_path), exist_ok=True)
+                fd, temp_path = tempfile.mkstemp(
+                    dir=os.path.dirname(object_path), prefix=f".{digest}"
+                )
+                os.close(fd)
+                # a copy, so the object never shares an inode with a file that
+                # is still being written
+                _clone(file_path, temp_path)
+                os.replace(temp_path, object_path)
+            # then the project's file becomes a link to the object too, so the
+            # first project shares its storage like the ones that fetch it.
+            # Downloads detach these links before writing again.
+            _link_in_place(object_path, file_path)
+            files[relative_path] = digest
+
+        # read, change and replace the index under the lock, so concurrent
+        # processes don't drop each other's sources
+        with self._index_lock():
+            index = self._read_index()
+            index[source] = files
+            self._write_index(index)
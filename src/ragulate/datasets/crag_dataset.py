@@ -6,6 +6,7 @@ from .base_dataset import BaseDataset, QueryItem
 
 
 class CragDataset(BaseDataset):
+    kind = "crag"
     _subset_kinds: list[str] = [
         "aggregation",
         "comparison",
@@ -41,15 +42,21 @@ class CragDataset(BaseDataset):
                 )
                 for url, output_file in zip(urls, output_files, strict=False)
             ]
-            asyncio.get_event_loop().run_until_complete(asyncio.gather(*tasks))
+
+            async def download_all() -> None:
+                await asyncio.gather(*tasks)
+
+            # run on a new event loop, so this also works from worker threads
+            asyncio.run(download_all())
+            self.register()
         else:
             raise NotImplementedError(f"Crag download not supported for {self.name}")
 
     def get_source_file_paths(self) -> list[str]:
         raise NotImplementedError("Crag source files are not yet supported")
 
-    def _load_query_items_and_golden_set(self) -> None:
-        """Loads query_items and golden_set"""
+    def _load_query_items(self) -> None:
+        """Loads query_items, including their reference answers"""
         for subset in self.subsets:
             if subset not in self._subset_kinds:
                 raise ValueError(
@@ -74,6 +81,6 @@ class CragDataset(BaseDataset):
                         QueryItem(
                             query=query,
                             metadata=data,
+                            reference_answer=answer,
                         )
                     )
-                    self._golden_set.append({"query": query, "response": answer})
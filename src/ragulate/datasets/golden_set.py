@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+import json
+import unicodedata
+from typing import Iterable, Iterator
+
+
+def decode_json_string(text: str) -> str:
+    """Decodes a JSON encoded string (as stored by TruLens), if it is one.
+
+    TruLens stores record inputs and outputs JSON encoded, so a query like
+    `Quéry` is stored as `"Qu\\u00e9ry"`. Text that isn't a quoted JSON string is
+    returned unchanged.
+    """
+    if len(text) >= 2 and text.startswith('"') and text.endswith('"'):  # noqa: PLR2004
+        try:
+            decoded = json.loads(text)
+        except json.JSONDecodeError:
+            return text[1:-1]
+        if isinstance(decoded, str):
+            return decoded
+    return text
+
+
+def normalize_query(query: str) -> str:
+    """Normalizes a (decoded) query, so equal queries compare equal.
+
+    Queries read back from TruLens are JSON encoded, decode them first with
+    `decode_json_string`. Normalizing doesn't decode, so a query that really
+    is quoted keeps its quotes.
+    """
+    return unicodedata.normalize("NFC", query.strip())
+
+
+class GoldenSet:
+    """Reference answers for a dataset, indexed by normalized query."""
+
+    __slots__ = ("_index",)
+
+    _index: dict[str, str]
+
+    def __init__(self, entries: Iterable[tuple[str, str]]):
+        self._index = {}
+        for query, response in entries:
+            self._index.setdefault(normalize_query(query), response)
+
+    def get(self, query: str) -> str | None:
+        """Gets the reference answer for a query, if there is one"""
+        return self._index.get(normalize_query(query))
+
+    def __contains__(self, query: object) -> bool:
+        return isinstance(query, str) and normalize_query(query) in self._index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._index)
+
+    def __len__(self) -> int:
+        return len(self._index)
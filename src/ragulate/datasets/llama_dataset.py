@@ -10,9 +10,11 @@ from llama_index.core.llama_dataset import download
 
 from ..logging_config import logger
 from .base_dataset import BaseDataset, QueryItem
+from .cache import detach_shared_files, get_shared_cache
 
 
 class LlamaDataset(BaseDataset):
+    kind = "llama"
     _llama_datasets_lfs_url: str
     _llama_datasets_source_files_tree_url: str
 
@@ -26,14 +28,24 @@ class LlamaDataset(BaseDataset):
     def sub_storage_path(self) -> str:
         return "llama"
 
-    def _get_dataset_path(self) -> str:
+    def dataset_path(self) -> str:
         folder = inflection.underscore(self.name)
         folder = folder.removesuffix("_dataset")
         return path.join(self.storage_path(), folder)
 
     def download_dataset(self) -> None:
         """Downloads a dataset locally"""
-        download_dir = self._get_dataset_path()
+        download_dir = self.dataset_path()
+
+        cache = get_shared_cache()
+        cache_source = f"{self._llama_datasets_lfs_url}/llama_datasets/{self.name}"
+        if cache is not None and cache.fetch(cache_source, download_dir):
+            self.register()
+            return
+
+        if path.exists(download_dir):
+            # the llama downloader rewrites existing files in place
+            detach_shared_files(download_dir, cache=cache)
 
         def download_by_name(name: str) -> None:
             download.download_llama_dataset(
@@ -58,23 +70,26 @@ class LlamaDataset(BaseDataset):
             else:
                 raise ValueError(f"Could not find {name} datset.")
 
+        if cache is not None:
+            cache.store(cache_source, download_dir)
+        self.register()
         logger.info(f"Successfully downloaded {self.name} to {download_dir}")
 
     def get_source_file_paths(self) -> list[str]:
         """Gets a list of source file paths for for a dataset"""
-        source_path = path.join(self._get_dataset_path(), "source_files")
+        source_path = path.join(self.dataset_path(), "source_files")
         return self.list_files_at_path(path=source_path)
 
-    def _load_query_items_and_golden_set(self) -> None:
-        """Loads query_items and golden_set"""
-        json_path = path.join(self._get_dataset_path(), "rag_dataset.json")
+    def _load_query_items(self) -> None:
+        """Loads query_items, including their reference answers"""
+        json_path = path.join(self.dataset_path(), "rag_dataset.json")
         with open(json_path) as f:
             examples = json.load(f)["examples"]
             for example in examples:
-                self._query_items.append(QueryItem(query=example["query"], metadata={}))
-                self._golden_set.append(
-                    {
-                        "query": example["query"],
-                        "response": example["reference_answer"],
-                    }
+                self._query_items.append(
+                    QueryItem(
+                        query=example["query"],
+                        metadata={},
+                        reference_answer=example["reference_answer"],
+                    )
                 )
@@ -0,0 +1,240 @@
+import csv
+import json
+import os
+import shutil
+from typing import Any, Iterator
+
+from ..logging_config import logger
+from .base_dataset import BaseDataset, QueryItem
+
+_PARAMS_FILE_NAME = "params.json"
+
+_FORMATS = {
+    ".jsonl": "jsonl",
+    ".ndjson": "jsonl",
+    ".csv": "csv",
+    ".parquet": "parquet",
+    ".pq": "parquet",
+}
+
+
+class LocalDataset(BaseDataset):
+    """Dataset of queries read from a local JSONL, CSV or Parquet file.
+
+    Rows are streamed (line by line, or row group by row group for Parquet) and
+    only the query, answer and metadata columns are read. Sampling picks row
+    numbers up front, so it never holds more than the sampled rows in memory.
+    """
+
+    kind = "local"
+
+    source_path: str | None
+    query_column: str
+    answer_column: str
+    metadata_columns: list[str] | None
+
+    def __init__(
+        self,
+        dataset_name: str,
+        root_storage_path: str = "datasets",
+        path: str | None = None,
+        query_column: str | None = None,
+        answer_column: str | None = None,
+        metadata_columns: str | list[str] | None = None,
+    ):
+        super().__init__(dataset_name=dataset_name, root_storage_path=root_storage_path)
+
+        # parameters default to the ones the dataset was imported with
+        params: dict[str, Any] = {}
+        params_path = self._params_path()
+        if os.path.exists(params_path):
+            with open(params_path) as f:
+                params = json.load(f)
+
+        self.source_path = (
+            os.path.abspath(path) if path is not None else params.get("path")
+        )
+        self.query_column = query_column or params.get("query_column", "query")
+        self.answer_column = answer_column or params.get("answer_column", "answer")
+
+        if metadata_columns is None:
+            metadata_columns = params.get("metadata_columns")
+        if isinstance(metadata_columns, str):
+            metadata_columns = [c.strip() for c in metadata_columns.split(",")]
+        self.metadata_columns = metadata_columns
+
+    def params(self) -> dict[str, Any]:
+        """Returns the import parameters"""
+        return {
+            "path": self.source_path,
+            "query_column": self.query_column,
+            "answer_column": self.answer_column,
+            "metadata_columns": self.metadata_columns,
+        }
+
+    def sub_storage_path(self) -> str:
+        return os.path.join("local", self.name)
+
+    def _params_path(self) -> str:
+        return os.path.join(self.storage_path(), _PARAMS_FILE_NAME)
+
+    def _file_format(self, file_path: str) -> str:
+        extension = os.path.splitext(file_path)[1].lower()
+        if extension not in _FORMATS:
+            raise ValueError(
+                f"Unsupported file type {extension} for local dataset {self.name}. "
+                f"Choices are {list(_FORMATS)}"
+            )
+        return _FORMATS[extension]
+
+    def queries_file_path(self) -> str:
+        """Returns the path of the imported queries file"""
+        for extension in _FORMATS:
+            file_path = os.path.join(self.storage_path(), f"queries{extension}")
+            if os.path.exists(file_path):
+                return file_path
+        raise ValueError(
+            f"Local dataset {self.name} has not been imported. Download it with "
+            "`--var-name path --var-value <queries file>`."
+        )
+
+    def download_dataset(self) -> None:
+        """Imports the queries file into the dataset directory"""
+        if self.source_path is None:
+            raise ValueError(
+                f"A `path` is required to import local dataset {self.name}"
+            )
+
+        extension = os.path.splitext(self.source_path)[1].lower()
+        self._file_format(self.source_path)
+        os.makedirs(self.storage_path(), exist_ok=True)
+
+        target_path = os.path.join(self.storage_path(), f"queries{extension}")
+        if os.path.lexists(target_path):
+            os.remove(target_path)
+        try:
+            os.link(self.source_path, target_path)
+        except OSError:
+            shutil.copy2(self.source_path, target_path)
+
+        with open(self._params_path(), "w") as f:
+            json.dump(self.params(), f, indent=2)
+
+        self.register()
+        logger.info(f"Imported {self.source_path} as local dataset {self.name}")
+
+    def get_source_file_paths(self) -> list[str]:
+        raise NotImplementedError("Local datasets don't have source files")
+
+    def _columns(self) -> list[str] | None:
+        """Returns the columns to read, or None to read all of them"""
+        if self.metadata_columns is None:
+            return None
+        return [self.query_column, self.answer_column, *self.metadata_columns]
+
+    def _iter_rows(self) -> Iterator[dict[str, Any]]:
+        """Streams the rows of the queries file, projected to the needed columns"""
+        file_path = self.queries_file_path()
+        file_format = self._file_format(file_path)
+        columns = self._columns()
+
+        if file_format == "parquet":
+            parquet = _import_parquet()
+            parquet_file = parquet.ParquetFile(file_path)
+            if columns is not None:
+                available = set(parquet_file.schema_arrow.names)
+                columns = [c for c in columns if c in available]
+            for batch in parquet_file.iter_batches(columns=columns):
+                yield from batch.to_pylist()
+            return
+
+        with open(file_path, newline="" if file_format == "csv" else None) as f:
+            rows: Iterator[dict[str, Any]] = (
+                csv.DictReader(f)
+                if file_format == "csv"
+                else (json.loads(line) for line in f if line.strip())
+            )
+            for row in rows:
+                if columns is not None:
+                    row = {c: row[c] for c in columns if c in row}
+                yield row
+
+    def _count_rows(self) -> int:
+        """Counts the rows of the queries file without parsing them"""
+        file_path = self.queries_file_path()
+        file_format = self._file_format(file_path)
+
+        if file_format == "parquet":
+            parquet = _import_parquet()
+            return int(parquet.ParquetFile(file_path).metadata.num_rows)
+        with open(file_path, newline="" if file_format == "csv" else None) as f:
+            if file_format == "csv":
+                # the csv reader handles quoted newlines, the first row is the header
+                # and, like DictReader, blank lines aren't rows
+                reader = csv.reader(f)
+                next(reader, None)
+                return sum(1 for row in reader if len(row) > 0)
+            return sum(1 for line in f if line.strip())
+
+    def _to_query_item(self, row: dict[str, Any]) -> QueryItem | None:
+        query = row.get(self.query_column)
+        if query is None:
+            return None
+        answer = row.get(self.answer_column)
+        metadata = {
+            key: value
+            for key, value in row.items()
+            if key not in (self.query_column, self.answer_column)
+        }
+        return QueryItem(
+            query=str(query),
+            metadata=metadata,
+            reference_answer=None if answer is None else str(answer),
+        )
+
+    def _load_query_items(self) -> None:
+        """Loads query_items, including their reference answers"""
+        for row in self._iter_rows():
+            query_item = self._to_query_item(row)
+            if query_item is not None:
+                self._query_items.append(query_item)
+
+    def sample_query_items(
+        self, sample_percent: float = 1.0, random_seed: int | None = None
+    ) -> list[QueryItem]:
+        """Gets a random sample of the query items, without loading all of them
+
+        Rows are sampled by row number, with the same selection as
+        `BaseDataset.sample_query_items` for files where every row has a query.
+        """
+        if sample_percent <= 0 or sample_percent >= 1.0 or len(self._query_items) > 0:
+            return super().sample_query_items(
+                sample_percent=sample_percent, random_seed=random_seed
+            )
+
+        indexes = self._sample_indexes(
+            count=self._count_rows(),
+            sample_percent=sample_percent,
+            random_seed=random_seed,
+        )
+        wanted = set(indexes)
+        sampled: dict[int, QueryItem] = {}
+        for row_number, row in enumerate(self._iter_rows()):
+            if row_number in wanted:
+                query_item = self._to_query_item(row)
+                if query_item is not None:
+                    sampled[row_number] = query_item
+                if len(sampled) == len(wanted):
+                    break
+        return [sampled[i] for i in indexes if i in sampled]
+
+
+def _import_parquet() -> Any:
+    try:
+        import pyarrow.parquet as pq  # noqa: PLC0415
+    except ImportError as e:
+        raise ImportError(
+            "Reading Parquet files requires pyarrow. Install it with "
+            "`pip install pyarrow`."
+        ) from e
+    return pq
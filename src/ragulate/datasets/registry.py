@@ -0,0 +1,240 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from typing import TYPE_CHECKING
+
+import inflection
+from pydantic import BaseModel
+
+if TYPE_CHECKING:
+    from .base_dataset import BaseDataset
+
+REGISTRY_FILE_NAME = "registry.json"
+
+_write_lock = threading.Lock()
+
+# parsed manifests, keyed by manifest path and validated against its file stats
+_manifest_cache: dict[str, tuple[tuple[int, int, int], dict[str, RegistryEntry]]] = {}
+
+
+class RegistryEntry(BaseModel):
+    """A downloaded dataset in the registry manifest.
+
+    `files` maps the path of each file (relative to the dataset) to its size,
+    mtime and sha256, so only new or changed files are hashed again. Entries
+    found by a scan, rather than written, have no size or checksums.
+    """
+
+    kind: str
+    path: str
+    size: int | None = None
+    checksum: str | None = None
+    files: dict[str, tuple[int, int, str]] = {}
+
+
+def normalize_dataset_name(name: str) -> str:
+    """Normalizes a llama dataset name to the folder it is stored in."""
+    return inflection.underscore(name).lower().removesuffix("_dataset")
+
+
+def registry_key(kind: str, dataset_path: str) -> str:
+    """Returns the manifest key of a dataset: its kind and directory name."""
+    return f"{kind}/{os.path.basename(dataset_path)}"
+
+
+def match_entries(entries: dict[str, RegistryEntry], name: str) -> list[RegistryEntry]:
+    """Returns the entries (of any kind) stored under a dataset name
+
+    Datasets are stored in a directory of the exact name they were downloaded
+    as, except llama datasets, which are stored under their normalized name.
+    """
+    matches: dict[str, RegistryEntry] = {}
+    for entry in entries.values():
+        directory = os.path.basename(entry.path)
+        if directory == name or (
+            entry.kind == "llama" and directory == normalize_dataset_name(name)
+        ):
+            matches.setdefault(entry.path, entry)
+    return list(matches.values())
+
+
+def checksum_file(file_path: str) -> str:
+    """Returns the sha256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _list_files(dataset_path: str) -> list[str]:
+    """Lists all files under a path (excluding dot files), in a stable order."""
+    if os.path.isfile(dataset_path):
+        return [dataset_path]
+    files: list[str] = []
+    for dir_path, dir_names, file_names in os.walk(dataset_path):
+        dir_names[:] = sorted(d for d in dir_names if not d.startswith("."))
+        files.extend(
+            os.path.join(dir_path, f)
+            for f in sorted(file_names)
+            if not f.startswith(".")
+        )
+    return files
+
+
+def describe_dataset_files(
+    dataset_path: str, known: dict[str, tuple[int, int, str]] | None = None
+) -> tuple[int, str, dict[str, tuple[int, int, str]]]:
+    """Returns the total size, a combined checksum and the files of a dataset.
+
+    Files whose size and mtime match their `known` entry keep its checksum, so
+    only the files that were just written are read.
+    """
+    known = known or {}
+    size = 0
+    digest = hashlib.sha256()
+    files: dict[str, tuple[int, int, str]] = {}
+    for file_path in _list_files(dataset_path):
+        stat = os.stat(file_path)
+        relative_path = os.path.relpath(file_path, dataset_path)
+        previous = known.get(relative_path)
+        if previous is not None and previous[:2] == (stat.st_size, stat.st_mtime_ns):
+            file_checksum = previous[2]
+        else:
+            file_checksum = checksum_file(file_path)
+        files[relative_path] = (stat.st_size, stat.st_mtime_ns, file_checksum)
+        size += stat.st_size
+        digest.update(f"{relative_path}:{file_checksum}\n".encode())
+    return size, digest.hexdigest(), files
+
+
+class DatasetRegistry:
+    """Manifest of downloaded datasets, stored at `<root>/registry.json`.
+
+    The manifest maps the kind and directory name of each dataset to its path,
+    size and checksum, so datasets can be found without walking the storage
+    directory.
+    """
+
+    root_storage_path: str
+
+    def __init__(self, root_storage_path: str = "datasets"):
+        self.root_storage_path = root_storage_path
+
+    @property
+    def manifest_path(self) -> str:
+        """Returns the path of the manifest file"""
+        return os.path.join(self.root_storage_path, REGISTRY_FILE_NAME)
+
+    def exists(self) -> bool:
+        """Returns True if the manifest file has been written"""
+        return os.path.isfile(self.manifest_path)
+
+    def entries(self) -> dict[str, RegistryEntry]:
+        """Returns all entries in the manifest"""
+        try:
+            stat = os.stat(self.manifest_path)
+        except FileNotFoundError:
+            return {}
+
+        # the manifest is replaced (not rewritten) on every write, so the inode
+        # changes even where mtimes are coarse
+        signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        cached = _manifest_cache.get(self.manifest_path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+        with open(self.manifest_path) as f:
+            raw = json.load(f)
+        entries = {
+            name: RegistryEntry.model_validate(entry)
+            for name, entry in raw.get("datasets", {}).items()
+        }
+        _manifest_cache[self.manifest_path] = (signature, entries)
+        return entries
+
+    def get(self, name: str) -> RegistryEntry | None:
+        """Gets the manifest entry for a dataset name, if there is just one"""
+        matches = match_entries(self.entries(), name)
+        return matches[0] if len(matches) == 1 else None
+
+    def register(self, dataset: BaseDataset) -> RegistryEntry:
+        """Adds (or updates) the manifest entry for a downloaded dataset"""
+        dataset_path = dataset.dataset_path()
+        name = registry_key(dataset.kind, dataset_path)
+        with _write_lock:
+            entries = dict(self.entries())
+            previous = entries.get(name)
+            size, checksum, files = describe_dataset_files(
+                dataset_path, known=None if previous is None else previous.files
+            )
+            entry = RegistryEntry(
+                kind=dataset.kind,
+                path=dataset_path,
+                size=size,
+                checksum=checksum,
+                files=files,
+            )
+            entries[name] = entry
+            self._write(entries)
+        return entry
+
+    def scan(self, checksums: bool = False) -> dict[str, RegistryEntry]:
+        """Returns entries for the datasets found in the storage directory
+
+        Datasets are expected at `<root>/<kind>/<name>`. Their files are only
+        listed and read (to size and checksum them) if `checksums` is set, so a
+        scan without them only lists the kind and dataset directories.
+        """
+        entries: dict[str, RegistryEntry] = {}
+        if not os.path.isdir(self.root_storage_path):
+            return entries
+        for kind in sorted(os.listdir(self.root_storage_path)):
+            kind_path = os.path.join(self.root_storage_path, kind)
+            if not os.path.isdir(kind_path):
+                continue
+            for dataset in sorted(os.listdir(kind_path)):
+                dataset_path = os.path.join(kind_path, dataset)
+                if dataset.startswith(".") or not os.path.isdir(dataset_path):
+                    continue
+                if checksums:
+                    size, checksum, files = describe_dataset_files(dataset_path)
+                    entry = RegistryEntry(
+                        kind=kind,
+                        path=dataset_path,
+                        size=size,
+                        checksum=checksum,
+                        files=files,
+                    )
+                else:
+                    entry = RegistryEntry(kind=kind, path=dataset_path)
+                entries[registry_key(kind, dataset_path)] = entry
+        return entries
+
+    def rebuild(self) -> dict[str, RegistryEntry]:
+        """Rebuilds the manifest, with checksums, from the storage directory
+
+        This picks up datasets that were copied into place by hand, and reads
+        all of their files, so it is left to `ragulate rebuild-registry`.
+        """
+        entries = self.scan(checksums=True)
+        with _write_lock:
+            self._write(entries)
+        return entries
+
+    def _write(self, entries: dict[str, RegistryEntry]) -> None:
+        os.makedirs(self.root_storage_path, exist_ok=True)
+        document = {
+            "datasets": {
+                name: entry.model_dump() for name, entry in sorted(entries.items())
+            }
+        }
+        # write to a temp file and rename, so readers never see a partial manifest
+        fd, temp_path = tempfile.mkstemp(dir=self.root_storage_path, prefix=".registry")
+        with os.fdopen(fd, "w") as f:
+            json.dump(document, f, indent=2)
+        os.replace(temp_path, self.manifest_path)
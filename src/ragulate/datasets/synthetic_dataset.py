@@ -0,0 +1,180 @@
+import json
+import random
+from os import makedirs, path
+from typing import Any
+
+from ..logging_config import logger
+from .base_dataset import BaseDataset, QueryItem
+
+_MASK64 = (1 << 64) - 1
+
+_WORDS = [
+    "amber", "basalt", "cedar", "delta", "ember", "fjord", "garnet", "harbor",
+    "indigo", "juniper", "kestrel", "lagoon", "meadow", "nebula", "obsidian",
+    "prairie", "quartz", "ridge", "sierra", "tundra", "umber", "valley",
+    "willow", "xenon", "yarrow", "zephyr", "arbor", "bramble", "cobalt", "dune",
+    "estuary", "falcon",
+]  # fmt: skip
+
+_ATTRIBUTES = [
+    "color", "capital", "founder", "origin", "weight", "height", "age", "owner",
+    "purpose", "material", "codename", "location",
+]  # fmt: skip
+
+_PARAMS_FILE_NAME = "params.json"
+
+_DEFAULT_PARAMS: dict[str, int] = {
+    "num_queries": 1000,
+    "num_documents": 100,
+    "document_size": 2000,
+    "metadata_cardinality": 10,
+    "seed": 0,
+}
+
+
+def _mix(seed: int, index: int) -> int:
+    """Deterministic 64-bit hash of a seed and an index (splitmix64)."""
+    z = (seed * 0x9E3779B97F4A7C15 + (index + 1) * 0xBF58476D1CE4E5B9) & _MASK64
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return z ^ (z >> 31)
+
+
+class SyntheticDataset(BaseDataset):
+    """Generated dataset for testing ragulate itself at scale.
+
+    Queries, reference answers, metadata and source documents are generated
+    offline and deterministically from a seed. Each query asks for a fact that
+    is stated in exactly one source document.
+    """
+
+    kind = "synthetic"
+
+    num_queries: int
+    num_documents: int
+    document_size: int
+    metadata_cardinality: int
+    seed: int
+
+    def __init__(
+        self,
+        dataset_name: str,
+        root_storage_path: str = "datasets",
+        num_queries: int | None = None,
+        num_documents: int | None = None,
+        document_size: int | None = None,
+        metadata_cardinality: int | None = None,
+        seed: int | None = None,
+    ):
+        super().__init__(dataset_name=dataset_name, root_storage_path=root_storage_path)
+
+        # parameters default to the ones the dataset was generated with
+        params = dict(_DEFAULT_PARAMS)
+        params_path = path.join(self.storage_path(), _PARAMS_FILE_NAME)
+        if path.exists(params_path):
+            with open(params_path) as f:
+                params.update(json.load(f))
+
+        passed = {
+            "num_queries": num_queries,
+            "num_documents": num_documents,
+            "document_size": document_size,
+            "metadata_cardinality": metadata_cardinality,
+            "seed": seed,
+        }
+        params.update({k: int(v) for k, v in passed.items() if v is not None})
+
+        if params["num_documents"] < 1 or params["metadata_cardinality"] < 1:
+            raise ValueError(
+                "num_documents and metadata_cardinality must be at least 1"
+            )
+
+        self.num_queries = params["num_queries"]
+        self.num_documents = params["num_documents"]
+        self.document_size = params["document_size"]
+        self.metadata_cardinality = params["metadata_cardinality"]
+        self.seed = params["seed"]
+
+    def params(self) -> dict[str, int]:
+        """Returns the generation parameters"""
+        return {
+            "num_queries": self.num_queries,
+            "num_documents": self.num_documents,
+            "document_size": self.document_size,
+            "metadata_cardinality": self.metadata_cardinality,
+            "seed": self.seed,
+        }
+
+    def sub_storage_path(self) -> str:
+        return path.join("synthetic", self.name)
+
+    def _source_path(self) -> str:
+        return path.join(self.storage_path(), "source_files")
+
+    def _fact(self, index: int) -> tuple[str, str, str]:
+        """Returns the subject, attribute and value of the fact for a query"""
+        h = _mix(self.seed, index)
+        subject = f"{_WORDS[h % len(_WORDS)]}-{index}"
+        attribute = _ATTRIBUTES[(h >> 8) % len(_ATTRIBUTES)]
+        value = " ".join(_WORDS[(h >> shift) % len(_WORDS)] for shift in (16, 24, 32))
+        return subject, attribute, value
+
+    def download_dataset(self) -> None:
+        """Generates the source documents (synthetic datasets need no download)"""
+        source_path = self._source_path()
+        makedirs(source_path, exist_ok=True)
+
+        with open(path.join(self.storage_path(), _PARAMS_FILE_NAME), "w") as f:
+            json.dump(self.params(), f, indent=2)
+
+        for doc_index in range(self.num_documents):
+            lines = []
+            for index in range(doc_index, self.num_queries, self.num_documents):
+                subject, attribute, value = self._fact(index)
+                lines.append(f"The {attribute} of {subject} is {value}.")
+            text = "\n".join(lines)
+
+            if len(text) < self.document_size:
+                rng = random.Random(f"{self.seed}-{doc_index}")
+                filler: list[str] = []
+                filler_size = self.document_size - len(text)
+                while filler_size > 0:
+                    word = rng.choice(_WORDS)
+                    filler.append(word)
+                    filler_size -= len(word) + 1
+                text = f"{text}\n{' '.join(filler)}".strip()
+
+            doc_path = path.join(source_path, f"document_{doc_index:06d}.txt")
+            with open(doc_path, "w") as f:
+                f.write(text)
+
+        self.register()
+        logger.info(
+            f"Generated {self.num_documents} documents for {self.name} in {source_path}"
+        )
+
+    def get_source_file_paths(self) -> list[str]:
+        source_path = self._source_path()
+        return [
+            path.join(source_path, f)
+            for f in sorted(self.list_files_at_path(path=source_path))
+        ]
+
+    def _load_query_items(self) -> None:
+        """Generates query_items, including their reference answers"""
+        groups = [f"group_{i}" for i in range(self.metadata_cardinality)]
+        query_items: list[QueryItem] = []
+        for index in range(self.num_queries):
+            subject, attribute, value = self._fact(index)
+            metadata: dict[str, Any] = {
+                "group": groups[_mix(self.seed, -index - 1) % len(groups)],
+                "document": index % self.num_documents,
+            }
+            query_items.append(
+                QueryItem(
+                    query=f"What is the {attribute} of {subject}?",
+                    metadata=metadata,
+                    reference_answer=f"The {attribute} of {subject} is {value}.",
+                )
+            )
+        self._query_items = query_items
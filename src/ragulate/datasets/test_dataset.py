@@ -2,6 +2,8 @@ from .base_dataset import BaseDataset, QueryItem
 
 
 class TestDataset(BaseDataset):
+    kind = "test"
+
     def sub_storage_path(self) -> str:
         return "sub_storage_path"
 
@@ -11,16 +13,10 @@ class TestDataset(BaseDataset):
     def get_source_file_paths(self) -> list[str]:
         return []
 
-    def _load_query_items_and_golden_set(self) -> None:
+    def _load_query_items(self) -> None:
         self._query_items = [
-            QueryItem("Quéry 1", metadata={}),
-            QueryItem("Query 2", metadata={}),
-            QueryItem("Query 3", metadata={}),
-            QueryItem("Query 4", metadata={}),
-        ]
-        self._golden_set = [
-            {"query": "Query 1", "response": "Response 1"},
-            {"query": "Query 2", "response": "Response 2"},
-            {"query": "Query 3", "response": "Response 3"},
-            {"query": "Query 4", "response": "Response 4"},
+            QueryItem("Quéry 1", metadata={}, reference_answer="Response 1"),
+            QueryItem("Query 2", metadata={}, reference_answer="Response 2"),
+            QueryItem("Query 3", metadata={}, reference_answer="Response 3"),
+            QueryItem("Query 4", metadata={}, reference_answer="Response 4"),
         ]
@@ -1,36 +1,116 @@
+import inspect
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Sequence
 
 import inflection
+from tqdm import tqdm
 
+from ..logging_config import logger
 from .base_dataset import BaseDataset
 from .crag_dataset import CragDataset
 from .llama_dataset import LlamaDataset
+from .local_dataset import LocalDataset
+from .registry import DatasetRegistry, match_entries
+from .synthetic_dataset import SyntheticDataset
 
+DATASET_KINDS: dict[str, type[BaseDataset]] = {
+    "llama": LlamaDataset,
+    "crag": CragDataset,
+    "synthetic": SyntheticDataset,
+    "local": LocalDataset,
+}
 
-def find_dataset(name: str) -> BaseDataset:
-    root_path = "datasets"
-    if not os.path.exists(root_path):
+
+def find_dataset(name: str, root_storage_path: str = "datasets") -> BaseDataset:
+    """Finds a downloaded dataset by name, using the registry manifest."""
+    if not os.path.exists(root_storage_path):
         raise ValueError("please download a dataset before using ingest or query")
 
-    name = inflection.underscore(name)
-    for kind in os.listdir(root_path):
-        kind_path = os.path.join(root_path, kind)
-        if os.path.isdir(kind_path):
-            for dataset in os.listdir(kind_path):
-                dataset_path = os.path.join(kind_path, dataset)
-                if os.path.isdir(dataset_path):
-                    if dataset.lower() == name:
-                        return get_dataset(name, kind)
+    registry = DatasetRegistry(root_storage_path=root_storage_path)
+    if registry.exists():
+        entries = registry.entries()
+    else:
+        # datasets downloaded before the manifest existed, so list the storage
+        # directory (without reading the files) instead
+        entries = registry.scan()
+    matches = match_entries(entries, name)
+    if len(matches) > 1:
+        kinds = ", ".join(sorted(entry.kind for entry in matches))
+        raise ValueError(f"{name} has been downloaded as more than one kind: {kinds}")
+    if len(matches) == 1 and matches[0].kind != "llama":
+        # opened from the directory it was stored in, so its saved parameters
+        # are found whatever the case of the name it was downloaded as
+        entry = matches[0]
+        return get_dataset(
+            os.path.basename(entry.path),
+            entry.kind,
+            root_storage_path=root_storage_path,
+        )
+
+    return get_dataset(
+        inflection.underscore(name), "llama", root_storage_path=root_storage_path
+    )
+
+
+def get_dataset(
+    name: str, kind: str, root_storage_path: str = "datasets", **kwargs: Any
+) -> BaseDataset:
+    """Returns a dataset of the given kind.
+
+    Extra keyword arguments are passed on to the dataset, for kinds that take
+    parameters (such as `synthetic`).
+    """
+    dataset_class = DATASET_KINDS.get(kind.lower())
+    if dataset_class is None:
+        raise NotImplementedError(
+            f"only {', '.join(DATASET_KINDS)} datasets are currently supported"
+        )
+    unknown = sorted(set(kwargs) - set(dataset_parameters(kind)))
+    if len(unknown) > 0:
+        raise ValueError(
+            f"{kind} datasets don't take the parameters {', '.join(unknown)}"
+        )
+    return dataset_class(
+        dataset_name=name, root_storage_path=root_storage_path, **kwargs
+    )
+
 
-    """ searches for a downloaded dataset with this name. if found, returns it."""
-    return get_dataset(name, "llama")
+def dataset_parameters(kind: str) -> list[str]:
+    """Returns the names of the parameters a kind of dataset takes."""
+    dataset_class = DATASET_KINDS.get(kind.lower())
+    if dataset_class is None:
+        return []
+    parameters = inspect.signature(dataset_class.__init__).parameters
+    return [
+        name
+        for name, parameter in parameters.items()
+        if name not in ("self", "dataset_name", "root_storage_path")
+        and parameter.kind is parameter.POSITIONAL_OR_KEYWORD
+    ]
 
 
-def get_dataset(name: str, kind: str) -> BaseDataset:
-    kind = kind.lower()
-    if kind == "llama":
-        return LlamaDataset(dataset_name=name)
-    elif kind == "crag":
-        return CragDataset(dataset_name=name)
+def download_datasets(
+    datasets: Sequence[BaseDataset], max_workers: int = 4
+) -> dict[str, BaseException]:
+    """Downloads datasets concurrently.
 
-    raise NotImplementedError("only llama and crag datasets are currently supported")
+    A failed download doesn't stop the others. Returns the failures, keyed by
+    dataset name.
+    """
+    failures: dict[str, BaseException] = {}
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = {
+            executor.submit(dataset.download_dataset): dataset for dataset in datasets
+        }
+        with tqdm(total=len(futures), desc="Datasets", unit="dataset") as progress:
+            for future in as_completed(futures):
+                dataset = futures[future]
+                try:
+                    future.result()
+                except Exception as e:  # noqa: BLE001
+                    logger.exception(f"Failed to download dataset {dataset.name}")
+                    failures[dataset.name] = e
+                progress.set_postfix({"failed": len(failures)})
+                progress.update(1)
+    return failures
@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+from ragulate.schema import RECORD_STAGES
+from ragulate.snapshots import STAGE_COLUMNS
+
+LATENCY_PERCENTILES = [0.5, 0.9, 0.95, 0.99]
+
+LATENCY_REPORT_COLUMNS = [
+    "dataset",
+    "recipe",
+    "queries",
+    "latency_mean",
+    "latency_p50",
+    "latency_p90",
+    "latency_p95",
+    "latency_p99",
+    "latency_max",
+    "tokens_per_second",
+    "completion_tokens_per_second",
+    "queries_per_second",
+]
+
+STAGE_REPORT_COLUMNS = [
+    "dataset",
+    "recipe",
+    "stage",
+    "queries",
+    "latency_mean",
+    "latency_p50",
+    "latency_p95",
+    "latency_share",
+]
+
+TRADEOFF_COLUMNS = [
+    "dataset",
+    "recipe",
+    "metric",
+    "score_mean",
+    "latency_p50",
+    "latency_p95",
+    "tokens_mean",
+    "pareto_optimal",
+]
+
+
+def latency_report(df: pd.DataFrame) -> pd.DataFrame:
+    """Returns latency percentiles and throughput of each recipe on each dataset
+
+    `df` is shaped like the output of `get_chart_data`: a row per record, with
+    `recipe`, `dataset`, `latency` (seconds), `start_time` (seconds since the
+    epoch), `total_tokens` and `completion_tokens` columns. Tokens per second
+    are the tokens of the records over their summed latency, so they measure
+    a single chain. Queries per second are the records over the wall time from
+    the first record starting to the last one ending, so they include any
+    concurrency the recipe was run with.
+    """
+    if len(df) == 0:
+        return pd.DataFrame(columns=LATENCY_REPORT_COLUMNS)
+
+    keys = [df["dataset"], df["recipe"]]
+    latency = df["latency"].where(df["latency"] >= 0)
+    grouped = latency.groupby(keys, sort=True)
+
+    # all the percentiles of all the groups in one pass
+    percentiles = (
+        grouped.quantile(LATENCY_PERCENTILES)
+        .unstack()
+        .reindex(columns=LATENCY_PERCENTILES)
+    )
+    report = grouped.agg(queries="count", latency_mean="mean")
+    for percentile in LATENCY_PERCENTILES:
+        report[f"latency_p{round(percentile * 100)}"] = percentiles[percentile]
+    report["latency_max"] = grouped.max()
+
+    for tokens, column in [
+        ("total_tokens", "tokens_per_second"),
+        ("completion_tokens", "completion_tokens_per_second"),
+    ]:
+        # summed over the records with both values, so slow queries weigh more
+        both = df[tokens].notna() & latency.notna()
+        seconds = latency.where(both).groupby(keys).sum()
+        amounts = df[tokens].where(both).groupby(keys).sum()
+        report[column] = amounts / seconds.where(seconds > 0)
+
+    start_time = df["start_time"].where(latency.notna())
+    first_start = start_time.groupby(keys).min()
+    last_end = (start_time + latency).groupby(keys).max()
+    wall_seconds = last_end - first_start
+    report["queries_per_second"] = report["queries"] / wall_seconds.where(
+        wall_seconds > 0
+    )
+
+    report.index.names = ["dataset", "recipe"]
+    return report.reset_index().reindex(columns=LATENCY_REPORT_COLUMNS)
+
+
+def latency_quality_tradeoffs(df: pd.DataFrame, feedbacks: List[str]) -> pd.DataFrame:
+    """Returns the mean score of each recipe next to its latency, per feedback
+
+    A recipe is `pareto_optimal` for a feedback on a dataset when no other
+    recipe has both a p95 latency at least as low and a mean score at least as
+    high, and is better in one of them.
+    """
+    report = latency_report(df)
+    if len(report) == 0 or len(feedbacks) == 0:
+        return pd.DataFrame(columns=TRADEOFF_COLUMNS)
+
+    scores = (
+        df.groupby(["dataset", "recipe"], sort=True)[feedbacks]
+        .mean()
+        .reset_index()
+        .melt(
+            id_vars=["dataset", "recipe"],
+            value_vars=feedbacks,
+            var_name="metric",
+            value_name="score_mean",
+        )
+    )
+    tokens = (
+        df.groupby(["dataset", "recipe"])["total_tokens"]
+        .mean()
+        .rename("tokens_mean")
+        .reset_index()
+    )
+    tradeoffs = scores.merge(
+        report[["dataset", "recipe", "latency_p50", "latency_p95"]],
+        on=["dataset", "recipe"],
+    ).merge(tokens, on=["dataset", "recipe"])
+
+    optimal = pd.Series(False, index=tradeoffs.index)
+    for _, group in tradeoffs.groupby(["dataset", "metric"]):
+        latency = group["latency_p95"].to_numpy(dtype=float)
+        score = group["score_mean"].to_numpy(dtype=float)
+        # pairwise comparison of the recipes: [i, j] is whether j dominates i
+        no_worse = (latency[None, :] <= latency[:, None]) & (
+            score[None, :] >= score[:, None]
+        )
+        better = (latency[None, :] < latency[:, None]) | (
+            score[None, :] > score[:, None]
+        )
+        dominated = (no_worse & better).any(axis=1)
+        known = ~np.isnan(latency) & ~np.isnan(score)
+        optimal[group.index] = known & ~dominated
+
+    tradeoffs["pareto_optimal"] = optimal
+    return (
+        tradeoffs.sort_values(["dataset", "metric", "recipe"])
+        .reindex(columns=TRADEOFF_COLUMNS)
+        .reset_index(drop=True)
+    )
+
+
+def stage_latency_report(df: pd.DataFrame) -> pd.DataFrame:
+    """Returns latency percentiles of each stage of each recipe on each dataset
+
+    `df` is shaped like the output of `get_chart_data`, with a `<stage>_latency`
+    column per stage of the chain (retriever, prompt, llm and parser) that was
+    extracted from the calls TruLens recorded. `latency_share` is the part of
+    the end to end latency of the queries spent in the stage.
+    """
+    if len(df) == 0:
+        return pd.DataFrame(columns=STAGE_REPORT_COLUMNS)
+
+    # frames from before the stage timings have no stage columns
+    stages = df.reindex(columns=["dataset", "recipe", "latency", *STAGE_COLUMNS])
+    stages = stages.melt(
+        id_vars=["dataset", "recipe", "latency"],
+        value_vars=STAGE_COLUMNS,
+        var_name="stage",
+        value_name="seconds",
+    )
+    stages["stage"] = stages["stage"].map(dict(zip(STAGE_COLUMNS, RECORD_STAGES)))
+    stages = stages[stages["seconds"] >= 0]
+    keys = ["dataset", "recipe", "stage"]
+    grouped = stages.groupby(keys, sort=False)["seconds"]
+
+    percentiles = grouped.quantile([0.5, 0.95]).unstack().reindex(columns=[0.5, 0.95])
+    report = grouped.agg(queries="count", latency_mean="mean")
+    report["latency_p50"] = percentiles[0.5]
+    report["latency_p95"] = percentiles[0.95]
+    totals = stages[stages["latency"] > 0].groupby(keys)[["seconds", "latency"]].sum()
+    report["latency_share"] = totals["seconds"] / totals["latency"]
+
+    # recipes without timings for a stage get empty rows
+    index = pd.MultiIndex.from_product(
+        [sorted(df["dataset"].unique()), sorted(df["recipe"].unique()), RECORD_STAGES],
+        names=keys,
+    )
+    report = report.reindex(index)
+    report["queries"] = report["queries"].fillna(0).astype(int)
+    return report.reset_index().reindex(columns=STAGE_REPORT_COLUMNS)
@@ -1,17 +1,48 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, Any
+from typing import TYPE_CHECKING, Any, cast
 
 import numpy as np
+from pydantic import PrivateAttr
 from trulens_eval import Feedback
 from trulens_eval.app import App
 from trulens_eval.feedback import GroundTruthAgreement
+from typing_extensions import override
+
+from ragulate.datasets import GoldenSet
+from ragulate.logging_config import logger
 
 if TYPE_CHECKING:
     from trulens_eval.feedback.provider.base import LLMProvider
     from trulens_eval.utils.serial import Lens
 
 
+# the private hook IndexedGroundTruthAgreement overrides. trulens-eval is
+# pinned, but if a release renames it the plain scan is used instead.
+_HAS_FIND_RESPONSE = callable(getattr(GroundTruthAgreement, "_find_response", None))
+
+
+class IndexedGroundTruthAgreement(GroundTruthAgreement):  # type: ignore[misc]
+    """GroundTruthAgreement that looks up reference answers through a hash index.
+
+    The base class scans the whole golden set for every evaluated record. The
+    index is built lazily, so it is also rebuilt when the deferred evaluator
+    deserializes the feedback.
+    """
+
+    _golden_set: GoldenSet | None = PrivateAttr(default=None)
+
+    @override
+    def _find_response(self, prompt: str) -> str | None:
+        if self.ground_truth_imp is not None:
+            return cast("str | None", super()._find_response(prompt))
+        if self._golden_set is None:
+            self._golden_set = GoldenSet(
+                (qr["query"], qr["response"]) for qr in self.ground_truth
+            )
+        return self._golden_set.get(prompt)
+
+
 class Feedbacks:
     """Pipeline feedbacks."""
 
@@ -54,9 +85,18 @@ class Feedbacks:
     def answer_correctness(self, golden_set: list[dict[str, str]]) -> Feedback:
         """Return answer correctness feedback."""
         # GroundTruth for comparing the Answer to the Ground-Truth Answer
-        ground_truth_collection = GroundTruthAgreement(
-            ground_truth=golden_set, provider=self._llm_provider
-        )
+        if _HAS_FIND_RESPONSE:
+            ground_truth_collection = IndexedGroundTruthAgreement(
+                ground_truth=golden_set, provider=self._llm_provider
+            )
+        else:
+            logger.warning(
+                "GroundTruthAgreement has no _find_response, reference answers "
+                "are looked up without the index"
+            )
+            ground_truth_collection = GroundTruthAgreement(
+                ground_truth=golden_set, provider=self._llm_provider
+            )
         return Feedback(
             ground_truth_collection.agreement_measure, name="answer_correctness"
         ).on_input_output()
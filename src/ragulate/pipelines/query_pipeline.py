@@ -1,7 +1,6 @@
 # ruff: noqa: T201
 from __future__ import annotations
 
-import random
 import signal
 import sys
 import time
@@ -15,7 +14,9 @@ from trulens_eval.feedback.provider import AzureOpenAI, Huggingface, OpenAI
 from trulens_eval.schema.feedback import FeedbackMode, FeedbackResultStatus
 from typing_extensions import Never, override
 
+from ragulate.datasets import decode_json_string, normalize_query
 from ragulate.logging_config import logger
+from ragulate.schema import ensure_schema
 from ragulate.utils import get_tru
 
 from .base_pipeline import BasePipeline
@@ -36,7 +37,7 @@ class QueryPipeline(BasePipeline):
     _name: str
     _progress: tqdm[Never]
     _query_items: dict[str, list[QueryItem]]
-    _golden_sets: dict[str, list[dict[str, str]]]
+    _sampled_query_items: dict[str, list[QueryItem]]
     _total_queries: int = 0
     _total_feedbacks: int = 0
     _finished_feedbacks: int = 0
@@ -53,27 +54,18 @@ class QueryPipeline(BasePipeline):
     def get_reserved_params(self) -> list[str]:
         return []
 
-    def _sample_queries(self, query_items: List[QueryItem]) -> List[QueryItem]:
-        if self.sample_percent <= 0 or self.sample_percent >= 1.0:
-            return query_items
-
-        random.seed(self.random_seed)
-        indexes = range(len(query_items))
-        subset_size = int(self.sample_percent * len(query_items))
-        sampled_indices = random.sample(population=indexes, k=subset_size)
-        return [query_items[i] for i in sampled_indices]
-
     def _filter_completed_queries(
         self, query_items: List[QueryItem], existing_queries: List[str]
     ) -> List[QueryItem]:
-        decoded_queries = [
-            q.encode("utf-8").decode("unicode_escape") for q in existing_queries
-        ]
+        # the inputs of existing records are stored JSON encoded
+        completed_queries = {
+            normalize_query(decode_json_string(q)) for q in existing_queries
+        }
 
         return [
             query_item
             for query_item in query_items
-            if f'"{query_item.query}"' not in decoded_queries
+            if normalize_query(query_item.query) not in completed_queries
         ]
 
     def __init__(
@@ -90,7 +82,7 @@ class QueryPipeline(BasePipeline):
         model_name: str | None = None,
     ):
         self._query_items = {}
-        self._golden_sets = {}
+        self._sampled_query_items = {}
         super().__init__(
             script_path=script_path,
             method_name=method_name,
@@ -114,11 +106,13 @@ class QueryPipeline(BasePipeline):
             # so we can just delete a single "app" instead of the whole
             # database.
             self._tru.reset_database()
+        ensure_schema(recipe=self.recipe_name, force=self.restart_pipeline)
 
         self._finished_queries = 0
         for dataset in datasets:
-            query_items = dataset.get_query_items()
-            query_items = self._sample_queries(query_items=query_items)
+            query_items = dataset.sample_query_items(
+                sample_percent=self.sample_percent, random_seed=self.random_seed
+            )
 
             # Check for existing records and filter queries
             existing_records, _ = self._tru.get_records_and_feedback(
@@ -131,7 +125,7 @@ class QueryPipeline(BasePipeline):
             )
 
             self._query_items[dataset.name] = remaining_queries
-            self._golden_sets[dataset.name] = dataset.get_golden_set()
+            self._sampled_query_items[dataset.name] = query_items
 
             self._total_queries += len(query_items)
             self._finished_queries += len(query_items) - len(remaining_queries)
@@ -239,10 +233,14 @@ class QueryPipeline(BasePipeline):
             initial=self._finished_queries,
         )
 
+        datasets = {dataset.name: dataset for dataset in self.datasets}
+
         for dataset_name in self._query_items:
             feedback_functions = [
                 feedbacks.answer_correctness(
-                    golden_set=self._golden_sets[dataset_name]
+                    golden_set=datasets[dataset_name].get_golden_set(
+                        query_items=self._sampled_query_items[dataset_name]
+                    )
                 ),
                 feedbacks.answer_relevance(),
                 feedbacks.context_relevance(),
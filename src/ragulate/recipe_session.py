@@ -0,0 +1,241 @@
+from __future__ import annotations
+
+import sqlite3
+from typing import Any, Dict, List, Tuple
+
+import pandas as pd
+
+from ragulate.datasets import normalize_query
+from ragulate.snapshots import filter_by_metadata, load_snapshot
+
+_TEMP_TABLES = """
+    CREATE TEMP TABLE records (
+        recipe_index INTEGER NOT NULL,
+        record_id TEXT NOT NULL,
+        query_key TEXT,
+        metadata TEXT,
+        total_tokens INTEGER,
+        latency REAL,
+        PRIMARY KEY (recipe_index, record_id)
+    );
+    CREATE TEMP TABLE feedbacks (
+        recipe_index INTEGER NOT NULL,
+        record_id TEXT NOT NULL,
+        query_key TEXT,
+        name TEXT NOT NULL,
+        result REAL,
+        PRIMARY KEY (recipe_index, record_id, name)
+    );
+"""
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+class RecipeSession:
+    """Runs queries across several recipe databases in one sqlite session.
+
+    The rows of each recipe's snapshot for a dataset are staged into temp
+    tables, so any number of recipes can be compared (sqlite attaches at most
+    10 databases at once). The joins across recipes, the feedback pivots and
+    the diffs are then computed in SQL, and only the final columns are loaded
+    into pandas. Outputs aren't in the snapshots, so they are read for the
+    records of a page only, by `data.get_outputs`.
+    """
+
+    recipes: List[str]
+    dataset: str
+    feedbacks: List[List[str]]
+
+    def __init__(
+        self,
+        recipes: List[str],
+        dataset: str,
+        metadata_filter: Dict[str, Any] | None = None,
+    ):
+        self.recipes = recipes
+        self.dataset = dataset
+        self.feedbacks = []
+        self._conn = sqlite3.connect(":memory:", uri=True)
+        self._conn.executescript(_TEMP_TABLES)
+        try:
+            for index, recipe in enumerate(recipes):
+                self._stage(
+                    recipe_index=index,
+                    recipe=recipe,
+                    metadata_filter=metadata_filter or {},
+                )
+        except Exception:
+            self.close()
+            raise
+
+    def __enter__(self) -> RecipeSession:
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Closes the session, dropping the staged rows"""
+        self._conn.close()
+
+    def _stage(
+        self,
+        recipe_index: int,
+        recipe: str,
+        metadata_filter: Dict[str, Any],
+    ) -> None:
+        df, feedbacks = load_snapshot(recipe=recipe, dataset=self.dataset)
+        df = filter_by_metadata(
+            df, recipe=recipe, dataset=self.dataset, metadata_filter=metadata_filter
+        )
+        self.feedbacks.append(feedbacks)
+        # recipes are joined on the query, normalized like the golden sets are
+        df = df.assign(
+            input=df["input"].map(
+                lambda query: normalize_query(str(query)), na_action="ignore"
+            )
+        )
+
+        records = df[["record_id", "input", "metadata", "total_tokens", "latency"]]
+        self._conn.executemany(
+            """
+            INSERT OR REPLACE INTO temp.records
+                (recipe_index, record_id, query_key, metadata, total_tokens, latency)
+            VALUES
+                (?, ?, ?, ?, ?, ?)
+            """,
+            (
+                [recipe_index, *row]
+                for row in records.astype(object).to_numpy().tolist()
+            ),
+        )
+        results = df.melt(
+            id_vars=["record_id", "input"],
+            value_vars=feedbacks,
+            var_name="name",
+            value_name="result",
+        ).dropna(subset=["result"])
+        self._conn.executemany(
+            """
+            INSERT OR REPLACE INTO temp.feedbacks
+                (recipe_index, record_id, query_key, name, result)
+            VALUES
+                (?, ?, ?, ?, ?)
+            """,
+            (
+                [recipe_index, *row]
+                for row in results.astype(object).to_numpy().tolist()
+            ),
+        )
+        self._conn.commit()
+
+    def common_feedbacks(self) -> List[str]:
+        """Returns the feedbacks all the recipes have"""
+        if len(self.feedbacks) == 0:
+            return []
+        return sorted(set.intersection(*[set(f) for f in self.feedbacks]))
+
+    def _compare_query(
+        self, columns_to_diff: List[str]
+    ) -> Tuple[str, List[Any], List[str]]:
+        # returns the sql, its params and the names of the columns it selects
+        record_selects = [
+            "MAX(CASE WHEN recipe_index = 0 THEN metadata END) AS metadata"
+        ]
+        feedback_selects: List[str] = []
+        feedback_params: List[Any] = []
+        columns = ["input", "metadata"]
+        feedbacks = [c for c in columns_to_diff if c not in ("total_tokens", "latency")]
+        for index, recipe in enumerate(self.recipes):
+            for column in ["record_id", "total_tokens", "latency"]:
+                record_selects.append(
+                    f"MAX(CASE WHEN recipe_index = {index} THEN {column} END) "
+                    f"AS {_quote(f'{column}_{recipe}')}"
+                )
+                columns.append(f"{column}_{recipe}")
+            for feedback in feedbacks:
+                feedback_selects.append(
+                    f"MAX(CASE WHEN recipe_index = {index} AND name = ? "
+                    f"THEN result END) AS {_quote(f'{feedback}_{recipe}')}"
+                )
+                feedback_params.append(feedback)
+                columns.append(f"{feedback}_{recipe}")
+
+        diff_selects: List[str] = []
+        if len(self.recipes) == 2:  # noqa: PLR2004
+            first, second = self.recipes
+            for column in columns_to_diff:
+                diff_selects.append(
+                    f"{_quote(f'{column}_{first}')} - {_quote(f'{column}_{second}')} "
+                    f"AS {_quote(f'{column}__diff')}"
+                )
+                columns.append(f"{column}__diff")
+
+        feedback_pivot = (
+            f"""
+            LEFT JOIN (
+                SELECT query_key, {", ".join(feedback_selects)}
+                FROM temp.feedbacks
+                GROUP BY query_key
+            ) f USING (query_key)
+            """
+            if len(feedback_selects) > 0
+            else ""
+        )
+        sql = f"""
+            SELECT
+                query_key AS input,
+                *
+                {"".join(f", {s}" for s in diff_selects)}
+            FROM (
+                SELECT query_key, {", ".join(record_selects)}
+                FROM temp.records
+                GROUP BY query_key
+            ) r
+            {feedback_pivot}
+        """
+        return sql, feedback_params, columns
+
+    def compare_frame(
+        self,
+        columns_to_diff: List[str],
+        search: str | None = None,
+        sort_by: str | None = None,
+        ascending: bool = True,
+    ) -> pd.DataFrame:
+        """Returns one row per query, joined across all recipes
+
+        Columns are suffixed with `_<recipe>`, and the metadata is taken from
+        the first recipe. With exactly two recipes, `<column>__diff` columns
+        hold the difference of the two for each of `columns_to_diff`.
+
+        Rows can be filtered to the queries containing `search` (ignoring
+        case) and sorted by any of the columns (empty values last, then by
+        query), both in SQL.
+        """
+        sql, params, columns = self._compare_query(columns_to_diff)
+        if sort_by is not None and sort_by not in columns:
+            raise ValueError(f"Unknown column to sort by: {sort_by}")
+
+        order_by = ["query_key"]
+        if sort_by is not None:
+            direction = "ASC" if ascending else "DESC"
+            order_by.insert(0, f"{_quote(sort_by)} {direction} NULLS LAST")
+        where, where_params = self._search_filter(search)
+        return pd.read_sql_query(
+            sql=f"""
+                SELECT *
+                FROM ({sql})
+                {where}
+                ORDER BY {", ".join(order_by)}
+                """,
+            con=self._conn,
+            params=[*params, *where_params],
+        ).drop(columns=["query_key"])
+
+    def _search_filter(self, search: str | None) -> Tuple[str, List[Any]]:
+        if search is None or search == "":
+            return "", []
+        return "WHERE instr(lower(query_key), lower(?)) > 0", [search]
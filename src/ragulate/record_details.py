@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import copy
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Tuple
+
+from ragulate.logging_config import logger
+from ragulate.snapshots import DatabaseSignature, database_signature
+
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_PREFETCH_WORKERS = 2
+
+RecordDetails = Dict[str, Any]
+DetailKey = Tuple[str, str, DatabaseSignature]
+
+
+class RecordDetailCache:
+    """Bounded LRU cache of the details (contexts and feedback calls) of records.
+
+    Entries are keyed by recipe, record id and the signature of the recipe
+    database, so details are loaded again once the database was written to.
+    `prefetch` loads details in background threads, so the records next to the
+    selected one are already cached when they are selected. A record that is
+    being prefetched isn't loaded twice: `get` waits for the prefetch instead.
+    """
+
+    max_entries: int
+
+    def __init__(
+        self,
+        load: Callable[[str, str], RecordDetails],
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        prefetch_workers: int = DEFAULT_PREFETCH_WORKERS,
+    ):
+        self.max_entries = max_entries
+        self._load = load
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[DetailKey, RecordDetails] = OrderedDict()
+        self._loading: Dict[DetailKey, Future[RecordDetails]] = {}
+        self._executor = ThreadPoolExecutor(
+            max_workers=prefetch_workers, thread_name_prefix="ragulate-details"
+        )
+
+    def get(self, recipe: str, record_id: str) -> RecordDetails:
+        """Returns the details of a record, loading them if not cached"""
+        key = (recipe, record_id, self._signature(recipe))
+        with self._lock:
+            details = self._entries.get(key)
+            if details is not None:
+                self._entries.move_to_end(key)
+            future = self._loading.get(key)
+        if details is None and future is not None:
+            try:
+                details = future.result()
+            except Exception:  # noqa: BLE001
+                details = None
+        if details is None:
+            details = self._fill(key)
+        # callers are free to change what they get back
+        return copy.deepcopy(details)
+
+    def prefetch(self, recipe: str, record_ids: List[str]) -> None:
+        """Loads the details of records in the background, if not cached"""
+        try:
+            signature = self._signature(recipe)
+        except sqlite3.OperationalError:
+            return
+        with self._lock:
+            for record_id in record_ids:
+                key = (recipe, record_id, signature)
+                if key in self._entries or key in self._loading:
+                    continue
+                self._loading[key] = self._executor.submit(self._prefetch, key)
+
+    def _signature(self, recipe: str) -> DatabaseSignature:
+        return database_signature(recipe)
+
+    def _prefetch(self, key: DetailKey) -> RecordDetails:
+        try:
+            return self._fill(key)
+        except Exception as e:
+            logger.debug(f"Could not prefetch the details of {key[1]}: {e}")
+            raise
+        finally:
+            with self._lock:
+                self._loading.pop(key, None)
+
+    def _fill(self, key: DetailKey) -> RecordDetails:
+        recipe, record_id, _ = key
+        details = self._load(recipe, record_id)
+        with self._lock:
+            self._entries[key] = details
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return details
+
+    def clear(self) -> None:
+        """Drops all the cached details"""
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,315 @@
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+
+from ragulate.logging_config import logger
+
+RECORD_METADATA_TABLE = "ragulate_record_metadata"
+
+RECORD_STAGES_TABLE = "ragulate_record_stages"
+
+# stages of a RAG chain, and LIKE patterns (in order, the first match wins) on
+# the class and module of a called component that put its calls in the stage
+RECORD_STAGES = ["retriever", "prompt", "llm", "parser"]
+_STAGE_PATTERNS: list[tuple[str, str, str]] = [
+    ("retriever", "class", "%Retriever"),
+    ("prompt", "class", "%Prompt%"),
+    ("parser", "class", "%Parser"),
+    ("llm", "module", "%.llms.%"),
+    ("llm", "module", "%chat_models%"),
+    ("llm", "class", "%LLM"),
+    ("llm", "class", "Chat%"),
+]
+
+# indexes ragulate adds to the TruLens tables of each recipe database
+RECIPE_INDEXES: dict[str, str] = {
+    # covers the feedback pivot, so results are read from the index alone
+    "ragulate_feedbacks_record_name_status": (
+        "trulens_feedbacks (record_id, name, status, result)"
+    ),
+    # selects the records of a dataset, or those written since a snapshot
+    "ragulate_records_app_id_ts": "trulens_records (app_id, ts)",
+    # selects the feedback results written since a snapshot
+    "ragulate_feedbacks_last_ts": "trulens_feedbacks (last_ts)",
+    # covers metadata filters and metadata option discovery
+    "ragulate_record_metadata_app_key_value": (
+        f"{RECORD_METADATA_TABLE} (app_id, key, value, type, record_id)"
+    ),
+    # covers reading the stage timings of a dataset
+    "ragulate_record_stages_app": (
+        f"{RECORD_STAGES_TABLE} (app_id, record_id, stage, seconds)"
+    ),
+}
+
+# indexes of earlier versions, superseded by the ones above
+_SUPERSEDED_INDEXES = ["ragulate_records_app_id"]
+
+
+def _insert_record_metadata(record: str, source: str = "") -> str:
+    """Returns an insert of the scalar `$.meta` values of a record"""
+    return f"""
+        INSERT OR REPLACE INTO {RECORD_METADATA_TABLE}
+            (record_id, app_id, key, value, type)
+        SELECT {record}.record_id, {record}.app_id, m.key, m.value, m.type
+        FROM {source}json_each(
+            CASE WHEN json_valid({record}.record_json)
+            THEN {record}.record_json ELSE '{{}}' END,
+            '$.meta'
+        ) m
+        WHERE m.key IS NOT NULL AND m.type NOT IN ('object', 'array', 'null');
+    """
+
+
+def _stage_case(call: str) -> str:
+    """Returns a CASE expression of the stage of a call, if any"""
+    fields = {
+        "class": f"json_extract({call}.value, '$.stack[#-1].method.obj.cls.name')",
+        "module": (
+            f"json_extract({call}.value, "
+            "'$.stack[#-1].method.obj.cls.module.module_name')"
+        ),
+    }
+    whens = " ".join(
+        f"WHEN {fields[field]} LIKE '{pattern}' THEN '{stage}'"
+        for stage, field, pattern in _STAGE_PATTERNS
+    )
+    return f"CASE {whens} END"
+
+
+def _insert_record_stages(record: str, source: str = "") -> str:
+    """Returns an insert of the seconds spent in each stage by a record
+
+    Nested calls on the same component (e.g. `invoke` and the
+    `_get_relevant_documents` it calls) are counted once, as the longest call
+    on its path, and the components of a stage are summed.
+    """
+    # julianday keeps milliseconds, so round off the float noise below that
+    seconds = (
+        "ROUND((julianday(json_extract(c.value, '$.perf.end_time'))"
+        " - julianday(json_extract(c.value, '$.perf.start_time'))) * 86400.0, 3)"
+    )
+    return f"""
+        INSERT OR REPLACE INTO {RECORD_STAGES_TABLE}
+            (record_id, app_id, stage, seconds)
+        SELECT record_id, app_id, stage, SUM(seconds)
+        FROM (
+            SELECT
+                {record}.record_id AS record_id,
+                {record}.app_id AS app_id,
+                {_stage_case(call="c")} AS stage,
+                json_extract(c.value, '$.stack[#-1].path') AS path,
+                MAX({seconds}) AS seconds
+            FROM {source}json_each(
+                CASE WHEN json_valid({record}.record_json)
+                THEN {record}.record_json ELSE '{{}}' END,
+                '$.calls'
+            ) c
+            GROUP BY 1, 3, 4
+        )
+        WHERE stage IS NOT NULL AND seconds IS NOT NULL
+        GROUP BY record_id, stage;
+    """
+
+
+# tables and triggers that keep one row per (record_id, key) with the scalar
+# metadata of each record, so metadata can be filtered with an index, and one
+# row per (record_id, stage) with the seconds the record spent in the stage.
+# The triggers run inside the transaction TruLens writes each record in, and
+# walk the `$.meta` and `$.calls` of its json, so every insert pays for a pass
+# over its calls. That's why they are only created by the commands that write
+# recipes (see `ensure_schema`), never from a reader.
+RECIPE_TABLES: dict[str, str] = {
+    RECORD_METADATA_TABLE: f"""
+        CREATE TABLE IF NOT EXISTS {RECORD_METADATA_TABLE} (
+            record_id TEXT NOT NULL,
+            app_id TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value,
+            type TEXT NOT NULL,
+            PRIMARY KEY (record_id, key)
+        ) WITHOUT ROWID
+    """,
+    RECORD_STAGES_TABLE: f"""
+        CREATE TABLE IF NOT EXISTS {RECORD_STAGES_TABLE} (
+            record_id TEXT NOT NULL,
+            app_id TEXT NOT NULL,
+            stage TEXT NOT NULL,
+            seconds REAL NOT NULL,
+            PRIMARY KEY (record_id, stage)
+        ) WITHOUT ROWID
+    """,
+}
+
+RECIPE_TRIGGERS: dict[str, str] = {
+    "ragulate_record_metadata_insert": f"""
+        CREATE TRIGGER IF NOT EXISTS ragulate_record_metadata_insert
+        AFTER INSERT ON trulens_records
+        BEGIN
+            {_insert_record_metadata(record="NEW")}
+        END
+    """,
+    "ragulate_record_metadata_update": f"""
+        CREATE TRIGGER IF NOT EXISTS ragulate_record_metadata_update
+        AFTER UPDATE OF record_json, app_id ON trulens_records
+        BEGIN
+            DELETE FROM {RECORD_METADATA_TABLE} WHERE record_id = OLD.record_id;
+            {_insert_record_metadata(record="NEW")}
+        END
+    """,
+    "ragulate_record_metadata_delete": f"""
+        CREATE TRIGGER IF NOT EXISTS ragulate_record_metadata_delete
+        AFTER DELETE ON trulens_records
+        BEGIN
+            DELETE FROM {RECORD_METADATA_TABLE} WHERE record_id = OLD.record_id;
+        END
+    """,
+    "ragulate_record_stages_insert": f"""
+        CREATE TRIGGER IF NOT EXISTS ragulate_record_stages_insert
+        AFTER INSERT ON trulens_records
+        BEGIN
+            {_insert_record_stages(record="NEW")}
+        END
+    """,
+    "ragulate_record_stages_update": f"""
+        CREATE TRIGGER IF NOT EXISTS ragulate_record_stages_update
+        AFTER UPDATE OF record_json, app_id ON trulens_records
+        BEGIN
+            DELETE FROM {RECORD_STAGES_TABLE} WHERE record_id = OLD.record_id;
+            {_insert_record_stages(record="NEW")}
+        END
+    """,
+    "ragulate_record_stages_delete": f"""
+        CREATE TRIGGER IF NOT EXISTS ragulate_record_stages_delete
+        AFTER DELETE ON trulens_records
+        BEGIN
+            DELETE FROM {RECORD_STAGES_TABLE} WHERE record_id = OLD.record_id;
+        END
+    """,
+}
+
+_REQUIRED_TABLES = {"trulens_feedbacks", "trulens_records"}
+
+_lock = threading.Lock()
+
+# recipe databases (by file identity) known to have the ragulate schema
+_ensured: set[tuple[int, int]] = set()
+
+
+def metadata_path(key: str) -> str:
+    """Returns the json path of a record metadata key
+
+    The key is quoted, so keys with dots are one label.
+    """
+    return f'$.meta."{key}"'
+
+
+def recipe_database_path(recipe: str) -> str:
+    """Returns the path of the sqlite database for a recipe"""
+    return f"{recipe.removesuffix('.sqlite')}.sqlite"
+
+
+def _schema_names(conn: sqlite3.Connection, object_type: str) -> set[str]:
+    return {
+        row[0]
+        for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = ?", [object_type]
+        )
+    }
+
+
+def missing_indexes(conn: sqlite3.Connection) -> list[str]:
+    """Returns the names of the ragulate indexes missing from a database"""
+    existing = _schema_names(conn, "index")
+    return [name for name in RECIPE_INDEXES if name not in existing]
+
+
+def missing_schema(conn: sqlite3.Connection) -> list[str]:
+    """Returns the names of the ragulate tables, triggers and indexes missing"""
+    missing = [
+        name for name in RECIPE_TABLES if name not in _schema_names(conn, "table")
+    ]
+    existing_triggers = _schema_names(conn, "trigger")
+    missing.extend(name for name in RECIPE_TRIGGERS if name not in existing_triggers)
+    missing.extend(missing_indexes(conn))
+    return missing
+
+
+def has_record_metadata(conn: sqlite3.Connection) -> bool:
+    """Returns True if the metadata side table is there, and kept up to date"""
+    return RECORD_METADATA_TABLE in _schema_names(conn, "table") and set(
+        RECIPE_TRIGGERS
+    ).issubset(_schema_names(conn, "trigger"))
+
+
+def has_record_stages(conn: sqlite3.Connection) -> bool:
+    """Returns True if the stage timings side table is there, and kept up to date"""
+    return RECORD_STAGES_TABLE in _schema_names(conn, "table") and set(
+        RECIPE_TRIGGERS
+    ).issubset(_schema_names(conn, "trigger"))
+
+
+def _create_schema(conn: sqlite3.Connection) -> None:
+    for sql in RECIPE_TABLES.values():
+        conn.execute(sql)
+    for name, definition in RECIPE_INDEXES.items():
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {definition}")
+    for name in _SUPERSEDED_INDEXES:
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+    for sql in RECIPE_TRIGGERS.values():
+        conn.execute(sql)
+
+    # rebuild from the records written while the triggers weren't there
+    conn.execute(f"DELETE FROM {RECORD_METADATA_TABLE}")
+    conn.execute(_insert_record_metadata(record="r", source="trulens_records r, "))
+    conn.execute(f"DELETE FROM {RECORD_STAGES_TABLE}")
+    conn.execute(_insert_record_stages(record="r", source="trulens_records r, "))
+    conn.execute("ANALYZE")
+
+
+def ensure_schema(recipe: str, force: bool = False) -> bool:
+    """Creates the ragulate tables and indexes in a recipe database, if missing.
+
+    This writes to the database (and backfills the side tables from the
+    existing records), so it is only called by the commands that write recipes,
+    `ragulate query` and `ragulate run`, and by `ragulate update-schema`. The UI
+    never calls it: its connections are read only, and fall back to reading
+    the TruLens tables when the schema is missing.
+
+    This is cheap to call repeatedly: once a database file is known to have the
+    schema it isn't checked again, unless `force` is set (for example after the
+    TruLens tables were reset). If the database can't be written to right now
+    (it is locked or read only), a warning is logged and False is returned, so
+    reads still work, just without the ragulate schema.
+    """
+    database_path = recipe_database_path(recipe)
+    try:
+        stat = os.stat(database_path)
+    except FileNotFoundError:
+        return False
+    identity = (stat.st_dev, stat.st_ino)
+    if not force and identity in _ensured:
+        return True
+
+    with _lock:
+        if not force and identity in _ensured:
+            return True
+        try:
+            conn = sqlite3.connect(database_path, timeout=1)
+            try:
+                if not _REQUIRED_TABLES.issubset(_schema_names(conn, "table")):
+                    # TruLens hasn't created its tables yet
+                    return False
+                missing = missing_schema(conn)
+                if len(missing) > 0:
+                    with conn:
+                        _create_schema(conn)
+                    logger.info(f"Created {missing} in {database_path}")
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f"Could not update the schema of {database_path}: {e}")
+            return False
+        _ensured.add(identity)
+    return True
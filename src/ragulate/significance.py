@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+from itertools import combinations
+from typing import Any, Dict, Iterator, List
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_RESAMPLES = 10_000
+DEFAULT_CONFIDENCE = 0.95
+
+# resamples are drawn as (resamples x values) matrices, in chunks of about
+# this many elements, so memory stays bounded for large datasets
+MAX_CHUNK_ELEMENTS = 1 << 22
+
+
+def _chunk_sizes(resamples: int, values: int) -> Iterator[int]:
+    size = max(1, MAX_CHUNK_ELEMENTS // max(1, values))
+    for start in range(0, resamples, size):
+        yield min(size, resamples - start)
+
+
+def bootstrap_means(
+    values: np.ndarray, resamples: int, rng: np.random.Generator
+) -> np.ndarray:
+    """Returns the means of bootstrap resamples of the values"""
+    means = np.empty(resamples)
+    start = 0
+    for size in _chunk_sizes(resamples, len(values)):
+        indexes = rng.integers(0, len(values), size=(size, len(values)))
+        means[start : start + size] = values[indexes].mean(axis=1)
+        start += size
+    return means
+
+
+def sign_flip_means(
+    differences: np.ndarray, resamples: int, rng: np.random.Generator
+) -> np.ndarray:
+    """Returns the mean paired differences with randomly swapped pairs"""
+    means = np.empty(resamples)
+    start = 0
+    for size in _chunk_sizes(resamples, len(differences)):
+        flips = rng.random((size, len(differences))) < 0.5  # noqa: PLR2004
+        signs = np.where(flips, -1.0, 1.0)
+        means[start : start + size] = signs @ differences / len(differences)
+        start += size
+    return means
+
+
+def _interval(means: np.ndarray, confidence: float) -> List[float]:
+    tail = (1 - confidence) / 2
+    low, high = np.quantile(means, [tail, 1 - tail])
+    return [float(low), float(high)]
+
+
+def confidence_intervals(
+    df: pd.DataFrame,
+    metrics: List[str],
+    resamples: int = DEFAULT_RESAMPLES,
+    confidence: float = DEFAULT_CONFIDENCE,
+    seed: int = 0,
+) -> pd.DataFrame:
+    """Returns bootstrap confidence intervals of the mean of each metric
+
+    `df` is shaped like the output of `get_chart_data`: a row per record, with
+    `recipe` and `dataset` columns and a column per metric. There is a row per
+    dataset, recipe and metric, with the mean and its confidence interval.
+    """
+    rng = np.random.default_rng(seed)
+    rows: List[Dict[str, Any]] = []
+    for (dataset, recipe), group in df.groupby(["dataset", "recipe"], sort=True):
+        for metric in metrics:
+            values = np.empty(0)
+            if metric in group.columns:
+                values = group[metric].dropna().to_numpy(dtype=float)
+            row: Dict[str, Any] = {
+                "dataset": dataset,
+                "recipe": recipe,
+                "metric": metric,
+                "count": len(values),
+                "mean": np.nan,
+                "ci_low": np.nan,
+                "ci_high": np.nan,
+            }
+            if len(values) > 0:
+                means = bootstrap_means(values, resamples=resamples, rng=rng)
+                row["mean"] = float(values.mean())
+                row["ci_low"], row["ci_high"] = _interval(means, confidence)
+            rows.append(row)
+    return pd.DataFrame(
+        rows,
+        columns=["dataset", "recipe", "metric", "count", "mean", "ci_low", "ci_high"],
+    )
+
+
+def paired_tests(
+    df: pd.DataFrame,
+    recipes: List[str],
+    metrics: List[str],
+    resamples: int = DEFAULT_RESAMPLES,
+    confidence: float = DEFAULT_CONFIDENCE,
+    seed: int = 0,
+) -> pd.DataFrame:
+    """Returns paired comparisons of each metric between each pair of recipes
+
+    `df` is shaped like the output of `get_paired_data`: a row per query,
+    with a `<metric>_<recipe>` column per metric and recipe. Only the queries
+    both recipes have a value for are compared. There is a row per pair of
+    recipes and metric, with the mean difference (first minus second), its
+    bootstrap confidence interval, and the two sided p-value of a paired
+    permutation (sign flip) test of the difference being zero.
+    """
+    rng = np.random.default_rng(seed)
+    rows: List[Dict[str, Any]] = []
+    for first, second in combinations(recipes, 2):
+        for metric in metrics:
+            columns = [f"{metric}_{first}", f"{metric}_{second}"]
+            differences = np.empty(0)
+            if set(columns).issubset(df.columns):
+                differences = (
+                    (df[columns[0]] - df[columns[1]]).dropna().to_numpy(dtype=float)
+                )
+            row: Dict[str, Any] = {
+                "recipe": first,
+                "other_recipe": second,
+                "metric": metric,
+                "count": len(differences),
+                "mean_difference": np.nan,
+                "ci_low": np.nan,
+                "ci_high": np.nan,
+                "p_value": np.nan,
+            }
+            if len(differences) > 0:
+                observed = float(differences.mean())
+                means = bootstrap_means(differences, resamples=resamples, rng=rng)
+                flipped = sign_flip_means(differences, resamples=resamples, rng=rng)
+                # counting the observed difference, so the p-value is never 0
+                extreme = np.count_nonzero(np.abs(flipped) >= abs(observed) - 1e-12)
+                row["mean_difference"] = observed
+                row["ci_low"], row["ci_high"] = _interval(means, confidence)
+                row["p_value"] = (extreme + 1) / (resamples + 1)
+            rows.append(row)
+    return pd.DataFrame(
+        rows,
+        columns=[
+            "recipe",
+            "other_recipe",
+            "metric",
+            "count",
+            "mean_difference",
+            "ci_low",
+            "ci_high",
+            "p_value",
+        ],
+    )
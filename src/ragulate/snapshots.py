@@ -0,0 +1,573 @@
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+from urllib.parse import quote
+
+import pandas as pd
+
+from ragulate.connections import get_connection_pool
+from ragulate.logging_config import logger
+from ragulate.schema import (
+    RECORD_METADATA_TABLE,
+    RECORD_STAGES,
+    RECORD_STAGES_TABLE,
+    has_record_metadata,
+    has_record_stages,
+    metadata_path,
+    recipe_database_path,
+)
+
+SNAPSHOT_VERSION = 4
+
+SNAPSHOT_ROOT = os.path.join(".ragulate", "snapshots")
+
+# rows are re-read from a little before the watermarks, to pick up records and
+# feedbacks that were written out of timestamp order by concurrent workers
+WATERMARK_SLACK_SECONDS = 300.0
+
+# seconds each record spent in each stage of the chain
+STAGE_COLUMNS = [f"{stage}_latency" for stage in RECORD_STAGES]
+
+SNAPSHOT_COLUMNS = [
+    "record_id",
+    "input",
+    "metadata",
+    "total_tokens",
+    "completion_tokens",
+    "start_time",
+    "latency",
+    *STAGE_COLUMNS,
+    "ts",
+]
+
+# snapshot files are sqlite databases: a json header with the version,
+# signature, watermarks and feedbacks of the snapshot, and a table of its rows
+_HEADER_TABLE = "snapshot_header"
+_FRAME_TABLE = "snapshot_frame"
+
+# (inode, size, mtime_ns) of the database file, and of its WAL file if any
+FileSignature = Tuple[int, int, int]
+DatabaseSignature = Tuple[FileSignature, FileSignature | None]
+
+# how many snapshots are kept in memory, so refreshing a page while a run is
+# in progress only merges in the new rows, without reading the snapshot file
+MEMORY_SNAPSHOTS = 32
+
+_locks_lock = threading.Lock()
+_locks: Dict[str, threading.Lock] = {}
+
+_memory_lock = threading.Lock()
+_memory: OrderedDict[str, _Snapshot] = OrderedDict()
+
+
+def _file_signature(path: str) -> FileSignature | None:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+def database_signature(recipe: str) -> DatabaseSignature:
+    """Returns the signature of a recipe database, which changes with any write"""
+    database_path = recipe_database_path(recipe)
+    signature = _file_signature(database_path)
+    if signature is None:
+        raise sqlite3.OperationalError(f"unable to open database file: {database_path}")
+    return signature, _file_signature(f"{database_path}-wal")
+
+
+def compute_latency(start_time: pd.Series, end_time: pd.Series) -> pd.Series:
+    """Returns the seconds between the (ISO8601) start and end times"""
+    # parse the timestamps for all rows at once, rather than row by row in sqlite
+    start = pd.to_datetime(start_time, format="ISO8601")
+    end = pd.to_datetime(end_time, format="ISO8601")
+    return (end - start).dt.total_seconds()
+
+
+def compute_timestamp(time: pd.Series) -> pd.Series:
+    """Returns the (ISO8601) times as seconds since the epoch"""
+    parsed = pd.to_datetime(time, format="ISO8601")
+    return (parsed - pd.Timestamp(0, tz=parsed.dt.tz)).dt.total_seconds()
+
+
+def filter_by_metadata(
+    df: pd.DataFrame, recipe: str, dataset: str, metadata_filter: Dict[str, Any]
+) -> pd.DataFrame:
+    """Returns the rows of a snapshot whose metadata matches all the filters
+
+    The matching records are selected in the recipe database, with the
+    metadata index when it is there, so values compare the same way as in the
+    other queries of the data layer.
+    """
+    if len(metadata_filter) == 0:
+        return df
+
+    params: List[Any] = []
+    with get_connection_pool().connection(recipe=recipe) as conn:
+        if has_record_metadata(conn):
+            selects = []
+            for key, value in metadata_filter.items():
+                selects.append(
+                    f"SELECT record_id FROM {RECORD_METADATA_TABLE} "
+                    "WHERE app_id = ? AND key = ? AND value = ?"
+                )
+                params.extend([dataset, key, value])
+            query = " INTERSECT ".join(selects)
+        else:
+            # the ragulate schema wasn't created, so decode the metadata in sqlite
+            wheres = ["app_id = ?"]
+            params.append(dataset)
+            for key, value in metadata_filter.items():
+                wheres.append("json_extract(record_json, ?) = ?")
+                params.extend([metadata_path(key), value])
+            query = (
+                f"SELECT record_id FROM trulens_records WHERE {' AND '.join(wheres)}"
+            )
+        record_ids = [row[0] for row in conn.execute(query, params)]
+    return df[df["record_id"].isin(record_ids)]
+
+
+class _Snapshot:
+    """The contents of a snapshot file."""
+
+    version: int
+    signature: DatabaseSignature
+    record_watermark: float | None
+    feedback_watermark: float | None
+    feedbacks: List[str]
+    frame: pd.DataFrame
+    # ids of the rows changed since the snapshot file was written, or None if
+    # the file has to be written from scratch
+    changed: pd.Index | None
+
+    def __init__(
+        self,
+        signature: DatabaseSignature,
+        record_watermark: float | None,
+        feedback_watermark: float | None,
+        feedbacks: List[str],
+        frame: pd.DataFrame,
+        changed: pd.Index | None = None,
+    ):
+        self.version = SNAPSHOT_VERSION
+        self.signature = signature
+        self.record_watermark = record_watermark
+        self.feedback_watermark = feedback_watermark
+        self.feedbacks = feedbacks
+        self.frame = frame
+        self.changed = changed
+
+    def header(self) -> Dict[str, Any]:
+        """Returns everything but the frame, as json serializable values"""
+        return {
+            "version": self.version,
+            "signature": self.signature,
+            "record_watermark": self.record_watermark,
+            "feedback_watermark": self.feedback_watermark,
+            "feedbacks": self.feedbacks,
+            # sqlite doesn't keep the type of columns that are all empty
+            "float_columns": [
+                column
+                for column, dtype in self.frame.dtypes.items()
+                if dtype.kind == "f"
+            ],
+        }
+
+    @classmethod
+    def from_header(cls, header: Dict[str, Any], frame: pd.DataFrame) -> _Snapshot:
+        """Returns the snapshot of a header and frame read back from a file"""
+        return cls(
+            signature=_parse_signature(header["signature"]),
+            record_watermark=header["record_watermark"],
+            feedback_watermark=header["feedback_watermark"],
+            feedbacks=header["feedbacks"],
+            frame=frame.astype({c: float for c in header["float_columns"]}),
+            changed=pd.Index([]),
+        )
+
+
+class RecipeSnapshot:
+    """Snapshot of the records of a dataset in a recipe database.
+
+    The snapshot holds one row per record, with its id, query, metadata, tokens,
+    start time, latency (overall and per stage) and a column per feedback
+    result, so pages can be drawn without re-extracting everything from the
+    TruLens json columns. It is refreshed when the database (or its WAL)
+    changes: records and feedback results newer than the snapshot's watermarks
+    are merged in, and it is only rebuilt from scratch when the database file
+    was replaced or records went missing.
+
+    Snapshots are kept on disk, and the most recently used ones in memory, so
+    a refresh during a run costs a couple of stats and a query for the rows
+    written since the last load. Only the changed rows are written back to
+    the snapshot file.
+    """
+
+    recipe: str
+    dataset: str
+    root_path: str
+
+    def __init__(self, recipe: str, dataset: str, root_path: str = SNAPSHOT_ROOT):
+        self.recipe = recipe
+        self.dataset = dataset
+        self.root_path = root_path
+
+    @property
+    def path(self) -> str:
+        """Returns the path of the snapshot file"""
+        return os.path.join(
+            self.root_path,
+            quote(self.recipe, safe=""),
+            f"{quote(self.dataset, safe='')}.db",
+        )
+
+    def _lock(self) -> threading.Lock:
+        key = os.path.abspath(self.path)
+        with _locks_lock:
+            return _locks.setdefault(key, threading.Lock())
+
+    def _read(self) -> _Snapshot | None:
+        if not os.path.isfile(self.path):
+            return None
+        try:
+            uri = f"{Path(os.path.abspath(self.path)).as_uri()}?mode=ro"
+            conn = sqlite3.connect(uri, uri=True)
+            try:
+                [header_json] = conn.execute(
+                    f"SELECT header FROM {_HEADER_TABLE}"
+                ).fetchone()
+                header = json.loads(header_json)
+                if header.get("version") != SNAPSHOT_VERSION:
+                    return None
+                frame = pd.read_sql_query(f"SELECT * FROM {_FRAME_TABLE}", con=conn)
+            finally:
+                conn.close()
+            return _Snapshot.from_header(header=header, frame=frame)
+        except (sqlite3.Error, ValueError, TypeError, KeyError):
+            logger.warning(f"Ignoring unreadable snapshot {self.path}")
+            return None
+
+    def _recall(self) -> _Snapshot | None:
+        key = os.path.abspath(self.path)
+        with _memory_lock:
+            snapshot = _memory.get(key)
+            if snapshot is not None:
+                _memory.move_to_end(key)
+        return snapshot
+
+    def _remember(self, snapshot: _Snapshot) -> None:
+        key = os.path.abspath(self.path)
+        with _memory_lock:
+            _memory[key] = snapshot
+            _memory.move_to_end(key)
+            while len(_memory) > MEMORY_SNAPSHOTS:
+                _memory.popitem(last=False)
+
+    def _write(self, snapshot: _Snapshot, previous: DatabaseSignature) -> None:
+        try:
+            if snapshot.changed is None or not self._write_changes(snapshot, previous):
+                self._write_all(snapshot)
+        except (OSError, sqlite3.Error) as e:
+            # for example a read only working directory, so the snapshot is
+            # only kept in memory
+            logger.warning(f"Could not write snapshot {self.path}: {e}")
+            return
+        snapshot.changed = pd.Index([])
+
+    def _write_all(self, snapshot: _Snapshot) -> None:
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        # write to a temp file and rename, so readers never see a partial snapshot
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".snapshot")
+        os.close(fd)
+        try:
+            conn = sqlite3.connect(temp_path)
+            try:
+                with conn:
+                    conn.execute(f"CREATE TABLE {_HEADER_TABLE} (header TEXT NOT NULL)")
+                    conn.execute(
+                        f"INSERT INTO {_HEADER_TABLE} VALUES (?)",
+                        [json.dumps(snapshot.header())],
+                    )
+                snapshot.frame.to_sql(_FRAME_TABLE, con=conn, index=False)
+                with conn:
+                    conn.execute(
+                        f"CREATE UNIQUE INDEX {_FRAME_TABLE}_record_id "
+                        f"ON {_FRAME_TABLE} (record_id)"
+                    )
+            finally:
+                conn.close()
+            os.replace(temp_path, self.path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    def _write_changes(self, snapshot: _Snapshot, previous: DatabaseSignature) -> bool:
+        """Upserts the changed rows into the snapshot file, in one transaction
+
+        Returns False, without writing, unless the file holds the snapshot as it
+        was before the update, with the same columns.
+        """
+        if not os.path.isfile(self.path):
+            return False
+        columns = list(snapshot.frame.columns)
+        rows = snapshot.frame[snapshot.frame["record_id"].isin(snapshot.changed)]
+        # plain python values (and NULL for missing ones), which sqlite can bind
+        values = rows.astype(object).where(rows.notna(), None)
+        names = ", ".join(f'"{column}"' for column in columns)
+        updates = ", ".join(f'"{column}" = excluded."{column}"' for column in columns)
+        conn = sqlite3.connect(self.path)
+        try:
+            with conn:
+                row = conn.execute(f"SELECT header FROM {_HEADER_TABLE}").fetchone()
+                header = json.loads(row[0])
+                if (
+                    header.get("version") != SNAPSHOT_VERSION
+                    or _parse_signature(header["signature"]) != previous
+                    or header["feedbacks"] != snapshot.feedbacks
+                ):
+                    return False
+                # existing rows are updated in place, so they keep their order
+                conn.executemany(
+                    f"INSERT INTO {_FRAME_TABLE} ({names}) "
+                    f"VALUES ({', '.join('?' * len(columns))}) "
+                    f"ON CONFLICT (record_id) DO UPDATE SET {updates}",
+                    values.itertuples(index=False, name=None),
+                )
+                conn.execute(
+                    f"UPDATE {_HEADER_TABLE} SET header = ?",
+                    [json.dumps(snapshot.header())],
+                )
+        except (sqlite3.Error, ValueError, TypeError, KeyError) as e:
+            logger.warning(f"Rewriting snapshot {self.path}: {e}")
+            return False
+        finally:
+            conn.close()
+        return True
+
+    def load(self) -> Tuple[pd.DataFrame, List[str]]:
+        """Returns the (refreshed) snapshot frame, and the feedback names"""
+        with self._lock():
+            signature = database_signature(self.recipe)
+            snapshot = self._recall()
+            if snapshot is None:
+                snapshot = self._read()
+            if snapshot is not None and snapshot.signature == signature:
+                self._remember(snapshot)
+                return snapshot.frame, snapshot.feedbacks
+
+            with get_connection_pool().connection(recipe=self.recipe) as conn:
+                if snapshot is not None and self._can_update(snapshot, signature):
+                    snapshot = self._update(conn=conn, snapshot=snapshot)
+                if snapshot is None:
+                    snapshot = self._build(conn=conn, signature=signature)
+            previous = snapshot.signature
+            # the signature from before reading, so later writes cause a refresh
+            snapshot.signature = signature
+            self._write(snapshot, previous=previous)
+            self._remember(snapshot)
+            return snapshot.frame, snapshot.feedbacks
+
+    def _can_update(self, snapshot: _Snapshot, signature: DatabaseSignature) -> bool:
+        (inode, size, _), _ = signature
+        (old_inode, old_size, _), _ = snapshot.signature
+        # a replaced or truncated database means records may have been removed
+        return inode == old_inode and size >= old_size
+
+    def _feedback_names(self, conn: sqlite3.Connection) -> List[str]:
+        rows = conn.execute(
+            """
+            SELECT DISTINCT
+                json_extract(feedback_json, '$.supplied_name') as name
+            FROM
+                trulens_feedback_defs
+            """
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def _read_records(
+        self, conn: sqlite3.Connection, since: float | None
+    ) -> pd.DataFrame:
+        wheres = ["app_id = ?"]
+        params: List[Any] = [self.dataset]
+        if since is not None:
+            wheres.append("ts >= ?")
+            params.append(since)
+        df = pd.read_sql_query(
+            sql=f"""
+                SELECT
+                    record_id,
+                    CASE WHEN json_valid(input) THEN json_extract(input, '$')
+                    ELSE input END AS input,
+                    json_extract(record_json, '$.meta') AS metadata,
+                    json_extract(cost_json, '$.n_tokens') AS total_tokens,
+                    json_extract(cost_json, '$.n_completion_tokens')
+                        AS completion_tokens,
+                    json_extract(perf_json, '$.start_time') AS start_time,
+                    json_extract(perf_json, '$.end_time') AS end_time,
+                    ts
+                FROM
+                    trulens_records
+                WHERE
+                    {" AND ".join(wheres)}
+                """,
+            con=conn,
+            params=params,
+        )
+        start_time = df.pop("start_time")
+        df.insert(5, "start_time", compute_timestamp(start_time))
+        df.insert(6, "latency", compute_latency(start_time, df.pop("end_time")))
+        stages = self._read_stages(conn=conn, since=since)
+        return df.join(stages, on="record_id").reindex(columns=SNAPSHOT_COLUMNS)
+
+    def _read_stages(
+        self, conn: sqlite3.Connection, since: float | None
+    ) -> pd.DataFrame:
+        if not has_record_stages(conn):
+            # the ragulate schema wasn't created, so the timings are unknown
+            return pd.DataFrame(columns=STAGE_COLUMNS, dtype=float)
+        wheres = ["r.app_id = ?"]
+        params: List[Any] = [self.dataset]
+        if since is not None:
+            wheres.append("r.ts >= ?")
+            params.append(since)
+        stages = pd.read_sql_query(
+            sql=f"""
+                SELECT
+                    s.record_id, s.stage, s.seconds
+                FROM
+                    {RECORD_STAGES_TABLE} s
+                    JOIN trulens_records r ON r.record_id = s.record_id
+                WHERE
+                    {" AND ".join(wheres)}
+                """,
+            con=conn,
+            params=params,
+        )
+        pivot = stages.pivot(index="record_id", columns="stage", values="seconds")
+        pivot = pivot.reindex(columns=RECORD_STAGES).astype(float)
+        pivot.columns = pd.Index(STAGE_COLUMNS)
+        return pivot
+
+    def _read_feedbacks(
+        self, conn: sqlite3.Connection, since: float | None
+    ) -> pd.DataFrame:
+        wheres = ["r.app_id = ?", "f.status = 'done'"]
+        params: List[Any] = [self.dataset]
+        join, group = "JOIN", "f.record_id"
+        if since is not None:
+            wheres.append("f.last_ts >= ?")
+            params.append(since)
+            # start from the results written since, by their timestamp index,
+            # rather than from every record of the dataset (sqlite keeps the
+            # order of a CROSS JOIN, and `+` stops it grouping by an index)
+            join, group = "CROSS JOIN", "+f.record_id"
+        return pd.read_sql_query(
+            sql=f"""
+                SELECT
+                    f.record_id, f.name, MAX(f.result) AS result, MAX(f.last_ts) AS ts
+                FROM
+                    trulens_feedbacks f
+                    {join} trulens_records r ON r.record_id = f.record_id
+                WHERE
+                    {" AND ".join(wheres)}
+                GROUP BY
+                    {group}, f.name
+                """,
+            con=conn,
+            params=params,
+        )
+
+    def _pivot(self, results: pd.DataFrame, feedbacks: List[str]) -> pd.DataFrame:
+        pivot = results.pivot(index="record_id", columns="name", values="result")
+        return pivot.reindex(columns=feedbacks).astype(float)
+
+    def _build(
+        self, conn: sqlite3.Connection, signature: DatabaseSignature
+    ) -> _Snapshot:
+        feedbacks = self._feedback_names(conn)
+        records = self._read_records(conn=conn, since=None)
+        results = self._read_feedbacks(conn=conn, since=None)
+
+        frame = records.join(self._pivot(results, feedbacks), on="record_id")
+        logger.debug(f"Built snapshot of {self.recipe}/{self.dataset}")
+        return _Snapshot(
+            signature=signature,
+            record_watermark=_max(records["ts"]),
+            feedback_watermark=_max(results["ts"]),
+            feedbacks=feedbacks,
+            frame=frame.reset_index(drop=True),
+        )
+
+    def _update(
+        self, conn: sqlite3.Connection, snapshot: _Snapshot
+    ) -> _Snapshot | None:
+        feedbacks = self._feedback_names(conn)
+        records = self._read_records(conn=conn, since=_since(snapshot.record_watermark))
+        results = self._read_feedbacks(
+            conn=conn, since=_since(snapshot.feedback_watermark)
+        )
+
+        frame = snapshot.frame.set_index("record_id")
+        new_records = records.set_index("record_id")
+        # a hash lookup in the snapshot's index, rather than isin over its ids
+        new_records = new_records[frame.index.get_indexer(new_records.index) == -1]
+        frame = pd.concat([frame, new_records]).reindex(
+            columns=SNAPSHOT_COLUMNS[1:] + feedbacks
+        )
+        frame.update(self._pivot(results, feedbacks))
+
+        count = conn.execute(
+            "SELECT COUNT(*) FROM trulens_records WHERE app_id = ?", [self.dataset]
+        ).fetchone()[0]
+        if count != len(frame):
+            # records were written with older timestamps, or were deleted
+            return None
+
+        snapshot.record_watermark = _max(
+            pd.concat([records["ts"], pd.Series([snapshot.record_watermark])])
+        )
+        snapshot.feedback_watermark = _max(
+            pd.concat([results["ts"], pd.Series([snapshot.feedback_watermark])])
+        )
+        if snapshot.changed is not None and feedbacks == snapshot.feedbacks:
+            snapshot.changed = snapshot.changed.union(
+                new_records.index.union(pd.Index(results["record_id"]))
+            )
+        else:
+            snapshot.changed = None
+        snapshot.feedbacks = feedbacks
+        snapshot.frame = frame.reset_index(names="record_id")
+        logger.debug(
+            f"Updated snapshot of {self.recipe}/{self.dataset} with "
+            f"{len(new_records)} records and {len(results)} feedback results"
+        )
+        return snapshot
+
+
+def _parse_signature(value: Any) -> DatabaseSignature:
+    """Returns a database signature read back from json"""
+    database, wal = value
+    return tuple(database), None if wal is None else tuple(wal)
+
+
+def _max(values: pd.Series) -> float | None:
+    value = values.max()
+    return None if pd.isna(value) else float(value)
+
+
+def _since(watermark: float | None) -> float | None:
+    return None if watermark is None else watermark - WATERMARK_SLACK_SECONDS
+
+
+def load_snapshot(recipe: str, dataset: str) -> Tuple[pd.DataFrame, List[str]]:
+    """Returns the snapshot frame of a dataset in a recipe, and its feedbacks"""
+    return RecipeSnapshot(recipe=recipe, dataset=dataset).load()
@@ -8,9 +8,15 @@ from typing import Any, Dict, List, Tuple
 
 import streamlit as st
 
-from ragulate.data import get_all_recipes, get_datasets_and_metadata
+from ragulate.catalog import RecipeDatasets, get_recipe_catalog
+from ragulate.data import get_all_recipes
 from ragulate.ui import state
-from ragulate.ui.utils import write_button_row
+from ragulate.ui.utils import (
+    get_catalog_version,
+    get_recipe_versions,
+    write_button_row,
+    write_live_updates,
+)
 
 MetadataMap = Dict[str, Dict[str, Dict[str, Any]]]
 DatasetToRecipeMap = Dict[str, List[str]]
@@ -19,14 +25,33 @@ DATASET_NONE = "<none>"
 
 
 @st.cache_data
+def get_catalog(
+    catalog_version: int, versions: Tuple[int, ...], timestamp: float
+) -> Dict[str, RecipeDatasets]:
+    return get_recipe_catalog()
+
+
+@st.cache_data
+def get_recipes(catalog_version: int, timestamp: float) -> List[str]:
+    return get_all_recipes()
+
+
 def get_datasets_and_recipes(
     timestamp: float,
 ) -> Tuple[DatasetToRecipeMap, MetadataMap]:
     dataset_to_recipe_map: DatasetToRecipeMap = {DATASET_NONE: []}
     metadata_map: MetadataMap = {}
 
-    for recipe in get_all_recipes():
-        for dataset, metadata in get_datasets_and_metadata(recipe=recipe).items():
+    catalog_version = get_catalog_version()
+    recipes = get_recipes(catalog_version=catalog_version, timestamp=timestamp)
+    # the catalog only re-reads the recipe databases that changed
+    catalog = get_catalog(
+        catalog_version=catalog_version,
+        versions=get_recipe_versions(recipes),
+        timestamp=timestamp,
+    )
+    for recipe, datasets in catalog.items():
+        for dataset, metadata in datasets.items():
             if dataset not in dataset_to_recipe_map:
                 dataset_to_recipe_map[dataset] = []
                 metadata_map[dataset] = {}
@@ -97,5 +122,10 @@ def draw_page() -> None:
         selected_recipes = state.get_selected_recipes(dataset=selected_dataset)
         write_button_row("home", disable_non_home=len(selected_recipes) < 2)
 
+    write_live_updates(
+        recipes=sorted({r for rs in dataset_to_recipe_map.values() for r in rs}),
+        catalog=True,
+    )
+
 
 draw_page()
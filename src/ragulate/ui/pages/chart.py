@@ -6,24 +6,90 @@ from pandas import DataFrame
 
 sys.modules["pip._vendor.typing_extensions"] = sys.modules["typing_extensions"]
 
+import matplotlib.pyplot as plt
+import plotly.graph_objects as go
 import streamlit as st
-from plotly.io import to_html, to_image
 from ragulate.analysis import Analysis
 from ragulate.data import get_chart_data
 from ragulate.ui import state
-from ragulate.ui.utils import write_button_row
+from ragulate.ui.utils import (
+    frame_digest,
+    get_recipe_versions,
+    write_button_row,
+    write_live_updates,
+)
 from streamlit_extras.switch_page_button import switch_page
 
 
 @st.cache_data
 def get_data(
-    recipes: List[str], dataset: str, metadata_filter: Dict[str, Any], timestamp: float
+    recipes: List[str],
+    dataset: str,
+    metadata_filter: Dict[str, Any],
+    versions: Tuple[int, ...],
+    timestamp: float,
 ) -> Tuple[DataFrame, List[str]]:
     return get_chart_data(
         recipes=recipes, dataset=dataset, metadata_filter=metadata_filter
     )
 
 
+@st.cache_data
+def get_box_plots(
+    _df: DataFrame, feedbacks: List[str], digest: str
+) -> Dict[str, go.Figure]:
+    # figures are drawn from the quartiles, so they are small to send over
+    return Analysis().box_plots_by_dataset(df=_df, feedbacks=list(feedbacks))
+
+
+@st.cache_data
+def get_histogram_images(
+    _df: DataFrame, feedbacks: List[str], digest: str
+) -> Dict[str, bytes]:
+    images: Dict[str, bytes] = {}
+    histograms = Analysis().histograms_by_dataset(df=_df, feedbacks=list(feedbacks))
+    for dataset, g in histograms.items():
+        buffer = io.BytesIO()
+        g.savefig(buffer, format="png")
+        plt.close(g.figure)
+        images[dataset] = buffer.getvalue()
+    return images
+
+
+@st.cache_data
+def get_significance(
+    recipes: List[str],
+    dataset: str,
+    metadata_filter: Dict[str, Any],
+    _df: DataFrame,
+    feedbacks: List[str],
+    digest: str,
+) -> Tuple[DataFrame, DataFrame]:
+    return Analysis().significance_by_dataset(
+        recipes=recipes,
+        dataset=dataset,
+        df=_df,
+        feedbacks=list(feedbacks),
+        metadata_filter=metadata_filter,
+    )
+
+
+@st.cache_data
+def get_latency_report(
+    _df: DataFrame, feedbacks: List[str], digest: str
+) -> Tuple[DataFrame, DataFrame, DataFrame]:
+    return Analysis().latency_report_by_dataset(df=_df, feedbacks=list(feedbacks))
+
+
+@st.cache_data
+def get_stage_plots(_df: DataFrame, digest: str) -> Dict[str, go.Figure]:
+    return Analysis().stage_latency_by_dataset(df=_df)
+
+
+def significance_key(dataset: str) -> str:
+    return f"chart_significance_{dataset}"
+
+
 def draw_page() -> None:
     st.set_page_config(page_title="Ragulate - Chart", layout="wide")
     button_row_container = st.container()
@@ -42,29 +108,64 @@ def draw_page() -> None:
         recipes=recipes,
         dataset=dataset,
         metadata_filter=metadata_filter,
+        versions=get_recipe_versions(recipes),
         timestamp=state.get_data_timestamp(),
     )
 
-    analysis = Analysis()
-
-    box_plots = analysis.box_plots_by_dataset(df=df, feedbacks=feedbacks)
-    histograms = analysis.histograms_by_dataset(df=df, feedbacks=feedbacks)
+    # rendered figures are cached by the contents of the data they are drawn from
+    digest = frame_digest(df)
+    box_plots = get_box_plots(_df=df, feedbacks=feedbacks, digest=digest)
+    histograms = get_histogram_images(_df=df, feedbacks=feedbacks, digest=digest)
 
     if dataset not in box_plots and dataset not in histograms:
         st.write("Analysis failed")
     else:
-        svg_bytes = to_image(fig=box_plots[dataset], format="svg", scale=1.1)
-
-        st.image(image=svg_bytes.decode("utf-8"))
-
-        g = histograms[dataset]
-        buffer = io.BytesIO()
-        g.savefig(buffer)
-        buffer.seek(0)
-        st.image(buffer.read())
+        st.plotly_chart(box_plots[dataset], use_container_width=False)
+        st.image(histograms[dataset])
+
+        with st.expander("Significance", expanded=False):
+            # streamlit runs the body of a collapsed expander too, so the
+            # resampling only runs once asked for
+            if st.checkbox(
+                "Compute confidence intervals and paired tests",
+                key=significance_key(dataset),
+            ):
+                intervals, tests = get_significance(
+                    recipes=sorted(recipes),
+                    dataset=dataset,
+                    metadata_filter=metadata_filter,
+                    _df=df,
+                    feedbacks=feedbacks,
+                    digest=digest,
+                )
+                st.caption("95% bootstrap confidence intervals of the mean:")
+                st.dataframe(intervals, hide_index=True)
+                st.caption(
+                    "Paired differences on the same queries, with permutation p-values:"
+                )
+                st.dataframe(tests, hide_index=True)
+
+        with st.expander("Latency and throughput", expanded=False):
+            latency, stages, tradeoffs = get_latency_report(
+                _df=df, feedbacks=feedbacks, digest=digest
+            )
+            st.caption("Latency percentiles (seconds) and throughput:")
+            st.dataframe(latency, hide_index=True)
+            st.caption("Latency of each stage, from the calls TruLens recorded:")
+            stage_plots = get_stage_plots(_df=df, digest=digest)
+            if dataset in stage_plots:
+                st.plotly_chart(stage_plots[dataset], use_container_width=False)
+            st.dataframe(stages, hide_index=True)
+            st.caption(
+                "Mean scores next to latency, pareto optimal recipes have no other "
+                "recipe both faster (p95) and better:"
+            )
+            st.dataframe(tradeoffs, hide_index=True)
 
     with button_row_container:
         write_button_row(current_page="chart")
 
+    write_live_updates(recipes=recipes)
+
 
 draw_page()
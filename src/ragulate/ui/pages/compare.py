@@ -14,10 +14,22 @@ import sys
 
 import pandas as pd
 import streamlit as st
-from ragulate.data import get_compare_data, get_detail_data, split_into_dict
+from ragulate.data import (
+    get_chart_data,
+    get_compare_page,
+    get_detail_data,
+    prefetch_detail_data,
+    split_into_dict,
+)
+from ragulate.latency_report import stage_latency_report
+from ragulate.schema import RECORD_STAGES
 from ragulate.ui import state
 from ragulate.ui.column import Column, get_column_defs
-from ragulate.ui.utils import write_button_row
+from ragulate.ui.utils import (
+    get_recipe_versions,
+    write_button_row,
+    write_live_updates,
+)
 from st_aggrid import AgGrid
 from st_aggrid.grid_options_builder import GridOptionsBuilder
 from st_aggrid.shared import GridUpdateMode
@@ -30,11 +42,59 @@ def print_err(any: Any) -> None:
     print(any, file=sys.stderr)
 
 
+SORT_NONE = "<query>"
+
+
 @st.cache_data
 def get_data(
-    recipes: List[str], dataset: str, filter: Dict[str, Any], timestamp: float
-) -> Tuple[pd.DataFrame, List[str]]:
-    return get_compare_data(recipes=recipes, dataset=dataset, metadata_filter=filter)
+    recipes: List[str],
+    dataset: str,
+    filter: Dict[str, Any],
+    page: int,
+    search: str | None,
+    sort_by: str | None,
+    ascending: bool,
+    versions: Tuple[int, ...],
+    timestamp: float,
+) -> Tuple[pd.DataFrame, List[str], int]:
+    return get_compare_page(
+        recipes=recipes,
+        dataset=dataset,
+        metadata_filter=filter,
+        page=page,
+        page_size=PAGINATION_SIZE,
+        search=search,
+        sort_by=sort_by,
+        ascending=ascending,
+    )
+
+
+@st.cache_data
+def get_stage_report(
+    recipes: List[str],
+    dataset: str,
+    filter: Dict[str, Any],
+    versions: Tuple[int, ...],
+    timestamp: float,
+) -> pd.DataFrame:
+    df, _ = get_chart_data(recipes=recipes, dataset=dataset, metadata_filter=filter)
+    return stage_latency_report(df)
+
+
+def search_key(dataset: str) -> str:
+    return f"compare_search_{dataset}"
+
+
+def sort_key(dataset: str) -> str:
+    return f"compare_sort_{dataset}"
+
+
+def descending_key(dataset: str) -> str:
+    return f"compare_descending_{dataset}"
+
+
+def page_key(dataset: str) -> str:
+    return f"compare_page_{dataset}"
 
 
 def escape_markdown(text: str) -> str:
@@ -62,12 +122,89 @@ def draw_page() -> None:
         return
 
     filter = state.get_metadata_filter(dataset=dataset)
-    compare_df, data_cols = get_data(
-        recipes=recipes,
-        dataset=dataset,
-        filter=filter,
-        timestamp=state.get_data_timestamp(),
-    )
+    controls_container = st.container()
+
+    # only the rows of the current page are loaded, sorted and filtered in sql
+    state.set_page_item_if_empty(key=page_key(dataset), value=1)
+    sort_by = state.get_page_item(key=sort_key(dataset))
+
+    def get_page(page: int) -> Tuple[pd.DataFrame, List[str], int]:
+        compare_page: Tuple[pd.DataFrame, List[str], int] = get_data(
+            recipes=recipes,
+            dataset=dataset,
+            filter=filter,
+            page=page - 1,
+            search=state.get_page_item(key=search_key(dataset)),
+            sort_by=None if sort_by in (None, SORT_NONE) else sort_by,
+            ascending=not state.get_page_item(key=descending_key(dataset)),
+            versions=get_recipe_versions(recipes),
+            timestamp=state.get_data_timestamp(),
+        )
+        return compare_page
+
+    page = int(state.get_page_item(key=page_key(dataset)) or 1)
+    try:
+        compare_df, data_cols, row_count = get_page(page=page)
+    except ValueError:
+        # sorted by a column of recipes that are no longer selected
+        sort_by = SORT_NONE
+        state.set_page_item(key=sort_key(dataset), value=sort_by)
+        compare_df, data_cols, row_count = get_page(page=page)
+    page_count = max(1, -(-row_count // PAGINATION_SIZE))
+    if page > page_count:
+        # the search or the data changed, and the page is past the end
+        page = page_count
+        state.set_page_item(key=page_key(dataset), value=page)
+        compare_df, data_cols, row_count = get_page(page=page)
+
+    def reset_page() -> None:
+        state.set_page_item(key=page_key(dataset), value=1)
+
+    with controls_container:
+        colSearch, colSort, colDescending, colPage = st.columns([4, 3, 1, 2])
+        colSearch.text_input(
+            "Search queries:", key=search_key(dataset), on_change=reset_page
+        )
+        sort_options = [SORT_NONE]
+        for data_col in data_cols:
+            sort_options.extend(f"{data_col}_{recipe}" for recipe in recipes)
+            if len(recipes) == 2:
+                sort_options.append(f"{data_col}__diff")
+        if sort_by not in sort_options:
+            state.set_page_item(key=sort_key(dataset), value=SORT_NONE)
+        colSort.selectbox(
+            "Sort by:",
+            options=sort_options,
+            key=sort_key(dataset),
+            on_change=reset_page,
+        )
+        colDescending.checkbox(
+            "Descending", key=descending_key(dataset), on_change=reset_page
+        )
+        colPage.number_input(
+            "Page:",
+            min_value=1,
+            max_value=page_count,
+            step=1,
+            key=page_key(dataset),
+        )
+        colPage.caption(f"of {page_count}, {row_count} queries")
+
+    with st.expander("Latency by stage", expanded=False):
+        st.caption(
+            "Seconds spent in each stage of the chain (p50 and p95), from the "
+            "calls TruLens recorded:"
+        )
+        st.dataframe(
+            get_stage_report(
+                recipes=recipes,
+                dataset=dataset,
+                filter=filter,
+                versions=get_recipe_versions(recipes),
+                timestamp=state.get_data_timestamp(),
+            ),
+            hide_index=True,
+        )
 
     columns: Dict[str, Column] = {}
     columns["Query"] = Column(field="input", style={"word-break": "break-word"})
@@ -102,9 +239,6 @@ def draw_page() -> None:
     gb = GridOptionsBuilder.from_dataframe(compare_df)
 
     gb.configure_default_column(autoHeight=False, wrapText=True)
-    gb.configure_pagination(
-        paginationPageSize=PAGINATION_SIZE, paginationAutoPageSize=False, enabled=True
-    )
     gb.configure_selection(selection_mode="single", pre_selected_rows=[0])
     gb.configure_auto_height(autoHeight=True)
 
@@ -120,6 +254,14 @@ def draw_page() -> None:
         enable_enterprise_modules=False,
     )
 
+    # so clicking through the rows of the page doesn't wait on the databases
+    prefetch_detail_data(
+        record_ids={
+            recipe: compare_df[f"record_id_{recipe}"].dropna().tolist()
+            for recipe in recipes
+        }
+    )
+
     selected_rows = data.selected_rows
     selected_rows = pd.DataFrame(selected_rows)
 
@@ -165,6 +307,15 @@ def draw_page() -> None:
                 else:
                     table[data_col].append(f"{value}")
 
+        for recipe in recipes:
+            stages = detail_data.get(recipe, {}).get("stages", {})
+            for stage in RECORD_STAGES:
+                legend = f"{stage} latency"
+                if legend not in table:
+                    table[legend] = []
+                value = stages.get(stage)
+                table[legend].append("" if value is None else "{:.2f}".format(value))
+
         markdown_lines = ["|      |" + " | ".join(recipes) + "|"]
         markdown_lines.append("|----" * (len(recipes) + 1) + "|")
 
@@ -255,5 +406,7 @@ def draw_page() -> None:
     with button_row_container:
         write_button_row(current_page="compare")
 
+    write_live_updates(recipes=recipes)
+
 
 draw_page()
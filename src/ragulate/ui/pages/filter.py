@@ -1,12 +1,12 @@
 import sys
-from typing import Any, Dict, List, Set
+from typing import Any, Dict, List, Set, Tuple
 
 sys.modules["pip._vendor.typing_extensions"] = sys.modules["typing_extensions"]
 
 import streamlit as st
 from ragulate.data import get_metadata_options
 from ragulate.ui import state
-from ragulate.ui.utils import write_button_row
+from ragulate.ui.utils import get_recipe_versions, write_button_row
 from streamlit_extras.switch_page_button import switch_page
 
 SELECT_ALL_TEXT = "<all>"
@@ -14,7 +14,7 @@ SELECT_ALL_TEXT = "<all>"
 
 @st.cache_data
 def get_metadata_filter_options(
-    recipes: List[str], dataset: str, timestamp: float
+    recipes: List[str], dataset: str, versions: Tuple[int, ...], timestamp: float
 ) -> Dict[str, Set[Any]]:
     return get_metadata_options(recipes=recipes, dataset=dataset)
 
@@ -40,7 +40,10 @@ def draw_page() -> None:
         )
 
     metadata_options = get_metadata_filter_options(
-        recipes=recipes, dataset=dataset, timestamp=state.get_data_timestamp()
+        recipes=recipes,
+        dataset=dataset,
+        versions=get_recipe_versions(recipes),
+        timestamp=state.get_data_timestamp(),
     )
 
     def set_metadata_filter() -> None:
@@ -1,7 +1,15 @@
+import hashlib
+from typing import List, Tuple
+
+import pandas as pd
 import streamlit as st
 from streamlit_extras.switch_page_button import switch_page
 
 from ragulate.ui.state import set_data_timestamp
+from ragulate.ui.watcher import get_recipe_watcher
+
+# how often pages check whether the recipes they show have changed
+LIVE_UPDATE_SECONDS = 2.0
 
 
 def write_button_row(current_page: str, disable_non_home: bool = False) -> None:
@@ -24,3 +32,35 @@ def write_button_row(current_page: str, disable_non_home: bool = False) -> None:
 
     if colRefresh.button("refresh", disabled=False):
         set_data_timestamp()
+
+
+def frame_digest(df: pd.DataFrame) -> str:
+    # hashes the values row by row in numpy, without pickling the frame
+    digest = hashlib.sha256(pd.util.hash_pandas_object(df, index=True).to_numpy())
+    digest.update(",".join(map(str, df.columns)).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def get_recipe_versions(recipes: List[str]) -> Tuple[int, ...]:
+    return get_recipe_watcher().versions(recipes)
+
+
+def get_catalog_version() -> int:
+    return get_recipe_watcher().catalog_version()
+
+
+def write_live_updates(recipes: List[str], catalog: bool = False) -> None:
+    # compared against the versions the page was drawn with, so the page is only
+    # rerun (and only the changed recipes re-read) when one of them changed
+    watcher = get_recipe_watcher()
+    drawn_versions = watcher.versions(recipes)
+    drawn_catalog_version = watcher.catalog_version()
+
+    @st.fragment(run_every=LIVE_UPDATE_SECONDS)
+    def check_for_changes() -> None:
+        if watcher.versions(recipes) != drawn_versions or (
+            catalog and watcher.catalog_version() != drawn_catalog_version
+        ):
+            st.rerun()
+
+    check_for_changes()
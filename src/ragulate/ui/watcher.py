@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import os
+import threading
+from typing import Dict, List, Set, Tuple
+
+from watchdog.events import FileSystemEvent, FileSystemEventHandler
+from watchdog.observers import Observer
+from watchdog.observers.api import BaseObserver
+
+from ragulate.logging_config import logger
+
+# changes to a recipe within this many seconds are reported as one
+DEFAULT_DEBOUNCE_SECONDS = 1.0
+
+# events caused by writes; reads also cause (open and close) events on linux
+_WRITE_EVENTS = {"created", "deleted", "modified", "moved"}
+
+
+def recipe_for_path(path: str) -> str | None:
+    """Returns the recipe of a database (or WAL) file path, if it is one"""
+    name = os.path.basename(path)
+    for suffix in (".sqlite-wal", ".sqlite"):
+        if name.endswith(suffix) and len(name) > len(suffix):
+            return name.removesuffix(suffix)
+    return None
+
+
+class RecipeWatcher(FileSystemEventHandler):
+    """Watches a directory for changes to recipe databases.
+
+    Each recipe has a version, which goes up when its `.sqlite` or `-wal` file
+    is written to, so cached data can be keyed on the versions of just the
+    recipes it was read from. Changes are debounced: the first change to a
+    recipe starts a timer, and all the changes to it until the timer fires
+    bump its version once, so a database written to continuously by a run
+    is reported at most once per `debounce_seconds`. The catalog version goes
+    up when recipe databases are created, deleted or renamed.
+    """
+
+    path: str
+    debounce_seconds: float
+
+    def __init__(
+        self, path: str = ".", debounce_seconds: float = DEFAULT_DEBOUNCE_SECONDS
+    ):
+        self.path = path
+        self.debounce_seconds = debounce_seconds
+        self._lock = threading.Lock()
+        self._versions: Dict[str, int] = {}
+        self._catalog_version = 0
+        self._pending: Set[str] = set()
+        self._pending_catalog = False
+        self._timer: threading.Timer | None = None
+        self._observer: BaseObserver | None = None
+
+    def start(self) -> None:
+        """Starts watching the directory, in a daemon thread"""
+        if self._observer is not None:
+            return
+        observer = Observer()
+        observer.schedule(self, self.path, recursive=False)
+        observer.daemon = True
+        observer.start()
+        self._observer = observer
+        logger.debug(f"Watching {os.path.abspath(self.path)} for recipe changes")
+
+    def stop(self) -> None:
+        """Stops watching the directory"""
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    def on_any_event(self, event: FileSystemEvent) -> None:
+        if event.is_directory or event.event_type not in _WRITE_EVENTS:
+            return
+        paths = [event.src_path, getattr(event, "dest_path", "")]
+        for path in paths:
+            if isinstance(path, bytes):
+                path = os.fsdecode(path)
+            recipe = recipe_for_path(path)
+            if recipe is None:
+                continue
+            catalog = event.event_type != "modified" and path.endswith(".sqlite")
+            self.touch(recipe=recipe, catalog=catalog)
+
+    def touch(self, recipe: str, catalog: bool = False) -> None:
+        """Marks a recipe as changed, bumping its version once debounced"""
+        with self._lock:
+            self._pending.add(recipe)
+            self._pending_catalog = self._pending_catalog or catalog
+            if self._timer is None:
+                self._timer = threading.Timer(self.debounce_seconds, self._flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _flush(self) -> None:
+        with self._lock:
+            for recipe in self._pending:
+                self._versions[recipe] = self._versions.get(recipe, 0) + 1
+            if self._pending_catalog:
+                self._catalog_version += 1
+            logger.debug(f"Recipes changed: {sorted(self._pending)}")
+            self._pending = set()
+            self._pending_catalog = False
+            self._timer = None
+
+    def version(self, recipe: str) -> int:
+        """Returns the version of a recipe"""
+        with self._lock:
+            return self._versions.get(recipe.removesuffix(".sqlite"), 0)
+
+    def versions(self, recipes: List[str]) -> Tuple[int, ...]:
+        """Returns the versions of some recipes, in order"""
+        return tuple(self.version(recipe) for recipe in recipes)
+
+    def catalog_version(self) -> int:
+        """Returns the version of the set of recipe databases"""
+        with self._lock:
+            return self._catalog_version
+
+
+_watcher_lock = threading.Lock()
+_watcher: RecipeWatcher | None = None
+
+
+def get_recipe_watcher() -> RecipeWatcher:
+    """Returns the watcher of the working directory, starting it if needed"""
+    global _watcher
+    with _watcher_lock:
+        if _watcher is None:
+            watcher = RecipeWatcher()
+            watcher.start()
+            _watcher = watcher
+        return _watcher
@@ -0,0 +1,109 @@
+import os
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ragulate.analysis import Analysis
+
+FEEDBACKS = ["answer_correctness", "groundedness"]
+
+
+def make_chart_data(records: int = 200) -> pd.DataFrame:
+    rng = np.random.default_rng(seed=7)
+    df = pd.DataFrame(
+        {
+            "record_id": [f"record_{i}" for i in range(records)],
+            "recipe": rng.choice(["first", "second", "third"], size=records),
+            "dataset": rng.choice(["blockchain", "uber"], size=records),
+            "answer_correctness": rng.random(records),
+            "groundedness": rng.random(records),
+            "latency": rng.random(records) * 10,
+        }
+    )
+    df.loc[df.index[:15], "groundedness"] = np.nan
+    return df
+
+
+class TestStatistics:
+    def test_statistics_match_each_group(self) -> None:
+        df = make_chart_data()
+
+        stats = Analysis().calculate_statistics(df, FEEDBACKS)
+
+        for (recipe, dataset), group in df.groupby(["recipe", "dataset"]):
+            for feedback in FEEDBACKS:
+                stat = stats[recipe][feedback][dataset]
+                data = group[feedback]
+                assert stat["high"] == pytest.approx(data.max())
+                assert stat["low"] == pytest.approx(data.min())
+                assert stat["median"] == pytest.approx(data.median())
+                assert stat["mean"] == pytest.approx(data.mean())
+                assert stat["1st_quartile"] == pytest.approx(data.quantile(0.25))
+                assert stat["3rd_quartile"] == pytest.approx(data.quantile(0.75))
+
+    def test_missing_groups_are_empty(self) -> None:
+        df = make_chart_data()
+        df = df[~((df["recipe"] == "third") & (df["dataset"] == "uber"))]
+
+        table = Analysis().statistics_table(df, FEEDBACKS)
+
+        assert len(table) == 3 * 2 * len(FEEDBACKS)
+        missing = table[(table["recipe"] == "third") & (table["dataset"] == "uber")]
+        assert missing[["high", "mean", "1st_quartile"]].isna().all().all()
+
+        figures = Analysis().box_plots_by_dataset(df, FEEDBACKS)
+        assert set(figures) == {"blockchain", "uber"}
+
+
+def make_charts() -> dict[str, tuple[pd.DataFrame, list[str]]]:
+    df = make_chart_data()
+    return {
+        str(dataset): (group, list(FEEDBACKS))
+        for dataset, group in df.groupby("dataset")
+    }
+
+
+class TestExportFigures:
+    def test_parallel_export_matches_serial(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        if (os.cpu_count() or 1) < 2:  # noqa: PLR2004
+            pytest.skip("figures are only exported in parallel on several CPUs")
+        charts = make_charts()
+
+        files: dict[str, dict[str, bytes]] = {}
+        for workers in [1, 2]:
+            directory = tmp_path / str(workers)
+            directory.mkdir()
+            monkeypatch.chdir(directory)
+            Analysis().export_figures(
+                charts=charts, output="box-plots", max_workers=workers
+            )
+            files[str(workers)] = {p.name: p.read_bytes() for p in directory.iterdir()}
+
+        assert set(files["1"]) == {"blockchain_box_plot.png", "uber_box_plot.png"}
+        assert files["1"] == files["2"]
+
+    def test_one_worker_exports_serially(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        def no_pool(*_: Any, **__: Any) -> None:
+            raise AssertionError("a process pool was started")
+
+        monkeypatch.setattr("ragulate.analysis.ProcessPoolExecutor", no_pool)
+        monkeypatch.chdir(tmp_path)
+        Analysis().export_figures(
+            charts=make_charts(), output="box-plots", max_workers=1
+        )
+
+        assert {p.name for p in tmp_path.iterdir()} == {
+            "blockchain_box_plot.png",
+            "uber_box_plot.png",
+        }
+
+    def test_invalid_output(self) -> None:
+        with pytest.raises(ValueError):
+            Analysis().export_figures(charts={}, output="pie-charts")
@@ -1,7 +1,11 @@
 import os
+from pathlib import Path
+
+import pytest
 
 from ragulate.config.config_parser import ConfigParser
 from ragulate.config.config_schema_0_1 import ConfigSchema0Dot1
+from ragulate.datasets import LocalDataset
 
 
 class TestConfigValidation:
@@ -145,3 +149,34 @@ class TestConfigValidation:
         assert chunk_size_1000.name == "chunk_size_1000"
         assert "chunk_size" in chunk_size_1000.ingredients
         assert chunk_size_1000.ingredients["chunk_size"] == 1000  # noqa: PLR2004
+
+    def test_local_dataset_config(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / "logs.jsonl").write_text('{"query": "q", "answer": "a"}\n')
+        json_config = {
+            "version": 0.1,
+            "steps": {
+                "query": [
+                    {"name": "minimal", "script": "minimal.py", "method": "query"}
+                ],
+            },
+            "recipes": [{"query": "minimal", "ingredients": [{"chunk_size": 500}]}],
+            "datasets": [
+                {
+                    "name": "logs",
+                    "kind": "local",
+                    "path": "logs.jsonl",
+                    "metadata_columns": ["team"],
+                }
+            ],
+        }
+        parser = ConfigParser(config_schema=ConfigSchema0Dot1(), config=json_config)
+
+        assert parser.is_valid, parser.errors
+
+        dataset = parser.get_config().datasets["logs"]
+        assert isinstance(dataset, LocalDataset)
+        assert dataset.source_path == str(tmp_path / "logs.jsonl")
+        assert dataset.metadata_columns == ["team"]
@@ -0,0 +1,964 @@
+import json
+import os
+import sqlite3
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+
+import pandas as pd
+import pytest
+
+from ragulate.catalog import RecipeCatalog
+from ragulate.connections import ReadConnectionPool
+from ragulate.data import (
+    LATENCY_BINS,
+    SCORE_BINS,
+    bin_chart_data,
+    get_chart_data,
+    get_compare_page,
+    get_details_for_record,
+    get_metadata_options_for_recipe,
+    get_outputs,
+)
+from ragulate.datasets import BaseDataset, LocalDataset, find_dataset
+from ragulate.latency_report import stage_latency_report
+from ragulate.recipe_session import RecipeSession
+from ragulate.record_details import RecordDetailCache
+from ragulate.schema import (
+    RECIPE_INDEXES,
+    RECIPE_TABLES,
+    RECIPE_TRIGGERS,
+    RECORD_METADATA_TABLE,
+    RECORD_STAGES_TABLE,
+    ensure_schema,
+    missing_indexes,
+    missing_schema,
+)
+from ragulate.snapshots import SNAPSHOT_VERSION, RecipeSnapshot
+
+FEEDBACKS = ["answer_correctness", "groundedness"]
+
+TRULENS_TABLES = """
+    CREATE TABLE trulens_apps (app_id TEXT PRIMARY KEY, app_json TEXT);
+    CREATE TABLE trulens_records (
+        record_id TEXT PRIMARY KEY, app_id TEXT, input TEXT, output TEXT,
+        record_json TEXT, tags TEXT, ts FLOAT, cost_json TEXT, perf_json TEXT
+    );
+    CREATE TABLE trulens_feedback_defs (
+        feedback_definition_id TEXT PRIMARY KEY, feedback_json TEXT
+    );
+    CREATE TABLE trulens_feedbacks (
+        feedback_result_id TEXT PRIMARY KEY, record_id TEXT,
+        feedback_definition_id TEXT, last_ts FLOAT, status TEXT, error TEXT,
+        calls_json TEXT, result FLOAT, name TEXT, cost_json TEXT, multi_result TEXT
+    );
+"""
+
+
+def make_recipe(
+    path: Path,
+    records: int = 3,
+    app_id: str = "dataset",
+    status: str = "done",
+    name: str = "recipe",
+    offset: int = 0,
+) -> None:
+    """Writes a recipe database shaped like the ones TruLens creates"""
+    conn = sqlite3.connect(path / f"{name}.sqlite")
+    with conn:
+        conn.executescript(TRULENS_TABLES)
+        conn.execute(
+            "INSERT INTO trulens_apps VALUES (?, ?)",
+            (app_id, json.dumps({"metadata": {"recipe_name": "recipe"}})),
+        )
+        for i, feedback in enumerate(FEEDBACKS):
+            conn.execute(
+                "INSERT INTO trulens_feedback_defs VALUES (?, ?)",
+                (f"def_{i}", json.dumps({"supplied_name": feedback})),
+            )
+        for i in range(records):
+            meta = {"group": f"g{i % 2}", "size": i, "flag": i == 0, "tags": ["a"]}
+            record: dict[str, Any] = {"meta": meta, "calls": []}
+            perf = {
+                "start_time": "2024-08-01T10:00:00.000000",
+                "end_time": f"2024-08-01T10:00:0{i + 1}.500000",
+            }
+            conn.execute(
+                "INSERT INTO trulens_records VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    f"record_{i}",
+                    app_id,
+                    json.dumps(f"Query {i + offset}"),
+                    json.dumps(f"Answer {i + offset} from {name}"),
+                    json.dumps(record),
+                    "-",
+                    float(i),
+                    json.dumps({"n_tokens": 100 + i}),
+                    json.dumps(perf),
+                ),
+            )
+            for j, feedback in enumerate(FEEDBACKS):
+                conn.execute(
+                    "INSERT INTO trulens_feedbacks "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        f"feedback_{i}_{j}",
+                        f"record_{i}",
+                        f"def_{j}",
+                        float(i),
+                        status,
+                        None,
+                        json.dumps({"calls": []}),
+                        (i + j + offset) / 10,
+                        feedback,
+                        "{}",
+                        None,
+                    ),
+                )
+    conn.close()
+
+
+def make_dataset(path: Path, queries: int) -> None:
+    """Imports a local dataset with ground truth answers for the queries"""
+    rows = [{"query": f"Query {i}", "answer": f"Truth {i}"} for i in range(queries)]
+    (path / "queries.jsonl").write_text("\n".join(json.dumps(r) for r in rows))
+    LocalDataset(
+        "dataset",
+        root_storage_path=str(path / "datasets"),
+        path=str(path / "queries.jsonl"),
+    ).download_dataset()
+
+
+class TestGetChartData:
+    def test_feedbacks_are_pivoted(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        make_recipe(tmp_path)
+        monkeypatch.chdir(tmp_path)
+
+        df, feedbacks = get_chart_data(
+            recipes=["recipe"], dataset="dataset", metadata_filter={}
+        )
+
+        assert feedbacks == FEEDBACKS
+        assert len(df) == 3  # noqa: PLR2004
+        row = df.set_index("record_id").loc["record_1"]
+        assert row["answer_correctness"] == pytest.approx(0.1)
+        assert row["groundedness"] == pytest.approx(0.2)
+        assert row["total_tokens"] == 101  # noqa: PLR2004
+        assert row["latency"] == pytest.approx(2.5)
+        assert get_outputs(recipe="recipe", record_ids=["record_1"]) == {
+            "record_1": "Answer 1 from recipe"
+        }
+
+    def test_unfinished_feedbacks_are_empty(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        make_recipe(tmp_path, status="running")
+        monkeypatch.chdir(tmp_path)
+
+        df, _ = get_chart_data(
+            recipes=["recipe"], dataset="dataset", metadata_filter={"group": "g0"}
+        )
+
+        assert sorted(df["record_id"]) == ["record_0", "record_2"]
+        assert df["answer_correctness"].isna().all()
+
+    def test_values_are_bound(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        make_recipe(tmp_path, app_id='it\'s "quoted"')
+        monkeypatch.chdir(tmp_path)
+
+        df, _ = get_chart_data(
+            recipes=["recipe"], dataset='it\'s "quoted"', metadata_filter={}
+        )
+        assert len(df) == 3  # noqa: PLR2004
+
+        df, _ = get_chart_data(
+            recipes=["recipe"],
+            dataset='it\'s "quoted"',
+            metadata_filter={"group": "g1' OR '1' = '1"},
+        )
+        assert len(df) == 0
+
+
+class TestCrossRecipeData:
+    def test_compare_data(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        make_recipe(tmp_path, records=3, name="first")
+        make_recipe(tmp_path, records=3, name="second", offset=1)
+        make_dataset(tmp_path, queries=4)
+        monkeypatch.chdir(tmp_path)
+
+        df, columns, _ = get_compare_page(
+            recipes=["first", "second"],
+            dataset="dataset",
+            metadata_filter={},
+            page=0,
+            page_size=10,
+        )
+
+        assert columns == [*FEEDBACKS, "total_tokens", "latency"]
+        # joined on the query, so queries only one recipe ran get a row too
+        assert list(df["input"]) == ["Query 0", "Query 1", "Query 2", "Query 3"]
+        assert list(df.columns[:4]) == [
+            "input",
+            "ground_truth",
+            "output_first",
+            "output_second",
+        ]
+        row = df.set_index("input").loc["Query 2"]
+        assert row["ground_truth"] == "Truth 2"
+        assert row["output_second"] == "Answer 2 from second"
+        assert row["answer_correctness_first"] == pytest.approx(0.2)
+        assert row["answer_correctness_second"] == pytest.approx(0.2)
+        assert row["latency__diff"] == pytest.approx(1, abs=1e-3)
+        assert row["total_tokens__diff"] == 1
+        assert df.set_index("input").loc["Query 3"].isna()["record_id_first"]
+
+    def test_queries_are_joined_normalized(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        make_recipe(tmp_path, records=1, name="first")
+        make_recipe(tmp_path, records=1, name="second")
+        conn = sqlite3.connect(tmp_path / "first.sqlite")
+        with conn:
+            conn.execute("UPDATE trulens_records SET input = ?", ['"Caf\u00e9 0"'])
+        conn.close()
+        conn = sqlite3.connect(tmp_path / "second.sqlite")
+        with conn:
+            # decomposed, with surrounding whitespace
+            conn.execute("UPDATE trulens_records SET input = ?", ['" Cafe\u0301 0\\n"'])
+        conn.close()
+        monkeypatch.chdir(tmp_path)
+
+        with RecipeSession(recipes=["first", "second"], dataset="dataset") as session:
+            df = session.compare_frame(columns_to_diff=["latency"])
+
+        assert list(df["input"]) == ["Caf\u00e9 0"]
+        assert df[["record_id_first", "record_id_second"]].notna().all(axis=None)
+
+    def test_compare_page(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        make_recipe(tmp_path, records=3, name="first")
+        make_recipe(tmp_path, records=3, name="second", offset=1)
+        make_dataset(tmp_path, queries=4)
+        monkeypatch.chdir(tmp_path)
+        recipes = ["first", "second"]
+
+        df, _, count = get_compare_page(
+            recipes=recipes,
+            dataset="dataset",
+            metadata_filter={},
+            page=0,
+            page_size=2,
+            sort_by="answer_correctness_second",
+            ascending=False,
+        )
+        assert count == 4  # noqa: PLR2004
+        assert list(df["input"]) == ["Query 3", "Query 2"]
+        assert list(df["output_second"]) == [
+            "Answer 3 from second",
+            "Answer 2 from second",
+        ]
+        assert df["output_first"].isna().tolist() == [True, False]
+        assert df.set_index("input").loc["Query 2"]["ground_truth"] == "Truth 2"
+
+        df, _, _ = get_compare_page(
+            recipes=recipes,
+            dataset="dataset",
+            metadata_filter={},
+            page=1,
+            page_size=2,
+            sort_by="answer_correctness_second",
+            ascending=False,
+        )
+        # empty values are sorted last
+        assert list(df["input"]) == ["Query 1", "Query 0"]
+
+        df, _, count = get_compare_page(
+            recipes=recipes,
+            dataset="dataset",
+            metadata_filter={},
+            page=0,
+            page_size=2,
+            search="query 1",
+        )
+        assert count == 1
+        assert list(df["input"]) == ["Query 1"]
+
+        with pytest.raises(ValueError):
+            get_compare_page(
+                recipes=recipes,
+                dataset="dataset",
+                metadata_filter={},
+                page=0,
+                page_size=2,
+                sort_by="output_first; DROP TABLE records",
+            )
+
+    def test_compare_pages_are_sliced(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        make_recipe(tmp_path, records=3, name="first")
+        make_recipe(tmp_path, records=3, name="second", offset=1)
+        make_dataset(tmp_path, queries=4)
+        monkeypatch.chdir(tmp_path)
+        sessions: list[RecipeSession] = []
+
+        class CountedSession(RecipeSession):
+            def __init__(self, *args: Any, **kwargs: Any):
+                super().__init__(*args, **kwargs)
+                sessions.append(self)
+
+        monkeypatch.setattr("ragulate.data.RecipeSession", CountedSession)
+
+        def get_page(page: int) -> list[str]:
+            df, _, count = get_compare_page(
+                recipes=["first", "second"],
+                dataset="dataset",
+                metadata_filter={"group": "g0"},
+                page=page,
+                page_size=1,
+            )
+            assert count == 4  # noqa: PLR2004
+            return list(df["input"])
+
+        loads: list[str] = []
+
+        def counted_find_dataset(name: str, **kwargs: Any) -> BaseDataset:
+            loads.append(name)
+            return find_dataset(name, **kwargs)
+
+        monkeypatch.setattr("ragulate.data.find_dataset", counted_find_dataset)
+
+        assert get_page(0) == ["Query 0"]
+        assert get_page(3) == ["Query 3"]
+        assert len(sessions) == 1
+        # the ground truth is read once, until the dataset is imported again
+        assert loads == ["dataset"]
+        make_dataset(tmp_path, queries=5)
+        get_page(0)
+        assert loads == ["dataset", "dataset"]
+
+        # a write to a recipe stages the recipes again
+        conn = sqlite3.connect("second.sqlite")
+        with conn:
+            conn.execute("UPDATE trulens_records SET tags = 'x'")
+        conn.close()
+        assert get_page(1) == ["Query 1"]
+        assert len(sessions) == 2  # noqa: PLR2004
+
+    def test_compare_many_recipes(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        # more than sqlite can attach at once
+        recipes = [f"recipe_{i:02d}" for i in range(12)]
+        for i, recipe in enumerate(recipes):
+            make_recipe(tmp_path, records=2, name=recipe, offset=i)
+        make_dataset(tmp_path, queries=13)
+        monkeypatch.chdir(tmp_path)
+
+        df, _, _ = get_compare_page(
+            recipes=recipes,
+            dataset="dataset",
+            metadata_filter={"group": "g0"},
+            page=0,
+            page_size=20,
+        )
+
+        assert len(df) == 12  # noqa: PLR2004
+        assert "latency__diff" not in df.columns
+        assert df.set_index("input").loc["Query 11"]["output_recipe_11"] == (
+            "Answer 11 from recipe_11"
+        )
+
+    def test_chart_data(self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+        make_recipe(tmp_path, records=3, name="first")
+        make_recipe(tmp_path, records=2, name="second", status="failed")
+        monkeypatch.chdir(tmp_path)
+
+        df, feedbacks = get_chart_data(
+            recipes=["first", "second"], dataset="dataset", metadata_filter={}
+        )
+
+        assert feedbacks == FEEDBACKS
+        assert list(df["recipe"]) == ["first"] * 3 + ["second"] * 2
+        assert (df["dataset"] == "dataset").all()
+        assert df[df["recipe"] == "second"]["groundedness"].isna().all()
+        assert list(df.columns[:4]) == [
+            "record_id",
+            "metadata",
+            "total_tokens",
+            "latency",
+        ]
+
+
+class TestBinChartData:
+    def test_counts_per_recipe_and_metric(self) -> None:
+        df = pd.DataFrame(
+            {
+                "record_id": ["a", "b", "c", "d", "e"],
+                "recipe": ["first", "first", "first", "second", "second"],
+                "dataset": "dataset",
+                "groundedness": [0.05, 1.0, -1.0, 0.5, None],
+                "latency": [0.1, 20.0, 3.0, 1.0, 2.0],
+            }
+        )
+
+        binned = bin_chart_data(df=df, feedbacks=["groundedness"])
+
+        assert len(binned) == 2 * (len(SCORE_BINS) - 1 + len(LATENCY_BINS) - 1)
+        first = binned[
+            (binned["recipe"] == "first") & (binned["metric"] == "groundedness")
+        ].set_index("bin_start")
+        # negative scores aren't counted, and the last bin includes 1.0
+        assert first["count"].sum() == 2  # noqa: PLR2004
+        assert first["percent"].iloc[0] == pytest.approx(50)
+        assert first["percent"].iloc[-1] == pytest.approx(50)
+
+        latency = binned[
+            (binned["recipe"] == "first") & (binned["metric"] == "latency")
+        ]
+        assert latency["count"].iloc[-1] == 1
+        assert latency["bin_end"].iloc[-1] == float("inf")
+
+        assert bin_chart_data(df=df.iloc[0:0], feedbacks=[]).empty
+
+
+class TestRecipeSnapshot:
+    def add_record(self, record_id: str, ts: float, result: float) -> None:
+        conn = sqlite3.connect("recipe.sqlite")
+        with conn:
+            conn.execute(
+                "INSERT INTO trulens_records "
+                "(record_id, app_id, input, record_json, cost_json, perf_json, ts) "
+                "VALUES (?, 'dataset', '\"New\"', '{}', '{}', '{}', ?)",
+                [record_id, ts],
+            )
+            conn.execute(
+                "INSERT INTO trulens_feedbacks "
+                "(feedback_result_id, record_id, name, status, result, last_ts) "
+                "VALUES (?, ?, 'groundedness', 'done', ?, ?)",
+                [f"feedback_{record_id}", record_id, result, ts],
+            )
+        conn.close()
+
+    def test_snapshot_is_updated_incrementally(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        make_recipe(tmp_path, records=3)
+        monkeypatch.chdir(tmp_path)
+        snapshot = RecipeSnapshot(recipe="recipe", dataset="dataset")
+
+        df, feedbacks = snapshot.load()
+        assert sorted(feedbacks) == FEEDBACKS
+        assert len(df) == 3  # noqa: PLR2004
+        assert os.path.isfile(snapshot.path)
+        inode = os.stat(snapshot.path).st_ino
+
+        def no_rebuild(*_: Any, **__: Any) -> None:
+            raise AssertionError("snapshot was rebuilt")
+
+        monkeypatch.setattr(RecipeSnapshot, "_build", no_rebuild)
+        self.add_record("late", ts=100.0, result=0.9)
+        conn = sqlite3.connect("recipe.sqlite")
+        with conn:
+            conn.execute(
+                "UPDATE trulens_feedbacks SET result = 0.5, last_ts = 100.0 "
+                "WHERE record_id = 'record_0' AND name = 'groundedness'"
+            )
+        conn.close()
+
+        updated, _ = RecipeSnapshot(recipe="recipe", dataset="dataset").load()
+        df = updated.set_index("record_id")
+        assert len(df) == 4  # noqa: PLR2004
+        assert df.loc["late", "groundedness"] == pytest.approx(0.9)
+        assert df.loc["late", "input"] == "New"
+        assert df.loc["record_0", "groundedness"] == pytest.approx(0.5)
+        assert df.loc["record_1", "groundedness"] == pytest.approx(0.2)
+
+        # only the changed rows were written, into the same file
+        assert os.stat(snapshot.path).st_ino == inode
+        monkeypatch.setattr("ragulate.snapshots._memory", OrderedDict())
+        monkeypatch.setattr("ragulate.snapshots.get_connection_pool", None)
+        df, _ = RecipeSnapshot(recipe="recipe", dataset="dataset").load()
+        pd.testing.assert_frame_equal(df, updated)
+
+    def test_out_of_order_records_rebuild(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        make_recipe(tmp_path, records=3)
+        monkeypatch.chdir(tmp_path)
+        RecipeSnapshot(recipe="recipe", dataset="dataset").load()
+
+        # far older than the watermark, so only noticed by the record count
+        self.add_record("early", ts=-1000.0, result=0.3)
+
+        df, _ = RecipeSnapshot(recipe="recipe", dataset="dataset").load()
+        assert "early" in set(df["record_id"])
+
+    def test_unchanged_database_is_not_read(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        make_recipe(tmp_path, records=3)
+        monkeypatch.chdir(tmp_path)
+        RecipeSnapshot(recipe="recipe", dataset="dataset").load()
+
+        monkeypatch.setattr("ragulate.snapshots.get_connection_pool", None)
+        df, _ = RecipeSnapshot(recipe="recipe", dataset="dataset").load()
+        assert len(df) == 3  # noqa: PLR2004
+
+    def test_snapshot_file_is_data(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        make_recipe(tmp_path, records=3)
+        monkeypatch.chdir(tmp_path)
+        snapshot = RecipeSnapshot(recipe="recipe", dataset="dataset")
+        expected, _ = snapshot.load()
+
+        conn = sqlite3.connect(snapshot.path)
+        [header] = conn.execute("SELECT header FROM snapshot_header").fetchone()
+        conn.close()
+        assert json.loads(header)["version"] == SNAPSHOT_VERSION
+
+        # anything else is ignored, and the snapshot rebuilt
+        monkeypatch.setattr("ragulate.snapshots._memory", OrderedDict())
+        Path(snapshot.path).write_bytes(b"not a snapshot")
+        df, _ = RecipeSnapshot(recipe="recipe", dataset="dataset").load()
+        pd.testing.assert_frame_equal(df, expected)
+
+        # read back from the file alone, with the types of the empty columns
+        monkeypatch.setattr("ragulate.snapshots._memory", OrderedDict())
+        monkeypatch.setattr("ragulate.snapshots.get_connection_pool", None)
+        df, _ = RecipeSnapshot(recipe="recipe", dataset="dataset").load()
+        pd.testing.assert_frame_equal(df, expected)
+
+    def test_unwritable_snapshot_is_served_from_memory(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        make_recipe(tmp_path, records=3)
+        monkeypatch.chdir(tmp_path)
+        # a file where the snapshot directory should be, so writes fail
+        (tmp_path / "snapshots").write_text("")
+
+        df, _ = RecipeSnapshot(
+            recipe="recipe", dataset="dataset", root_path="snapshots"
+        ).load()
+        assert len(df) == 3  # noqa: PLR2004
+
+        self.add_record("late", ts=100.0, result=0.9)
+        df, _ = RecipeSnapshot(
+            recipe="recipe", dataset="dataset", root_path="snapshots"
+        ).load()
+        assert "late" in set(df["record_id"])
+
+    def test_refresh_merges_into_memory(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        make_recipe(tmp_path, records=3)
+        monkeypatch.chdir(tmp_path)
+        RecipeSnapshot(recipe="recipe", dataset="dataset").load()
+
+        def no_read(*_: Any, **__: Any) -> None:
+            raise AssertionError("snapshot file was read")
+
+        monkeypatch.setattr(RecipeSnapshot, "_read", no_read)
+        self.add_record("late", ts=100.0, result=0.9)
+
+        df, _ = RecipeSnapshot(recipe="recipe", dataset="dataset").load()
+        assert len(df) == 4  # noqa: PLR2004
+        assert "late" in set(df["record_id"])
+
+
+class TestRecordDetailCache:
+    def test_details_are_cached_and_prefetched(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        make_recipe(tmp_path, records=3)
+        monkeypatch.chdir(tmp_path)
+        loads: list[str] = []
+
+        def load(recipe: str, record_id: str) -> dict[str, Any]:
+            loads.append(record_id)
+            return get_details_for_record(recipe=recipe, record_id=record_id)
+
+        cache = RecordDetailCache(load=load, max_entries=2)
+        details = cache.get(recipe="recipe", record_id="record_0")
+        assert details["calls"] == {}
+        details["calls"]["changed"] = []
+        assert cache.get(recipe="recipe", record_id="record_0")["calls"] == {}
+        assert loads == ["record_0"]
+
+        cache.prefetch(recipe="recipe", record_ids=["record_0", "record_1"])
+        cache.get(recipe="recipe", record_id="record_1")
+        assert loads == ["record_0", "record_1"]
+
+        # writing to the database changes its signature
+        conn = sqlite3.connect("recipe.sqlite")
+        with conn:
+            conn.execute("UPDATE trulens_records SET tags = 'x'")
+        conn.close()
+        cache.get(recipe="recipe", record_id="record_1")
+        assert loads == ["record_0", "record_1", "record_1"]
+
+
+class TestRecipeCatalog:
+    def test_only_changed_recipes_are_read(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        make_recipe(tmp_path, name="first")
+        make_recipe(tmp_path, name="second", app_id="other")
+        monkeypatch.chdir(tmp_path)
+        reads: list[str] = []
+
+        def get_datasets_and_metadata(recipe: str) -> dict[str, Any]:
+            reads.append(recipe)
+            return {"dataset": {"recipe_name": recipe}}
+
+        monkeypatch.setattr(
+            "ragulate.catalog.get_datasets_and_metadata", get_datasets_and_metadata
+        )
+
+        catalog = RecipeCatalog().refresh()
+        assert catalog == {
+            "first": {"dataset": {"recipe_name": "first"}},
+            "second": {"dataset": {"recipe_name": "second"}},
+        }
+        assert sorted(reads) == ["first", "second"]
+        assert os.path.isfile(RecipeCatalog().path)
+        # listing the recipes doesn't write to them
+        conn = sqlite3.connect("first.sqlite")
+        assert RECORD_METADATA_TABLE in missing_schema(conn)
+        conn.close()
+
+        reads.clear()
+        assert RecipeCatalog().refresh() == catalog
+        assert reads == []
+
+        conn = sqlite3.connect("second.sqlite")
+        with conn:
+            conn.execute("INSERT INTO trulens_apps VALUES ('new', '{}')")
+        conn.close()
+        os.remove("first.sqlite")
+        assert set(RecipeCatalog().refresh()) == {"second"}
+        assert reads == ["second"]
+
+    def test_unwritable_catalog_is_returned(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        make_recipe(tmp_path, name="first")
+        monkeypatch.chdir(tmp_path)
+        # a file where the catalog directory should be, so writes fail
+        (tmp_path / "catalog").write_text("")
+
+        catalog = RecipeCatalog(path=os.path.join("catalog", "catalog.json"))
+        assert set(catalog.refresh()) == {"first"}
+
+
+class TestRecordMetadata:
+    def test_metadata_is_kept_in_sync(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        make_recipe(tmp_path, records=2)
+        monkeypatch.chdir(tmp_path)
+        assert ensure_schema("recipe")
+
+        conn = sqlite3.connect("recipe.sqlite")
+        with conn:
+            # written after the schema was created, so picked up by the triggers
+            conn.execute(
+                "INSERT INTO trulens_records (record_id, app_id, record_json) "
+                "VALUES ('late', 'dataset', ?)",
+                [json.dumps({"meta": {"group": "g9", "size": 9}})],
+            )
+            conn.execute(
+                "UPDATE trulens_records SET record_json = ? "
+                "WHERE record_id = 'record_0'",
+                [json.dumps({"meta": {"group": "g5"}})],
+            )
+            conn.execute("DELETE FROM trulens_records WHERE record_id = 'record_1'")
+        rows = conn.execute(
+            f"SELECT record_id, key, value FROM {RECORD_METADATA_TABLE} "
+            "ORDER BY record_id, key"
+        ).fetchall()
+        conn.close()
+
+        assert rows == [
+            ("late", "group", "g9"),
+            ("late", "size", 9),
+            ("record_0", "group", "g5"),
+        ]
+
+    def test_options_and_filters(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        make_recipe(tmp_path, records=4)
+        monkeypatch.chdir(tmp_path)
+        assert ensure_schema("recipe")
+
+        options = get_metadata_options_for_recipe(recipe="recipe", dataset="dataset")
+
+        # only scalar values are options
+        assert {key: sorted(values) for key, values in options.items()} == {
+            "flag": [False, True],
+            "group": ["g0", "g1"],
+            "size": [0, 1, 2, 3],
+        }
+
+        # snapshots are filtered with the metadata index
+        df, _ = get_chart_data(
+            recipes=["recipe"],
+            dataset="dataset",
+            metadata_filter={"group": "g1", "size": 3},
+        )
+        assert list(df["record_id"]) == ["record_3"]
+        df, _ = get_chart_data(
+            recipes=["recipe"], dataset="dataset", metadata_filter={"flag": True}
+        )
+        assert list(df["record_id"]) == ["record_0"]
+
+    def test_database_without_schema(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        make_recipe(tmp_path, records=4)
+        monkeypatch.chdir(tmp_path)
+        # without the schema, metadata is read from the records
+
+        options = get_metadata_options_for_recipe(recipe="recipe", dataset="dataset")
+        assert sorted(options["size"]) == [0, 1, 2, 3]
+
+        chart_df, _ = get_chart_data(
+            recipes=["recipe"], dataset="dataset", metadata_filter={"size": 3}
+        )
+        assert list(chart_df["record_id"]) == ["record_3"]
+
+        # and reading never creates it
+        conn = sqlite3.connect("recipe.sqlite")
+        assert set(missing_schema(conn)) == {
+            *RECIPE_TABLES,
+            *RECIPE_TRIGGERS,
+            *RECIPE_INDEXES,
+        }
+        conn.close()
+
+
+def make_call(
+    cls: str, module: str, path: str, start: float, end: float
+) -> dict[str, Any]:
+    """Returns a call shaped like the ones TruLens records in `$.calls`"""
+    component = {"obj": {"cls": {"name": cls, "module": {"module_name": module}}}}
+    return {
+        "stack": [
+            {"path": {"path": [{"attr": "app"}]}, "method": {"name": "invoke"}},
+            {"path": {"path": [{"attr": "app"}, {"attr": path}]}, "method": component},
+        ],
+        "perf": {
+            "start_time": f"2024-08-01T10:00:{start:09.6f}",
+            "end_time": f"2024-08-01T10:00:{end:09.6f}",
+        },
+    }
+
+
+RECORD_CALLS = [
+    # invoke, and the method it calls on the same component, count once
+    make_call("VectorStoreRetriever", "langchain_core.vectorstores", "first", 0, 0.8),
+    make_call("VectorStoreRetriever", "langchain_core.vectorstores", "first", 0.1, 0.7),
+    make_call("ChatPromptTemplate", "langchain_core.prompts.chat", "steps", 0.8, 0.9),
+    make_call("ChatOpenAI", "langchain_openai.chat_models.base", "llm", 0.9, 2.9),
+    make_call("StrOutputParser", "langchain_core.output_parsers", "parser", 2.9, 3),
+    make_call("RunnableSequence", "langchain_core.runnables.base", "chain", 0, 3),
+]
+
+
+class TestRecordStages:
+    def add_record(self, record_id: str, calls: list[dict[str, Any]]) -> None:
+        conn = sqlite3.connect("recipe.sqlite")
+        with conn:
+            conn.execute(
+                "INSERT INTO trulens_records "
+                "(record_id, app_id, input, record_json, ts, cost_json, perf_json) "
+                "VALUES (?, 'dataset', '\"Late query\"', ?, 10.0, '{}', ?)",
+                [
+                    record_id,
+                    json.dumps({"meta": {}, "calls": calls}),
+                    json.dumps(
+                        {
+                            "start_time": "2024-08-01T10:00:00",
+                            "end_time": "2024-08-01T10:00:03",
+                        }
+                    ),
+                ],
+            )
+        conn.close()
+
+    def test_stages_of_new_records(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        make_recipe(tmp_path, records=1)
+        monkeypatch.chdir(tmp_path)
+        assert ensure_schema("recipe")
+
+        # written after the schema was created, so picked up by the triggers
+        self.add_record("late", RECORD_CALLS)
+
+        details = get_details_for_record(recipe="recipe", record_id="late")
+        assert details["stages"] == {
+            "retriever": pytest.approx(0.8),
+            "prompt": pytest.approx(0.1),
+            "llm": pytest.approx(2.0),
+            "parser": pytest.approx(0.1),
+        }
+        assert (
+            get_details_for_record(recipe="recipe", record_id="record_0")["stages"]
+            == {}
+        )
+
+        df, _ = get_chart_data(
+            recipes=["recipe"], dataset="dataset", metadata_filter={}
+        )
+        row = df.set_index("record_id").loc["late"]
+        assert row["retriever_latency"] == pytest.approx(0.8)
+        assert row["llm_latency"] == pytest.approx(2.0)
+
+        report = stage_latency_report(df).set_index("stage")
+        assert report.loc["llm", "queries"] == 1
+        assert report.loc["llm", "latency_p95"] == pytest.approx(2.0)
+        assert report.loc["llm", "latency_share"] == pytest.approx(2 / 3)
+
+    def test_stages_of_existing_records(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        make_recipe(tmp_path, records=1)
+        monkeypatch.chdir(tmp_path)
+        # written before the schema was created, so picked up by the rebuild
+        self.add_record("early", RECORD_CALLS[2:4])
+        assert ensure_schema("recipe")
+
+        conn = sqlite3.connect("recipe.sqlite")
+        rows = conn.execute(
+            f"SELECT record_id, stage FROM {RECORD_STAGES_TABLE} ORDER BY stage"
+        ).fetchall()
+        conn.execute("DELETE FROM trulens_records WHERE record_id = 'early'")
+        conn.commit()
+        remaining = conn.execute(f"SELECT * FROM {RECORD_STAGES_TABLE}").fetchall()
+        conn.close()
+
+        assert rows == [("early", "llm"), ("early", "prompt")]
+        assert remaining == []
+
+
+class TestEnsureSchema:
+    def test_indexes_are_created_once(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        make_recipe(tmp_path)
+        monkeypatch.chdir(tmp_path)
+
+        assert ensure_schema("recipe")
+        conn = sqlite3.connect("recipe.sqlite")
+        assert missing_schema(conn) == []
+
+        # the pivot is answered from the covering index
+        plan = " ".join(
+            str(row[-1])
+            for row in conn.execute(
+                "EXPLAIN QUERY PLAN SELECT MAX(result) FROM trulens_feedbacks "
+                "WHERE record_id = 'record_0' AND status = 'done' GROUP BY name"
+            )
+        )
+        assert "ragulate_feedbacks_record_name_status" in plan
+
+        # dropped behind ragulate's back, so only a forced check recreates it
+        conn.execute(f"DROP INDEX {next(iter(RECIPE_INDEXES))}")
+        conn.commit()
+        assert ensure_schema("recipe")
+        assert len(missing_indexes(conn)) == 1
+        assert ensure_schema("recipe", force=True)
+        assert missing_indexes(conn) == []
+        conn.close()
+
+    def test_new_rows_are_found_by_index(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        make_recipe(tmp_path, records=20)
+        monkeypatch.chdir(tmp_path)
+        assert ensure_schema("recipe")
+
+        conn = sqlite3.connect("recipe.sqlite")
+        for sql, index in [
+            (
+                "SELECT record_id FROM trulens_records "
+                "WHERE app_id = 'dataset' AND ts >= 19.0",
+                "ragulate_records_app_id_ts",
+            ),
+            (
+                "SELECT record_id FROM trulens_feedbacks WHERE last_ts >= 19.0",
+                "ragulate_feedbacks_last_ts",
+            ),
+        ]:
+            plan = " ".join(
+                str(row[-1]) for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")
+            )
+            assert index in plan
+        conn.close()
+
+    def test_missing_database(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        monkeypatch.chdir(tmp_path)
+
+        assert not ensure_schema("missing")
+        assert not (tmp_path / "missing.sqlite").exists()
+
+
+class TestReadConnectionPool:
+    def test_connections_are_reused(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        make_recipe(tmp_path)
+        monkeypatch.chdir(tmp_path)
+        pool = ReadConnectionPool(max_idle=1)
+
+        with pool.connection("recipe") as first, pool.connection("recipe") as second:
+            # checked out at the same time, so never shared
+            assert first is not second
+            with pytest.raises(sqlite3.OperationalError):
+                first.execute("DELETE FROM trulens_records")
+        with pool.connection("recipe") as third:
+            assert third in (first, second)
+            assert third.execute("PRAGMA query_only").fetchone() == (1,)
+        pool.close()
+
+    def test_replaced_database_is_reopened(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        make_recipe(tmp_path, records=3)
+        monkeypatch.chdir(tmp_path)
+        pool = ReadConnectionPool()
+
+        with pool.connection("recipe") as conn:
+            count = conn.execute("SELECT COUNT(*) FROM trulens_records").fetchone()
+            assert count == (3,)
+
+        (tmp_path / "recipe.sqlite").rename(tmp_path / "old.sqlite")
+        make_recipe(tmp_path, records=5)
+
+        with pool.connection("recipe") as conn:
+            count = conn.execute("SELECT COUNT(*) FROM trulens_records").fetchone()
+            assert count == (5,)
+        pool.close()
+
+    def test_missing_database(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        monkeypatch.chdir(tmp_path)
+
+        with (
+            pytest.raises(sqlite3.OperationalError),
+            ReadConnectionPool().connection("missing"),
+        ):
+            pass
@@ -0,0 +1,482 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+import ragulate.datasets.registry as registry_module
+from ragulate.datasets import (
+    CragDataset,
+    DatasetCache,
+    DatasetRegistry,
+    GoldenSet,
+    LlamaDataset,
+    LocalDataset,
+    QueryItem,
+    SyntheticDataset,
+    TestDataset,
+    dataset_parameters,
+    decode_json_string,
+    detach_shared_files,
+    download_datasets,
+    find_dataset,
+    get_dataset,
+    get_shared_cache,
+    normalize_query,
+)
+
+
+class TestQueryItems:
+    def test_query_items_are_slotted(self) -> None:
+        item = QueryItem("Query", metadata={"kind": "simple"}, reference_answer="A")
+
+        assert not hasattr(item, "__dict__")
+        with pytest.raises(AttributeError):
+            item.other = "value"  # type: ignore[attr-defined]
+
+    def test_golden_set_is_derived_from_query_items(self) -> None:
+        dataset = TestDataset(dataset_name="test_dataset")
+
+        query_items = dataset.get_query_items()
+        golden_set = dataset.get_golden_set()
+
+        assert len(golden_set) == len(query_items)
+        for item, golden in zip(query_items, golden_set, strict=True):
+            assert golden["query"] is item.query
+            assert golden["response"] == item.reference_answer
+
+    def test_queries_are_interned(self) -> None:
+        first = QueryItem("".join(["Shared ", "query"]), metadata={})
+        second = QueryItem("".join(["Shared ", "query"]), metadata={})
+
+        assert first.query is second.query
+
+
+class TestGoldenSet:
+    def test_lookup_matches_stored_trulens_inputs(self) -> None:
+        golden_set = GoldenSet([("Quéry 1", "Response 1"), ("Query 2", "Response 2")])
+
+        assert golden_set.get("Quéry 1") == "Response 1"
+        assert golden_set.get(decode_json_string(json.dumps("Quéry 1"))) == (
+            "Response 1"
+        )
+        assert golden_set.get(
+            decode_json_string(json.dumps("Quéry 1", ensure_ascii=False))
+        ) == ("Response 1")
+        assert golden_set.get("Query 3") is None
+        assert len(golden_set) == 2  # noqa: PLR2004
+
+    def test_normalize_query(self) -> None:
+        decomposed = "Que\u0301ry"
+        assert normalize_query(json.loads(f'"{decomposed}"')) == "Quéry"
+        assert normalize_query(" Query 1 ") == "Query 1"
+        assert decode_json_string('"unterminated \\u00"') == "unterminated \\u00"
+
+    def test_quoted_queries_keep_their_quotes(self) -> None:
+        golden_set = GoldenSet([('"Quoted" query', "Response 1"), ('"Q"', "R 2")])
+
+        for query in ['"Quoted" query', '"Q"']:
+            stored = json.dumps(query)
+            assert normalize_query(decode_json_string(stored)) == query
+            assert golden_set.get(decode_json_string(stored)) is not None
+        assert golden_set.get("Q") is None
+
+    def test_dataset_index(self) -> None:
+        dataset = TestDataset(dataset_name="test_dataset")
+
+        golden_set = dataset.get_golden_set_index()
+
+        assert golden_set.get(decode_json_string('"Qu\\u00e9ry 1"')) == "Response 1"
+        assert dataset.get_golden_set_index() is golden_set
+
+
+class TestDatasetRegistry:
+    def make_dataset(self, root: Path, kind: str, name: str) -> None:
+        dataset_path = root / kind / name
+        dataset_path.mkdir(parents=True)
+        (dataset_path / "questions.jsonl").write_text('{"query": "q"}\n')
+
+    def test_rebuild_and_find(self, tmp_path: Path) -> None:
+        self.make_dataset(tmp_path, "crag", "task_1")
+        self.make_dataset(tmp_path, "llama", "blockchain_solana")
+
+        entries = DatasetRegistry(root_storage_path=str(tmp_path)).rebuild()
+
+        assert set(entries) == {"crag/task_1", "llama/blockchain_solana"}
+        assert entries["crag/task_1"].kind == "crag"
+        assert entries["crag/task_1"].size == len('{"query": "q"}\n')
+
+        dataset = find_dataset("task_1", root_storage_path=str(tmp_path))
+        assert isinstance(dataset, CragDataset)
+        dataset = find_dataset("BlockchainSolana", root_storage_path=str(tmp_path))
+        assert isinstance(dataset, LlamaDataset)
+
+    def test_register_updates_manifest(self, tmp_path: Path) -> None:
+        registry = DatasetRegistry(root_storage_path=str(tmp_path))
+        registry.rebuild()
+        assert registry.entries() == {}
+
+        self.make_dataset(tmp_path, "crag", "task_1")
+        CragDataset(dataset_name="task_1", root_storage_path=str(tmp_path)).register()
+
+        entry = registry.get("task_1")
+        assert entry is not None
+        assert entry.path == os.path.join(str(tmp_path), "crag", "task_1")
+
+        # copied by hand, so unknown until the registry is rebuilt
+        self.make_dataset(tmp_path, "crag", "task_2")
+        assert registry.get("task_2") is None
+        registry.rebuild()
+        assert registry.get("task_2") is not None
+
+    def test_find_without_manifest_does_not_read_files(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        self.make_dataset(tmp_path, "crag", "task_1")
+
+        def no_checksum(file_path: str) -> str:
+            raise AssertionError(f"{file_path} was read")
+
+        monkeypatch.setattr("ragulate.datasets.registry.checksum_file", no_checksum)
+        dataset = find_dataset("task_1", root_storage_path=str(tmp_path))
+
+        assert isinstance(dataset, CragDataset)
+        assert not DatasetRegistry(root_storage_path=str(tmp_path)).exists()
+
+    def test_scan_without_checksums_only_lists_directories(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        self.make_dataset(tmp_path, "crag", "task_1")
+
+        def no_listing(dataset_path: str) -> list[str]:
+            raise AssertionError(f"{dataset_path} was walked")
+
+        monkeypatch.setattr("ragulate.datasets.registry._list_files", no_listing)
+        entries = DatasetRegistry(root_storage_path=str(tmp_path)).scan()
+
+        assert entries["crag/task_1"].size is None
+
+    def test_names_are_kept_per_kind(self, tmp_path: Path) -> None:
+        self.make_dataset(tmp_path, "crag", "foo")
+        self.make_dataset(tmp_path, "crag", "foo_dataset")
+        self.make_dataset(tmp_path, "local", "bar")
+        self.make_dataset(tmp_path, "crag", "bar")
+
+        registry = DatasetRegistry(root_storage_path=str(tmp_path))
+        entries = registry.rebuild()
+
+        assert set(entries) == {"crag/foo", "crag/foo_dataset", "crag/bar", "local/bar"}
+        foo = registry.get("foo")
+        assert foo is not None and foo.path.endswith("foo")
+        with pytest.raises(ValueError, match="more than one kind: crag, local"):
+            find_dataset("bar", root_storage_path=str(tmp_path))
+
+    def test_find_opens_the_stored_directory(self, tmp_path: Path) -> None:
+        root = str(tmp_path / "datasets")
+        get_dataset(
+            "MyData", "synthetic", root_storage_path=root, num_queries=20
+        ).download_dataset()
+        (tmp_path / "logs.jsonl").write_text('{"query": "q", "answer": "a"}\n')
+        get_dataset(
+            "ProdLogs",
+            "local",
+            root_storage_path=root,
+            path=str(tmp_path / "logs.jsonl"),
+        ).download_dataset()
+
+        synthetic = find_dataset("MyData", root_storage_path=root)
+        assert isinstance(synthetic, SyntheticDataset)
+        assert synthetic.num_queries == 20
+        assert len(synthetic.get_source_file_paths()) > 0
+
+        local = find_dataset("ProdLogs", root_storage_path=root)
+        assert isinstance(local, LocalDataset)
+        assert [item.query for item in local.get_query_items()] == ["q"]
+
+    def test_register_only_hashes_changed_files(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        self.make_dataset(tmp_path, "crag", "task_1")
+        dataset = CragDataset(dataset_name="task_1", root_storage_path=str(tmp_path))
+        dataset.register()
+
+        hashed: list[str] = []
+        checksum_file = registry_module.checksum_file
+
+        def counting_checksum(file_path: str) -> str:
+            hashed.append(os.path.basename(file_path))
+            return checksum_file(file_path)
+
+        monkeypatch.setattr(
+            "ragulate.datasets.registry.checksum_file", counting_checksum
+        )
+        (tmp_path / "crag" / "task_1" / "new.jsonl").write_text("{}\n")
+        entry = DatasetRegistry(root_storage_path=str(tmp_path)).register(dataset)
+
+        assert hashed == ["new.jsonl"]
+        assert set(entry.files) == {"new.jsonl", "questions.jsonl"}
+        assert (
+            entry.checksum
+            == registry_module.describe_dataset_files(dataset.dataset_path())[1]
+        )
+
+
+class FailingDataset(TestDataset):
+    def download_dataset(self) -> None:
+        raise ValueError(f"Could not find {self.name} dataset.")
+
+
+class TestDownloadDatasets:
+    def test_failures_do_not_abort_other_downloads(self) -> None:
+        datasets = [
+            TestDataset(dataset_name="first"),
+            FailingDataset(dataset_name="missing"),
+            TestDataset(dataset_name="second"),
+        ]
+
+        failures = download_datasets(datasets=datasets, max_workers=2)
+
+        assert list(failures) == ["missing"]
+        assert isinstance(failures["missing"], ValueError)
+
+    def test_parameters_only_go_to_kinds_that_take_them(self) -> None:
+        assert dataset_parameters("llama") == []
+        assert "num_queries" in dataset_parameters("synthetic")
+
+        dataset = get_dataset("generated", "synthetic", num_queries=5)
+        assert isinstance(dataset, SyntheticDataset)
+        with pytest.raises(ValueError, match="llama datasets don't take"):
+            get_dataset("PaulGrahamEssayDataset", "llama", a=1)
+
+
+class TestDatasetCache:
+    def test_store_and_fetch_directory(self, tmp_path: Path) -> None:
+        cache = DatasetCache(root=str(tmp_path / "cache"))
+        source = "https://example.com/llama_datasets/Example"
+
+        first = tmp_path / "project_1" / "datasets" / "llama" / "example"
+        (first / "source_files").mkdir(parents=True)
+        (first / "rag_dataset.json").write_text('{"examples": []}')
+        (first / "source_files" / "doc.txt").write_text("document")
+
+        second = tmp_path / "project_2" / "datasets" / "llama" / "example"
+        assert not cache.fetch(source, str(second))
+
+        cache.store(source, str(first))
+
+        assert cache.fetch(source, str(second))
+        assert (second / "source_files" / "doc.txt").read_text() == "document"
+        # both projects link to the stored copy
+        assert (second / "rag_dataset.json").stat().st_nlink == 3  # noqa: PLR2004
+        assert os.path.samefile(first / "rag_dataset.json", second / "rag_dataset.json")
+
+    def test_store_and_fetch_file(self, tmp_path: Path) -> None:
+        cache = DatasetCache(root=str(tmp_path / "cache"))
+        source = "https://example.com/questions.jsonl.bz2"
+        first = tmp_path / "first.jsonl"
+        first.write_text("{}\n")
+
+        cache.store(source, str(first))
+
+        second = tmp_path / "nested" / "second.jsonl"
+        assert cache.fetch(source, str(second))
+        assert second.read_text() == "{}\n"
+
+    def test_downloads_detach_stored_files(self, tmp_path: Path) -> None:
+        cache = DatasetCache(root=str(tmp_path / "cache"))
+        source = "https://example.com/questions.jsonl.bz2"
+        first = tmp_path / "first.jsonl"
+        first.write_text("{}\n")
+
+        cache.store(source, str(first))
+        assert first.stat().st_nlink == 2  # noqa: PLR2004
+
+        # a later download of the first project writes a new file
+        detach_shared_files(str(first), cache=cache)
+        assert not first.exists()
+        first.write_text("changed\n")
+
+        second = tmp_path / "second.jsonl"
+        assert cache.fetch(source, str(second))
+        assert second.read_text() == "{}\n"
+        detach_shared_files(str(second), cache=cache)
+        assert not second.exists()
+
+    def test_own_hardlinks_are_not_detached(self, tmp_path: Path) -> None:
+        cache = DatasetCache(root=str(tmp_path / "cache"))
+        dataset = tmp_path / "dataset"
+        dataset.mkdir()
+        (dataset / "questions.jsonl").write_text("{}\n")
+        os.link(dataset / "questions.jsonl", dataset / "copy.jsonl")
+
+        detach_shared_files(str(dataset), cache=cache)
+
+        assert {p.name for p in dataset.iterdir()} == {"questions.jsonl", "copy.jsonl"}
+
+    def test_concurrent_stores_keep_all_sources(self, tmp_path: Path) -> None:
+        cache = DatasetCache(root=str(tmp_path / "cache"))
+        sources = {
+            f"https://example.com/{i}.jsonl": tmp_path / f"{i}.jsonl" for i in range(16)
+        }
+        for i, file_path in enumerate(sources.values()):
+            file_path.write_text(f"{i}\n")
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(
+                executor.map(
+                    lambda item: cache.store(item[0], str(item[1])), sources.items()
+                )
+            )
+
+        for i, source in enumerate(sources):
+            target = tmp_path / "fetched" / f"{i}.jsonl"
+            assert cache.fetch(source, str(target))
+            assert target.read_text() == f"{i}\n"
+
+    def test_shared_cache_setting(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        monkeypatch.delenv("RAGULATE_SHARED_CACHE", raising=False)
+        assert get_shared_cache() is None
+
+        monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+        monkeypatch.setenv("RAGULATE_SHARED_CACHE", "1")
+        cache = get_shared_cache()
+        assert cache is not None
+        assert cache.root == str(tmp_path / "ragulate")
+
+        monkeypatch.setenv("RAGULATE_SHARED_CACHE", str(tmp_path / "elsewhere"))
+        cache = get_shared_cache()
+        assert cache is not None
+        assert cache.root == str(tmp_path / "elsewhere")
+
+
+class TestSyntheticDataset:
+    def test_generation_is_deterministic(self, tmp_path: Path) -> None:
+        def generate(seed: int) -> SyntheticDataset:
+            dataset = get_dataset(
+                "scale",
+                "synthetic",
+                root_storage_path=str(tmp_path),
+                num_queries=500,
+                num_documents=7,
+                metadata_cardinality=3,
+                seed=seed,
+            )
+            assert isinstance(dataset, SyntheticDataset)
+            return dataset
+
+        first = generate(seed=42).get_query_items()
+        second = generate(seed=42).get_query_items()
+        other = generate(seed=7).get_query_items()
+
+        assert len(first) == 500  # noqa: PLR2004
+        assert [q.query for q in first] == [q.query for q in second]
+        assert [q.query for q in first] != [q.query for q in other]
+        assert {q.metadata["group"] for q in first} == {"group_0", "group_1", "group_2"}
+        assert len({q.query for q in first}) == len(first)
+
+    def test_documents_contain_answers(self, tmp_path: Path) -> None:
+        dataset = SyntheticDataset(
+            "scale",
+            root_storage_path=str(tmp_path),
+            num_queries=50,
+            num_documents=4,
+            document_size=1000,
+        )
+        dataset.download_dataset()
+
+        source_files = dataset.get_source_file_paths()
+        assert len(source_files) == 4  # noqa: PLR2004
+        documents = [Path(f).read_text() for f in source_files]
+        assert all(len(d) >= 1000 for d in documents)  # noqa: PLR2004
+
+        for item in dataset.get_query_items():
+            document = documents[item.metadata["document"]]
+            assert item.reference_answer is not None
+            assert item.reference_answer in document
+
+        # parameters are kept with the dataset, so it can be found again by name
+        found = find_dataset("scale", root_storage_path=str(tmp_path))
+        assert isinstance(found, SyntheticDataset)
+        assert found.params() == dataset.params()
+
+
+class TestLocalDataset:
+    rows = [
+        {"query": f"Query {i}", "answer": f"Answer {i}", "team": f"t{i % 3}", "x": i}
+        for i in range(40)
+    ]
+
+    def import_dataset(self, tmp_path: Path, file_name: str) -> LocalDataset:
+        dataset = get_dataset(
+            "logs",
+            "local",
+            root_storage_path=str(tmp_path / "datasets"),
+            path=str(tmp_path / file_name),
+            metadata_columns="team",
+        )
+        assert isinstance(dataset, LocalDataset)
+        dataset.download_dataset()
+        # find it again, with the parameters it was imported with
+        found = find_dataset("logs", root_storage_path=str(tmp_path / "datasets"))
+        assert isinstance(found, LocalDataset)
+        return found
+
+    def write_jsonl(self, tmp_path: Path) -> None:
+        lines = [json.dumps(row) for row in self.rows]
+        (tmp_path / "logs.jsonl").write_text("\n".join(lines) + "\n")
+
+    def test_jsonl(self, tmp_path: Path) -> None:
+        self.write_jsonl(tmp_path)
+        dataset = self.import_dataset(tmp_path, "logs.jsonl")
+
+        query_items = dataset.get_query_items()
+        assert len(query_items) == len(self.rows)
+        assert query_items[4].query == "Query 4"
+        assert query_items[4].reference_answer == "Answer 4"
+        # only the projected metadata columns are kept
+        assert query_items[4].metadata == {"team": "t1"}
+
+    def test_csv(self, tmp_path: Path) -> None:
+        lines = [
+            "query,answer,team,x",
+            "",
+            '"Query, with comma","Multi\nline",t0,1',
+            "",
+        ]
+        (tmp_path / "logs.csv").write_text("\n".join(lines) + "\n")
+        dataset = self.import_dataset(tmp_path, "logs.csv")
+
+        assert dataset._count_rows() == 1
+        [query_item] = dataset.get_query_items()
+        assert query_item.query == "Query, with comma"
+        assert query_item.reference_answer == "Multi\nline"
+        assert query_item.metadata == {"team": "t0"}
+
+    def test_parquet(self, tmp_path: Path) -> None:
+        pa = pytest.importorskip("pyarrow")
+        pq = pytest.importorskip("pyarrow.parquet")
+        pq.write_table(
+            pa.Table.from_pylist(self.rows), tmp_path / "logs.parquet", row_group_size=8
+        )
+        dataset = self.import_dataset(tmp_path, "logs.parquet")
+
+        assert dataset._count_rows() == len(self.rows)
+        query_items = dataset.get_query_items()
+        assert [q.query for q in query_items] == [r["query"] for r in self.rows]
+        assert query_items[0].metadata == {"team": "t0"}
+
+    def test_streaming_sample_matches_full_sample(self, tmp_path: Path) -> None:
+        self.write_jsonl(tmp_path)
+        streamed = self.import_dataset(tmp_path, "logs.jsonl")
+        loaded = self.import_dataset(tmp_path, "logs.jsonl")
+        loaded.get_query_items()
+
+        sample = streamed.sample_query_items(sample_percent=0.25, random_seed=3)
+
+        assert len(streamed._query_items) == 0
+        assert len(sample) == 10  # noqa: PLR2004
+        expected = loaded.sample_query_items(sample_percent=0.25, random_seed=3)
+        assert [q.query for q in sample] == [q.query for q in expected]
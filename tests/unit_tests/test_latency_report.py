@@ -0,0 +1,126 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ragulate.analysis import Analysis
+from ragulate.data import get_chart_data
+from ragulate.latency_report import latency_quality_tradeoffs, latency_report
+
+from .test_data import make_recipe
+
+
+def make_latency_data(records: int = 400) -> pd.DataFrame:
+    rng = np.random.default_rng(seed=11)
+    latency = rng.gamma(2.0, 2.0, size=records)
+    return pd.DataFrame(
+        {
+            "recipe": np.repeat(["fast", "slow"], records // 2),
+            "dataset": "blockchain",
+            "latency": np.concatenate(
+                [latency[: records // 2], latency[records // 2 :] * 3]
+            ),
+            "start_time": np.arange(records, dtype=float),
+            "total_tokens": 200.0,
+            "completion_tokens": 50.0,
+            "answer_correctness": np.repeat([0.5, 0.8], records // 2),
+            "groundedness": np.repeat([0.9, 0.7], records // 2),
+        }
+    )
+
+
+class TestLatencyReport:
+    def test_percentiles_match_each_group(self) -> None:
+        df = make_latency_data()
+
+        report = latency_report(df).set_index("recipe")
+
+        for recipe, group in df.groupby("recipe"):
+            row = report.loc[recipe]
+            latency = group["latency"]
+            assert row["queries"] == len(group)
+            assert row["latency_p50"] == pytest.approx(latency.median())
+            assert row["latency_p95"] == pytest.approx(latency.quantile(0.95))
+            assert row["latency_p99"] == pytest.approx(latency.quantile(0.99))
+            assert row["latency_max"] == pytest.approx(latency.max())
+            assert row["tokens_per_second"] == pytest.approx(
+                200 * len(group) / latency.sum()
+            )
+            assert row["completion_tokens_per_second"] == pytest.approx(
+                50 * len(group) / latency.sum()
+            )
+
+    def test_throughput_of_a_recipe(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        # 3 records starting together, the last one ending after 3.5 seconds
+        make_recipe(tmp_path)
+        monkeypatch.chdir(tmp_path)
+        df, _ = get_chart_data(
+            recipes=["recipe"], dataset="dataset", metadata_filter={}
+        )
+
+        row = latency_report(df).iloc[0]
+
+        assert row["queries"] == 3  # noqa: PLR2004
+        assert row["latency_max"] == pytest.approx(3.5)
+        assert row["queries_per_second"] == pytest.approx(3 / 3.5)
+        assert row["tokens_per_second"] == pytest.approx(303 / 7.5)
+        assert np.isnan(row["completion_tokens_per_second"])
+
+    def test_empty(self) -> None:
+        assert len(latency_report(pd.DataFrame())) == 0
+        assert len(latency_quality_tradeoffs(pd.DataFrame(), ["groundedness"])) == 0
+
+
+class TestLatencyQualityTradeoffs:
+    def test_pareto_optimal_recipes(self) -> None:
+        df = make_latency_data()
+        df = pd.concat(
+            [
+                df,
+                # slower and worse than "fast" on everything
+                df[df["recipe"] == "fast"].assign(
+                    recipe="worst",
+                    latency=lambda d: d["latency"] * 4,
+                    answer_correctness=0.4,
+                    groundedness=0.6,
+                ),
+            ],
+            ignore_index=True,
+        )
+
+        tradeoffs = latency_quality_tradeoffs(
+            df, ["answer_correctness", "groundedness"]
+        )
+
+        optimal = tradeoffs[tradeoffs["pareto_optimal"]]
+        assert sorted(zip(optimal["metric"], optimal["recipe"])) == [
+            ("answer_correctness", "fast"),
+            ("answer_correctness", "slow"),
+            ("groundedness", "fast"),
+        ]
+
+    def test_output_latency_report(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        monkeypatch.chdir(tmp_path)
+        df = make_latency_data()
+
+        Analysis().output_latency_report(
+            charts={"blockchain": (df, ["answer_correctness", "groundedness"])}
+        )
+
+        assert {p.name for p in tmp_path.iterdir()} == {
+            "blockchain_latency_report.csv",
+            "blockchain_stage_latency.csv",
+            "blockchain_latency_quality.csv",
+            "latency_report.json",
+        }
+        report = pd.read_csv(tmp_path / "blockchain_latency_report.csv")
+        assert list(report["recipe"]) == ["fast", "slow"]
+        # without stage timings, each stage of each recipe is empty
+        stages = pd.read_csv(tmp_path / "blockchain_stage_latency.csv")
+        assert len(stages) == 2 * 4  # noqa: PLR2004
+        assert (stages["queries"] == 0).all()
@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from ragulate.significance import (
+    bootstrap_means,
+    confidence_intervals,
+    paired_tests,
+)
+
+
+def make_paired_data(queries: int = 300, shift: float = 0.0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed=3)
+    base = rng.random(queries)
+    return pd.DataFrame(
+        {
+            "query": [f"query_{i}" for i in range(queries)],
+            "answer_correctness_first": base + shift,
+            "answer_correctness_second": base + rng.normal(0, 0.05, size=queries),
+        }
+    )
+
+
+class TestConfidenceIntervals:
+    def test_interval_covers_the_mean(self) -> None:
+        rng = np.random.default_rng(seed=5)
+        df = pd.DataFrame(
+            {
+                "recipe": np.repeat(["first", "second"], 250),
+                "dataset": "blockchain",
+                "answer_correctness": rng.random(500),
+            }
+        )
+        df.loc[df.index[:10], "answer_correctness"] = np.nan
+
+        intervals = confidence_intervals(
+            df, ["answer_correctness", "latency_missing"], resamples=2000
+        )
+
+        scores = intervals[intervals["metric"] == "answer_correctness"]
+        assert list(scores["count"]) == [240, 250]
+        for _, row in scores.iterrows():
+            assert row["ci_low"] < row["mean"] < row["ci_high"]
+            # the standard error of the mean of uniform values is ~0.018 here
+            assert row["ci_high"] - row["ci_low"] == pytest.approx(0.07, abs=0.02)
+
+    def test_missing_metric_is_empty(self) -> None:
+        df = pd.DataFrame(
+            {"recipe": ["first"], "dataset": ["uber"], "latency": [np.nan]}
+        )
+
+        intervals = confidence_intervals(df, ["latency"], resamples=100)
+
+        assert intervals["count"].tolist() == [0]
+        assert intervals[["mean", "ci_low", "ci_high"]].isna().all().all()
+
+    def test_chunked_resamples(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        values = np.arange(10, dtype=float)
+        expected = bootstrap_means(values, 50, np.random.default_rng(seed=1))
+
+        monkeypatch.setattr("ragulate.significance.MAX_CHUNK_ELEMENTS", 30)
+        chunked = bootstrap_means(values, 50, np.random.default_rng(seed=1))
+
+        assert len(chunked) == len(expected) == 50
+        assert chunked.min() >= 0 and chunked.max() <= 9
+
+
+class TestPairedTests:
+    def test_clear_difference_is_significant(self) -> None:
+        df = make_paired_data(shift=0.05)
+
+        tests = paired_tests(
+            df, ["first", "second"], ["answer_correctness"], resamples=2000
+        )
+
+        row = tests.iloc[0]
+        assert (row["recipe"], row["other_recipe"]) == ("first", "second")
+        assert row["count"] == 300
+        assert row["mean_difference"] == pytest.approx(0.05, abs=0.01)
+        assert row["ci_low"] > 0
+        assert row["p_value"] < 0.01
+
+    def test_no_difference_is_not_significant(self) -> None:
+        df = make_paired_data()
+        df["answer_correctness_second"] = df["answer_correctness_first"]
+
+        tests = paired_tests(
+            df, ["first", "second"], ["answer_correctness"], resamples=500
+        )
+
+        assert tests.iloc[0]["mean_difference"] == 0
+        assert tests.iloc[0]["p_value"] == pytest.approx(1.0)
+
+    def test_missing_columns_are_empty(self) -> None:
+        df = make_paired_data()
+
+        tests = paired_tests(
+            df, ["first", "second", "third"], ["answer_correctness"], resamples=100
+        )
+
+        assert len(tests) == 3
+        missing = tests[tests["other_recipe"] == "third"]
+        assert missing["count"].tolist() == [0, 0]
+        assert missing["p_value"].isna().all()
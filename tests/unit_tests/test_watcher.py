@@ -0,0 +1,63 @@
+import sqlite3
+import time
+from pathlib import Path
+from typing import Callable
+
+from ragulate.ui.watcher import RecipeWatcher, recipe_for_path
+
+
+def wait_for(condition: Callable[[], bool], timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+class TestRecipeWatcher:
+    def test_recipe_for_path(self) -> None:
+        assert recipe_for_path("/runs/chunk_size_500.sqlite") == "chunk_size_500"
+        assert recipe_for_path("chunk_size_500.sqlite-wal") == "chunk_size_500"
+        assert recipe_for_path("chunk_size_500.sqlite-shm") is None
+        assert recipe_for_path("notes.txt") is None
+        assert recipe_for_path(".sqlite") is None
+
+    def test_changes_are_debounced(self) -> None:
+        watcher = RecipeWatcher(debounce_seconds=0.2)
+        for _ in range(100):
+            watcher.touch("recipe_a")
+
+        assert watcher.version("recipe_a") == 0
+        assert wait_for(lambda: watcher.version("recipe_a") == 1)
+        time.sleep(0.3)
+        assert watcher.versions(["recipe_a", "recipe_b"]) == (1, 0)
+        assert watcher.catalog_version() == 0
+
+    def test_only_written_recipes_change(self, tmp_path: Path) -> None:
+        for recipe in ["recipe_a", "recipe_b"]:
+            conn = sqlite3.connect(tmp_path / f"{recipe}.sqlite")
+            conn.execute("CREATE TABLE t (x)")
+            conn.close()
+
+        watcher = RecipeWatcher(path=str(tmp_path), debounce_seconds=0.05)
+        watcher.start()
+        try:
+            # reading a database isn't a change
+            conn = sqlite3.connect(tmp_path / "recipe_b.sqlite")
+            conn.execute("SELECT * FROM t").fetchall()
+            conn.close()
+
+            conn = sqlite3.connect(tmp_path / "recipe_a.sqlite")
+            with conn:
+                conn.execute("INSERT INTO t VALUES (1)")
+            conn.close()
+
+            assert wait_for(lambda: watcher.version("recipe_a") > 0)
+            time.sleep(0.2)
+            assert watcher.version("recipe_b") == 0
+
+            (tmp_path / "recipe_c.sqlite").touch()
+            assert wait_for(lambda: watcher.catalog_version() > 0)
+        finally:
+            watcher.stop()